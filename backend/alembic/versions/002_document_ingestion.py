@@ -0,0 +1,60 @@
+"""document ingestion
+
+Revision ID: 002
+Revises:
+Create Date: 2026-10-18 00:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '002'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('document_files') as batch_op:
+        batch_op.add_column(sa.Column('processing_status', sa.String(), nullable=True, server_default='pending'))
+        batch_op.add_column(sa.Column('processing_progress', sa.Integer(), nullable=True, server_default='0'))
+        batch_op.add_column(sa.Column('processing_error', sa.Text(), nullable=True))
+
+    op.create_table(
+        'document_chunks',
+        sa.Column('id', sa.String(), primary_key=True),
+        sa.Column('document_id', sa.String(), sa.ForeignKey('document_files.id'), nullable=False),
+        sa.Column('chunk_index', sa.Integer(), nullable=False),
+        sa.Column('content', sa.Text(), nullable=False),
+        sa.Column('embedding', sa.LargeBinary(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+    )
+    op.create_index('ix_document_chunks_document_id', 'document_chunks', ['document_id'])
+
+    op.create_table(
+        'ingestion_jobs',
+        sa.Column('id', sa.String(), primary_key=True),
+        sa.Column('document_id', sa.String(), sa.ForeignKey('document_files.id'), nullable=False),
+        sa.Column('status', sa.String(), nullable=True),
+        sa.Column('attempts', sa.Integer(), nullable=True),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('locked_at', sa.DateTime(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+    )
+    op.create_index('ix_ingestion_jobs_document_id', 'ingestion_jobs', ['document_id'])
+    op.create_index('ix_ingestion_jobs_status', 'ingestion_jobs', ['status'])
+
+
+def downgrade():
+    op.drop_index('ix_ingestion_jobs_status', table_name='ingestion_jobs')
+    op.drop_index('ix_ingestion_jobs_document_id', table_name='ingestion_jobs')
+    op.drop_table('ingestion_jobs')
+    op.drop_index('ix_document_chunks_document_id', table_name='document_chunks')
+    op.drop_table('document_chunks')
+    with op.batch_alter_table('document_files') as batch_op:
+        batch_op.drop_column('processing_error')
+        batch_op.drop_column('processing_progress')
+        batch_op.drop_column('processing_status')
@@ -0,0 +1,28 @@
+"""document content sha256
+
+Revision ID: 003
+Revises: 002
+Create Date: 2026-10-18 00:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '003'
+down_revision = '002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('document_files') as batch_op:
+        batch_op.add_column(sa.Column('content_sha256', sa.String(length=64), nullable=True))
+        batch_op.create_index('ix_document_files_content_sha256', ['content_sha256'])
+
+
+def downgrade():
+    with op.batch_alter_table('document_files') as batch_op:
+        batch_op.drop_index('ix_document_files_content_sha256')
+        batch_op.drop_column('content_sha256')
@@ -0,0 +1,31 @@
+"""document list indexes
+
+Revision ID: 005
+Revises: 004
+Create Date: 2026-10-18 00:00:00
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '005'
+down_revision = '004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        'ix_document_files_client_created', 'document_files', ['client_id', 'created_at', 'id']
+    )
+    op.create_index(
+        'ix_document_files_client_project_created',
+        'document_files',
+        ['client_id', 'project_id', 'created_at', 'id'],
+    )
+
+
+def downgrade():
+    op.drop_index('ix_document_files_client_project_created', table_name='document_files')
+    op.drop_index('ix_document_files_client_created', table_name='document_files')
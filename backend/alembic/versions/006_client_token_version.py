@@ -0,0 +1,26 @@
+"""client token version
+
+Revision ID: 006
+Revises: 005
+Create Date: 2026-10-18 00:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '006'
+down_revision = '005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('clients') as batch_op:
+        batch_op.add_column(sa.Column('token_version', sa.Integer(), nullable=True, server_default='0'))
+
+
+def downgrade():
+    with op.batch_alter_table('clients') as batch_op:
+        batch_op.drop_column('token_version')
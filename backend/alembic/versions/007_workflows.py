@@ -0,0 +1,46 @@
+"""workflows
+
+Revision ID: 007
+Revises: 006
+Create Date: 2026-10-18 00:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '007'
+down_revision = '006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'workflows',
+        sa.Column('id', sa.String(), primary_key=True),
+        sa.Column('idempotency_key', sa.String(), nullable=True, unique=True),
+        sa.Column('request_hash', sa.String(64), nullable=True),
+        sa.Column('analysis_type', sa.String(), nullable=True),
+        sa.Column('params', sa.JSON(), nullable=True),
+        sa.Column('status', sa.String(), nullable=True),
+        sa.Column('progress', sa.Integer(), nullable=True),
+        sa.Column('current_step', sa.String(), nullable=True),
+        sa.Column('attempts', sa.Integer(), nullable=True),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('result', sa.JSON(), nullable=True),
+        sa.Column('cancel_requested', sa.Boolean(), nullable=True),
+        sa.Column('available_at', sa.DateTime(), nullable=True),
+        sa.Column('locked_at', sa.DateTime(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('started_at', sa.DateTime(), nullable=True),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+    )
+    op.create_index('ix_workflows_status', 'workflows', ['status'])
+
+
+def downgrade():
+    op.drop_index('ix_workflows_status', table_name='workflows')
+    op.drop_table('workflows')
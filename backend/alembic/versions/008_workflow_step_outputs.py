@@ -0,0 +1,33 @@
+"""workflow step outputs
+
+Revision ID: 008
+Revises: 007
+Create Date: 2026-10-18 00:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '008'
+down_revision = '007'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'workflow_step_outputs',
+        sa.Column('key', sa.String(64), primary_key=True),
+        sa.Column('step', sa.String(), nullable=False),
+        sa.Column('workflow_id', sa.String(), nullable=True),
+        sa.Column('output', sa.JSON(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+    )
+    op.create_index('ix_workflow_step_outputs_created_at', 'workflow_step_outputs', ['created_at'])
+
+
+def downgrade():
+    op.drop_index('ix_workflow_step_outputs_created_at', table_name='workflow_step_outputs')
+    op.drop_table('workflow_step_outputs')
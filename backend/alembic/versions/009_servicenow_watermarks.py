@@ -0,0 +1,36 @@
+"""servicenow watermarks
+
+Revision ID: 009
+Revises: 008
+Create Date: 2026-10-18 00:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '009'
+down_revision = '008'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'servicenow_watermarks',
+        sa.Column('id', sa.String(), primary_key=True),
+        sa.Column('instance', sa.String(), nullable=False),
+        sa.Column('table_name', sa.String(), nullable=False),
+        sa.Column('watermark', sa.String(19), nullable=False),
+        sa.Column('rows', sa.Integer(), nullable=True),
+        sa.Column('synced_at', sa.DateTime(), nullable=True),
+    )
+    op.create_index(
+        'ix_servicenow_watermarks_instance_table', 'servicenow_watermarks', ['instance', 'table_name'], unique=True
+    )
+
+
+def downgrade():
+    op.drop_index('ix_servicenow_watermarks_instance_table', table_name='servicenow_watermarks')
+    op.drop_table('servicenow_watermarks')
@@ -0,0 +1,29 @@
+"""script analyses
+
+Revision ID: 010
+Revises: 009
+Create Date: 2026-10-18 00:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '010'
+down_revision = '009'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'script_analyses',
+        sa.Column('key', sa.String(64), primary_key=True),
+        sa.Column('issues', sa.JSON(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+    )
+
+
+def downgrade():
+    op.drop_table('script_analyses')
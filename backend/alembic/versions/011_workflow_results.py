@@ -0,0 +1,32 @@
+"""workflow results
+
+Revision ID: 011
+Revises: 010
+Create Date: 2026-10-18 00:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '011'
+down_revision = '010'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'workflow_results',
+        sa.Column('workflow_id', sa.String(), sa.ForeignKey('workflows.id'), primary_key=True),
+        sa.Column('etag', sa.String(34), nullable=False),
+        sa.Column('body', sa.LargeBinary(), nullable=False),
+        sa.Column('gzip', sa.LargeBinary(), nullable=False),
+        sa.Column('br', sa.LargeBinary(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+    )
+
+
+def downgrade():
+    op.drop_table('workflow_results')
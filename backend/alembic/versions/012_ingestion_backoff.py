@@ -0,0 +1,27 @@
+"""ingestion backoff
+
+Revision ID: 012
+Revises: 011
+Create Date: 2026-10-18 00:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '012'
+down_revision = '011'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('ingestion_jobs') as batch_op:
+        batch_op.add_column(sa.Column('available_at', sa.DateTime(), nullable=True))
+    op.execute("UPDATE ingestion_jobs SET available_at = created_at")
+
+
+def downgrade():
+    with op.batch_alter_table('ingestion_jobs') as batch_op:
+        batch_op.drop_column('available_at')
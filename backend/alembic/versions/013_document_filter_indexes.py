@@ -0,0 +1,33 @@
+"""document filter indexes
+
+Revision ID: 013
+Revises: 012
+Create Date: 2026-10-18 00:00:00
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '013'
+down_revision = '012'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        'ix_document_files_client_processed_created',
+        'document_files',
+        ['client_id', 'processed', 'created_at', 'id'],
+    )
+    op.create_index(
+        'ix_document_files_client_type_created',
+        'document_files',
+        ['client_id', 'file_type', 'created_at', 'id'],
+    )
+
+
+def downgrade():
+    op.drop_index('ix_document_files_client_type_created', table_name='document_files')
+    op.drop_index('ix_document_files_client_processed_created', table_name='document_files')
@@ -1,8 +1,9 @@
-from . import ai, auth, documents, projects, workflows
+from . import ai, auth, chat, documents, projects, workflows
 
 __all__ = [
     "ai",
     "auth",
+    "chat",
     "documents",
     "projects",
     "workflows",
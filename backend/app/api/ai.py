@@ -1,10 +1,18 @@
+import json
+import os
+from typing import List, Optional
+
 from fastapi import APIRouter, Depends
-from pydantic import BaseModel
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
 
 from ..services.ai_gateway import AIGateway, get_ai_gateway
 
 router = APIRouter(prefix="/api", tags=["ai"])
 
+BATCH_MAX_ITEMS = int(os.getenv("AI_BATCH_MAX_ITEMS", "500"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("AI_BATCH_MAX_CONCURRENCY", "8"))
+
 
 class ConfigRequest(BaseModel):
     requirements: str
@@ -15,11 +23,81 @@ class ConfigResponse(BaseModel):
     config: str
 
 
+class BatchConfigRequest(BaseModel):
+    items: List[ConfigRequest] = Field(..., min_length=1, max_length=BATCH_MAX_ITEMS)
+    concurrency: int = Field(BATCH_MAX_CONCURRENCY, ge=1, le=BATCH_MAX_CONCURRENCY)
+
+
+class BatchConfigResult(BaseModel):
+    index: int
+    config: Optional[str] = None
+    error: Optional[str] = None
+
+
+class BatchConfigResponse(BaseModel):
+    results: List[BatchConfigResult]
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
 @router.post("/generate_config", response_model=ConfigResponse)
 async def generate_config(
     request: ConfigRequest,
     gateway: AIGateway = Depends(get_ai_gateway),
 ):
     """Generate ServiceNow configuration code from natural language requirements."""
-    result = gateway.generate_config(request.requirements, request.complexity)
+    result = await gateway.generate_config(request.requirements, request.complexity)
     return {"config": result}
+
+
+@router.post("/generate_config/batch", response_model=BatchConfigResponse)
+async def generate_config_batch(
+    request: BatchConfigRequest,
+    gateway: AIGateway = Depends(get_ai_gateway),
+):
+    """Generate configs for many requirements with bounded concurrency.
+
+    Each item gets its own result; a failed item carries an ``error`` instead
+    of failing the whole batch.
+    """
+    outcomes = await gateway.generate_batch(
+        [(item.requirements, item.complexity) for item in request.items],
+        concurrency=request.concurrency,
+    )
+    return {
+        "results": [
+            {"index": i, "config": config, "error": error}
+            for i, (config, error) in enumerate(outcomes)
+        ]
+    }
+
+
+@router.post("/generate_config/stream")
+async def stream_config(
+    request: ConfigRequest,
+    gateway: AIGateway = Depends(get_ai_gateway),
+):
+    """Stream generated configuration as Server-Sent Events.
+
+    Emits ``token`` events as text arrives and a final ``done`` event with the
+    full config (``cached`` is true when it was served from the cache). Errors
+    after the stream has started are reported as an ``error`` event.
+    """
+
+    async def events():
+        try:
+            async for event, text in gateway.stream_config(request.requirements, request.complexity):
+                if event == "token":
+                    yield _sse("token", {"text": text})
+                else:
+                    yield _sse("done", {"config": text, "cached": event == "cached"})
+        except RuntimeError as exc:
+            yield _sse("error", {"detail": str(exc)})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
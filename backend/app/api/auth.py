@@ -1,10 +1,13 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel, EmailStr
 import uuid
 
-from ..auth import AuthService, get_current_user
+from ..auth import AuthService, get_current_user, password_hasher, principal_cache
 from ..models.database import Client, get_db
+from ..services.password_hasher import HasherBusy
+from ..services.principal_cache import Principal
 
 router = APIRouter(prefix="/api/auth", tags=["authentication"])
 
@@ -23,20 +26,32 @@ class Token(BaseModel):
     token_type: str
     user: dict
 
+def _busy(exc: HasherBusy) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail=str(exc),
+        headers={"Retry-After": "1"},
+    )
+
 @router.post("/register", response_model=Token)
-async def register(user_data: UserCreate, db: Session = Depends(get_db)):
+async def register(user_data: UserCreate, db: AsyncSession = Depends(get_db)):
     """Register a new user"""
     
     # Check if user already exists
-    existing_user = db.query(Client).filter(Client.email == user_data.email).first()
+    existing_user = await db.scalar(select(Client.id).where(Client.email == user_data.email))
     if existing_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email already registered"
         )
+    # Hand the connection back to the pool while the hash runs
+    await db.commit()
     
     # Create new user
-    hashed_password = AuthService.hash_password(user_data.password)
+    try:
+        hashed_password = await password_hasher.hash(user_data.password)
+    except HasherBusy as exc:
+        raise _busy(exc)
     new_user = Client(
         id=str(uuid.uuid4()),
         email=user_data.email,
@@ -46,11 +61,12 @@ async def register(user_data: UserCreate, db: Session = Depends(get_db)):
     )
     
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
     
     # Create access token
-    access_token = AuthService.create_access_token(data={"sub": new_user.id})
+    access_token = AuthService.create_access_token(
+        data={"sub": new_user.id, "ver": new_user.token_version or 0}
+    )
     
     return {
         "access_token": access_token,
@@ -65,17 +81,30 @@ async def register(user_data: UserCreate, db: Session = Depends(get_db)):
     }
 
 @router.post("/login", response_model=Token)
-async def login(user_data: UserLogin, db: Session = Depends(get_db)):
+async def login(user_data: UserLogin, db: AsyncSession = Depends(get_db)):
     """Login user"""
     
     # Find user
-    user = db.query(Client).filter(Client.email == user_data.email).first()
-    if not user or not AuthService.verify_password(user_data.password, user.hashed_password):
+    user = await db.scalar(select(Client).where(Client.email == user_data.email))
+    valid = False
+    if user:
+        # Hand the connection back to the pool while the hash runs
+        await db.commit()
+        try:
+            valid, new_hash = await password_hasher.verify(user_data.password, user.hashed_password)
+        except HasherBusy as exc:
+            raise _busy(exc)
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid email or password"
         )
     
+    if new_hash:
+        # Stored hash predates the current bcrypt cost; upgrade it now that we know the password.
+        user.hashed_password = new_hash
+        await db.commit()
+    
     if not user.is_active:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -83,7 +112,7 @@ async def login(user_data: UserLogin, db: Session = Depends(get_db)):
         )
     
     # Create access token
-    access_token = AuthService.create_access_token(data={"sub": user.id})
+    access_token = AuthService.create_access_token(data={"sub": user.id, "ver": user.token_version or 0})
     
     return {
         "access_token": access_token,
@@ -98,7 +127,7 @@ async def login(user_data: UserLogin, db: Session = Depends(get_db)):
     }
 
 @router.get("/me")
-async def get_current_user_info(current_user: Client = Depends(get_current_user)):
+async def get_current_user_info(current_user: Principal = Depends(get_current_user)):
     """Get current user information"""
     return {
         "id": current_user.id,
@@ -107,4 +136,12 @@ async def get_current_user_info(current_user: Client = Depends(get_current_user)
         "company": current_user.company,
         "tier": current_user.tier,
         "created_at": current_user.created_at
+    }
+
+@router.get("/stats")
+async def auth_stats(current_user: Principal = Depends(get_current_user)):
+    """Principal cache and password hasher counters for this process"""
+    return {
+        "principal_cache": principal_cache.stats(),
+        "password_hasher": password_hasher.stats(),
     }
\ No newline at end of file
@@ -0,0 +1,225 @@
+import json
+import os
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..auth import get_current_user
+from ..models.database import AsyncSessionLocal, ChatMessage, ChatSession, Project, get_db
+from ..services.ai_gateway import AIGateway, get_ai_gateway
+from ..services.retrieval import RetrievalEngine, RetrievedChunk, get_retrieval_engine
+
+router = APIRouter(prefix="/api/chat", tags=["chat"])
+
+HISTORY_MESSAGES = int(os.getenv("CHAT_HISTORY_MESSAGES", "10"))
+SYSTEM_PROMPT = (
+    "You are an expert ServiceNow consultant answering questions about a client's project. "
+    "Answer from the numbered project excerpts when they are relevant and cite them like [1]. "
+    "If the excerpts do not contain the answer, say so before answering from general knowledge."
+)
+
+
+class ChatSessionCreate(BaseModel):
+    project_id: str
+    title: Optional[str] = None
+
+
+class ChatSessionResponse(BaseModel):
+    id: str
+    project_id: str
+    title: Optional[str] = None
+    created_at: str
+    last_activity: str
+
+
+class ChatMessageCreate(BaseModel):
+    message: str = Field(..., min_length=1)
+    top_k: int = Field(6, ge=1, le=20)
+    complexity: str = "medium"
+
+
+class ChatMessageResponse(BaseModel):
+    id: str
+    message_type: str
+    content: str
+    source_documents: Optional[List[Dict[str, Any]]] = None
+    timestamp: str
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def _session_response(s: ChatSession) -> ChatSessionResponse:
+    return ChatSessionResponse(
+        id=s.id,
+        project_id=s.project_id,
+        title=s.title,
+        created_at=s.created_at.isoformat(),
+        last_activity=s.last_activity.isoformat(),
+    )
+
+
+async def _get_session(db: AsyncSession, session_id: str, client_id: str) -> ChatSession:
+    chat = await db.scalar(
+        select(ChatSession).where(ChatSession.id == session_id, ChatSession.client_id == client_id)
+    )
+    if not chat:
+        raise HTTPException(status_code=404, detail="Chat session not found")
+    return chat
+
+
+def _sources(chunks: List[RetrievedChunk]) -> List[Dict[str, Any]]:
+    return [
+        {
+            "ref": i,
+            "document_id": c.document_id,
+            "filename": c.filename,
+            "chunk_id": c.chunk_id,
+            "chunk_index": c.chunk_index,
+            "score": round(c.score, 6),
+        }
+        for i, c in enumerate(chunks, start=1)
+    ]
+
+
+def _messages(history: List[ChatMessage], chunks: List[RetrievedChunk], question: str) -> List[Dict[str, str]]:
+    excerpts = "\n\n".join(f"[{i}] {c.filename}\n{c.content}" for i, c in enumerate(chunks, start=1))
+    messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+    for message in history:
+        role = "assistant" if message.message_type == "assistant" else "user"
+        messages.append({"role": role, "content": message.content})
+    messages.append(
+        {"role": "user", "content": f"Project excerpts:\n{excerpts or '(none)'}\n\nQuestion: {question}"}
+    )
+    return messages
+
+
+async def _record_answer(session_id: str, content: str, sources: List[Dict[str, Any]]) -> str:
+    # The request-scoped session is closed once streaming starts, so use our own.
+    async with AsyncSessionLocal() as db:
+        message = ChatMessage(
+            session_id=session_id, message_type="assistant", content=content, source_documents=sources
+        )
+        db.add(message)
+        await db.execute(
+            update(ChatSession)
+            .where(ChatSession.id == session_id)
+            .values(last_activity=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+        return message.id
+
+
+@router.post("/sessions", response_model=ChatSessionResponse)
+async def create_session(
+    request: ChatSessionCreate,
+    current_user = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Start a chat session scoped to one of the client's projects."""
+    project = await db.scalar(
+        select(Project).where(Project.id == request.project_id, Project.client_id == current_user.id)
+    )
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+    chat = ChatSession(client_id=current_user.id, project_id=project.id, title=request.title)
+    db.add(chat)
+    await db.commit()
+    return _session_response(chat)
+
+
+@router.get("/sessions", response_model=List[ChatSessionResponse])
+async def list_sessions(
+    project_id: Optional[str] = None,
+    current_user = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """List the client's chat sessions, most recently active first."""
+    query = select(ChatSession).where(ChatSession.client_id == current_user.id)
+    if project_id:
+        query = query.where(ChatSession.project_id == project_id)
+    sessions = await db.scalars(query.order_by(ChatSession.last_activity.desc()))
+    return [_session_response(s) for s in sessions]
+
+
+@router.get("/sessions/{session_id}/messages", response_model=List[ChatMessageResponse])
+async def list_messages(
+    session_id: str,
+    current_user = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Return a session's messages in order, with the sources each answer cited."""
+    await _get_session(db, session_id, current_user.id)
+    messages = await db.scalars(
+        select(ChatMessage).where(ChatMessage.session_id == session_id).order_by(ChatMessage.timestamp)
+    )
+    return [
+        ChatMessageResponse(
+            id=m.id,
+            message_type=m.message_type,
+            content=m.content,
+            source_documents=m.source_documents,
+            timestamp=m.timestamp.isoformat(),
+        )
+        for m in messages
+    ]
+
+
+@router.post("/sessions/{session_id}/messages")
+async def send_message(
+    session_id: str,
+    request: ChatMessageCreate,
+    current_user = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    gateway: AIGateway = Depends(get_ai_gateway),
+    engine: RetrievalEngine = Depends(get_retrieval_engine),
+):
+    """Answer a question from the project's documents as Server-Sent Events.
+
+    Emits one ``sources`` event with the retrieved excerpts, ``token`` events
+    as the answer streams, then ``done`` with the stored message id, or
+    ``error`` if the model call fails.
+    """
+    chat = await _get_session(db, session_id, current_user.id)
+    project_id = chat.project_id
+    history = (
+        await db.scalars(
+            select(ChatMessage)
+            .where(ChatMessage.session_id == session_id)
+            .order_by(ChatMessage.timestamp.desc())
+            .limit(HISTORY_MESSAGES)
+        )
+    ).all()[::-1]
+    db.add(ChatMessage(session_id=session_id, message_type="user", content=request.message))
+    chat.last_activity = datetime.utcnow()
+    await db.commit()
+
+    chunks = await engine.search(project_id, request.message, request.top_k)
+    sources = _sources(chunks)
+    messages = _messages(history, chunks, request.message)
+
+    async def events():
+        yield _sse("sources", {"sources": sources})
+        parts: List[str] = []
+        try:
+            async for delta in gateway.stream_chat(messages, request.complexity):
+                parts.append(delta)
+                yield _sse("token", {"text": delta})
+        except RuntimeError as exc:
+            yield _sse("error", {"detail": str(exc)})
+            return
+        message_id = await _record_answer(session_id, "".join(parts), sources)
+        yield _sse("done", {"message_id": message_id})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
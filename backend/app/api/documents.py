@@ -1,12 +1,19 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, UploadFile, File, Form
+from sqlalchemy import delete, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
+from datetime import datetime
+from typing import Optional, Tuple
+import asyncio
+import base64
+import json
 import uuid
-import os
-import shutil
 
-from ..models.database import get_db, DocumentFile, Project
+from ..models.database import get_db, DocumentChunk, DocumentFile, IngestionJob, Project
 from ..auth import get_current_user
+from ..services.blob_store import BlobStore, get_blob_store
+from ..services.ingestion import IngestionService, get_ingestion_service
+from ..services.uploads import UploadTooLarge, max_upload_bytes, save_upload
 
 router = APIRouter(prefix="/api", tags=["documents"])
 
@@ -17,80 +24,183 @@ class DocumentResponse(BaseModel):
     filename: str
     file_type: str
     file_size: int
+    sha256: Optional[str] = None
     processed: bool
+    chunk_count: int = 0
+    processing_status: str = "pending"
+    processing_progress: int = 0
+    processing_error: Optional[str] = None
     created_at: str
 
+
+def _document_response(d: DocumentFile) -> DocumentResponse:
+    return DocumentResponse(
+        id=d.id,
+        project_id=d.project_id,
+        filename=d.filename,
+        file_type=d.file_type,
+        file_size=d.file_size,
+        sha256=d.content_sha256,
+        processed=d.processed,
+        chunk_count=d.chunk_count or 0,
+        processing_status=d.processing_status or "pending",
+        processing_progress=d.processing_progress or 0,
+        processing_error=d.processing_error,
+        created_at=d.created_at.isoformat(),
+    )
+
+# Only the columns DocumentResponse needs; large text columns stay on disk.
+_LIST_COLUMNS = (
+    DocumentFile.id,
+    DocumentFile.project_id,
+    DocumentFile.filename,
+    DocumentFile.file_type,
+    DocumentFile.file_size,
+    DocumentFile.content_sha256,
+    DocumentFile.processed,
+    DocumentFile.chunk_count,
+    DocumentFile.processing_status,
+    DocumentFile.processing_progress,
+    DocumentFile.processing_error,
+    DocumentFile.created_at,
+)
+
+
+def encode_cursor(created_at: datetime, doc_id: str) -> str:
+    raw = json.dumps([created_at.isoformat(), doc_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, doc_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), str(doc_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
 @router.get("/documents", response_model=list[DocumentResponse])
 async def list_documents(
+    response: Response,
+    project_id: Optional[str] = None,
+    processed: Optional[bool] = None,
+    file_type: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
     current_user = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    """List all documents for the authenticated client."""
-    docs = (
-        db.query(DocumentFile)
-        .filter(DocumentFile.client_id == current_user.id)
-        .order_by(DocumentFile.created_at.desc())
-        .all()
-    )
-    return [
-        DocumentResponse(
-            id=d.id,
-            project_id=d.project_id,
-            filename=d.filename,
-            file_type=d.file_type,
-            file_size=d.file_size,
-            processed=d.processed,
-            created_at=d.created_at.isoformat(),
+    """List the authenticated client's documents, newest first.
+
+    Results are paged by keyset on ``(created_at, id)``. When more remain,
+    the ``X-Next-Cursor`` response header holds the ``cursor`` for the next
+    page.
+    """
+    query = select(*_LIST_COLUMNS).where(DocumentFile.client_id == current_user.id)
+    if project_id:
+        query = query.where(DocumentFile.project_id == project_id)
+    if processed is not None:
+        query = query.where(DocumentFile.processed == processed)
+    if file_type:
+        query = query.where(DocumentFile.file_type == file_type)
+    if cursor:
+        query = query.where(tuple_(DocumentFile.created_at, DocumentFile.id) < decode_cursor(cursor))
+    rows = (
+        await db.execute(
+            query.order_by(DocumentFile.created_at.desc(), DocumentFile.id.desc()).limit(limit + 1)
         )
-        for d in docs
-    ]
+    ).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(rows[-1].created_at, rows[-1].id)
+    return [_document_response(d) for d in rows]
 
 
 @router.post("/documents/upload", response_model=DocumentResponse)
 async def upload_document(
+    request: Request,
     project_id: str = Form(...),
     file: UploadFile = File(...),
     current_user = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     """Upload a document for a project."""
-    project = (
-        db.query(Project)
-        .filter(Project.id == project_id, Project.client_id == current_user.id)
-        .first()
+    max_bytes = max_upload_bytes(current_user.tier)
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > max_bytes + 64 * 1024:
+        # Multipart framing adds a little overhead, so only reject clear overruns here.
+        raise HTTPException(status_code=413, detail=str(UploadTooLarge(max_bytes)))
+
+    project = await db.scalar(
+        select(Project.id).where(Project.id == project_id, Project.client_id == current_user.id)
     )
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
+    # Don't hold a pooled connection while the upload streams in
+    await db.commit()
 
     doc_id = str(uuid.uuid4())
-    storage_dir = os.path.join("storage", "documents")
-    os.makedirs(storage_dir, exist_ok=True)
-    stored_filename = f"{doc_id}_{file.filename}"
-    path = os.path.join(storage_dir, stored_filename)
-    with open(path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    file_size = os.path.getsize(path)
+    blobs = get_blob_store()
+    try:
+        staged = await save_upload(file, blobs.staging_dir, doc_id, max_bytes)
+    except UploadTooLarge as exc:
+        raise HTTPException(status_code=413, detail=str(exc))
+    # Referencing the blob first locks its row against GC until the commit below.
+    await db.run_sync(BlobStore.add_ref, staged.sha256, staged.size)
+    path = await asyncio.to_thread(blobs.adopt, staged.path, staged.sha256)
 
     doc = DocumentFile(
         id=doc_id,
         client_id=current_user.id,
         project_id=project_id,
         filename=file.filename,
-        stored_filename=stored_filename,
+        stored_filename=staged.sha256,
         file_type=file.content_type or "application/octet-stream",
-        file_size=file_size,
+        file_size=staged.size,
         file_path=path,
+        content_sha256=staged.sha256,
     )
     db.add(doc)
-    db.commit()
-    db.refresh(doc)
+    await db.run_sync(IngestionService.enqueue, doc)
+    await db.commit()
+    get_ingestion_service().notify()
 
-    return DocumentResponse(
-        id=doc.id,
-        project_id=doc.project_id,
-        filename=doc.filename,
-        file_type=doc.file_type,
-        file_size=doc.file_size,
-        processed=doc.processed,
-        created_at=doc.created_at.isoformat(),
+    return _document_response(doc)
+
+
+@router.get("/documents/{document_id}", response_model=DocumentResponse)
+async def get_document(
+    document_id: str,
+    current_user = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Get a document, including its ingestion status and progress."""
+    doc = await db.scalar(
+        select(DocumentFile).where(DocumentFile.id == document_id, DocumentFile.client_id == current_user.id)
+    )
+    if not doc:
+        raise HTTPException(status_code=404, detail="Document not found")
+    return _document_response(doc)
+
+
+@router.delete("/documents/{document_id}")
+async def delete_document(
+    document_id: str,
+    current_user = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Delete a document; its stored content is reclaimed once nothing references it."""
+    doc = await db.scalar(
+        select(DocumentFile).where(DocumentFile.id == document_id, DocumentFile.client_id == current_user.id)
     )
+    if not doc:
+        raise HTTPException(status_code=404, detail="Document not found")
+    if doc.content_sha256:
+        await db.run_sync(BlobStore.release, doc.content_sha256)
+    await db.execute(delete(IngestionJob).where(IngestionJob.document_id == doc.id))
+    # In bulk: the relationship's cascade would load every chunk and delete them one by one.
+    await db.execute(delete(DocumentChunk).where(DocumentChunk.document_id == doc.id))
+    await db.delete(doc)
+    await db.commit()
+    return {"message": "Document deleted"}
@@ -1,5 +1,5 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 from pydantic import BaseModel
 
@@ -23,7 +23,7 @@ class ProjectResponse(BaseModel):
 @router.get("/projects")
 async def list_projects(
     current_user = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """List client's projects (placeholder)"""
     return {"message": "Projects endpoint not yet implemented"}
\ No newline at end of file
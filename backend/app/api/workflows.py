@@ -1,12 +1,32 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
-from datetime import datetime, timedelta
-import uuid
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import AsyncIterator, Optional
+import asyncio
+import json
+import os
+
+from ..models.database import AsyncSessionLocal, Workflow, WorkflowResult, get_db
+from ..services.workflow_events import WorkflowEvent, event_order
+from ..services.workflow_results import (
+    UnknownFields,
+    cached_projection,
+    choose_encoding,
+    encode_result,
+    etag_matches,
+    parse_fields,
+    project,
+    representation_etag,
+)
+from ..services.workflows import IdempotencyConflict, WorkflowEngine, get_workflow_engine
 
 router = APIRouter(prefix="/api", tags=["workflows"])
 
-# In-memory store for workflow status
-_workflows = {}
+# Quiet streams get a keep-alive (and a database check) this often
+HEARTBEAT_SECONDS = float(os.getenv("WORKFLOW_EVENTS_HEARTBEAT_SECONDS", "15"))
 
 
 class AnalysisRequest(BaseModel):
@@ -18,6 +38,9 @@ class WorkflowStatus(BaseModel):
     workflow_id: str
     status: str
     progress: int
+    current_step: Optional[str] = None
+    attempts: int = 0
+    error: Optional[str] = None
 
 
 class AnalysisResult(BaseModel):
@@ -27,45 +50,234 @@ class AnalysisResult(BaseModel):
     estimated_savings: str
 
 
+def _status(wf: Workflow) -> WorkflowStatus:
+    return WorkflowStatus(
+        workflow_id=wf.id,
+        status=wf.status,
+        progress=wf.progress or 0,
+        current_step=wf.current_step,
+        attempts=wf.attempts or 0,
+        error=wf.error,
+    )
+
+
+def _outcome(wf: Workflow) -> Optional[WorkflowEvent]:
+    """The terminal event for a finished workflow, rebuilt from its row."""
+    if wf.status == "completed":
+        return WorkflowEvent(None, "completed", {"result": wf.result})
+    if wf.status == "failed":
+        return WorkflowEvent(None, "failed", {"error": wf.error})
+    if wf.status == "cancelled":
+        return WorkflowEvent(None, "cancelled", {})
+    return None
+
+
+def _event_id(value: Optional[str]) -> Optional[str]:
+    try:
+        event_order(value)
+    except (AttributeError, ValueError):
+        return None
+    return value
+
+
+async def _follow(
+    engine: WorkflowEngine, wf: Workflow, last_event_id: Optional[str]
+) -> AsyncIterator[Optional[WorkflowEvent]]:
+    """Yield a workflow's current state, then its events until it finishes.
+
+    Yields None when the stream has been quiet for ``HEARTBEAT_SECONDS``.
+    Ends early if the subscriber falls too far behind; the client resumes
+    from its last event id.
+    """
+    yield WorkflowEvent(None, "state", _status(wf).model_dump())
+    outcome = _outcome(wf)
+    if outcome is not None:
+        yield outcome
+        return
+    subscription = await engine.hub.subscribe(wf.id, last_event_id)
+    try:
+        while True:
+            event = await subscription.next(HEARTBEAT_SECONDS)
+            if event is not None:
+                yield event
+                if event.terminal:
+                    return
+                continue
+            if subscription.closed:
+                return
+            # The row is authoritative: finish even if the outcome event was lost.
+            async with AsyncSessionLocal() as db:
+                wf = await db.get(Workflow, wf.id)
+            outcome = _outcome(wf) if wf is not None else WorkflowEvent(None, "cancelled", {})
+            if outcome is not None:
+                yield outcome
+                return
+            yield None
+    finally:
+        subscription.close()
+
+
+def _sse(event: WorkflowEvent) -> str:
+    head = f"id: {event.id}\n" if event.id else ""
+    return f"{head}event: {event.event}\ndata: {json.dumps(event.data, default=str)}\n\n"
+
+
+async def _get_workflow(db: AsyncSession, workflow_id: str) -> Workflow:
+    wf = await db.get(Workflow, workflow_id)
+    if wf is None:
+        raise HTTPException(status_code=404, detail="Analysis not found")
+    return wf
+
+
 @router.post("/analyze")
-async def start_analysis(request: AnalysisRequest):
-    workflow_id = str(uuid.uuid4())
-    _workflows[workflow_id] = {
-        "status": "in_progress",
-        "progress": 0,
-        "started_at": datetime.utcnow(),
-    }
-    return {
-        "workflow_id": workflow_id,
-        "status": "started",
-        "estimated_completion": (datetime.utcnow() + timedelta(minutes=5)).isoformat(),
-    }
+async def start_analysis(
+    request: AnalysisRequest,
+    idempotency_key: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_db),
+    engine: WorkflowEngine = Depends(get_workflow_engine),
+):
+    """Queue an analysis of a ServiceNow instance.
+
+    Retrying with the same ``Idempotency-Key`` header returns the workflow
+    the first request started.
+    """
+    try:
+        wf, created = await engine.submit(
+            db, request.analysis_type, {"credentials": request.credentials}, idempotency_key
+        )
+    except IdempotencyConflict as exc:
+        raise HTTPException(status_code=409, detail=str(exc))
+    return {"workflow_id": wf.id, "status": wf.status, "progress": wf.progress or 0, "created": created}
 
 
 @router.get("/status/{workflow_id}", response_model=WorkflowStatus)
-async def get_status(workflow_id: str):
-    if workflow_id not in _workflows:
-        raise HTTPException(status_code=404, detail="Analysis not found")
-    wf = _workflows[workflow_id]
-    wf["progress"] = min(wf["progress"] + 20, 100)
-    status = "completed" if wf["progress"] == 100 else "in_progress"
-    wf["status"] = status
-    return {"workflow_id": workflow_id, "status": status, "progress": wf["progress"]}
+async def get_status(workflow_id: str, db: AsyncSession = Depends(get_db)):
+    return _status(await _get_workflow(db, workflow_id))
 
 
-@router.get("/results/{workflow_id}", response_model=AnalysisResult)
-async def get_results(workflow_id: str):
-    if workflow_id not in _workflows:
-        raise HTTPException(status_code=404, detail="Analysis not found")
-    if _workflows[workflow_id]["progress"] < 100:
+@router.get("/workflows/{workflow_id}/events")
+async def workflow_events(
+    workflow_id: str,
+    last_event_id: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_db),
+    engine: WorkflowEngine = Depends(get_workflow_engine),
+):
+    """Stream a workflow's progress as Server-Sent Events.
+
+    Starts with a ``state`` snapshot, then ``started``, ``progress``,
+    ``step_completed`` (``cached`` when a stored output was reused) and
+    ``retrying`` events, and ends after ``completed``,
+    ``failed`` or ``cancelled``. Reconnecting with ``Last-Event-ID`` resumes
+    after that event.
+    """
+    wf = await _get_workflow(db, workflow_id)
+
+    async def events():
+        yield "retry: 2000\n\n"
+        async for event in _follow(engine, wf, _event_id(last_event_id)):
+            yield ": keep-alive\n\n" if event is None else _sse(event)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.websocket("/workflows/{workflow_id}/ws")
+async def workflow_socket(
+    websocket: WebSocket,
+    workflow_id: str,
+    last_event_id: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+    engine: WorkflowEngine = Depends(get_workflow_engine),
+):
+    """The same events as ``/events`` as JSON messages; resume with ``?last_event_id=``."""
+    wf = await db.get(Workflow, workflow_id)
+    # Hand the connection back to the pool for the life of the socket
+    await db.commit()
+    if wf is None:
+        await websocket.close(code=4404)
+        return
+    await websocket.accept()
+    try:
+        async for event in _follow(engine, wf, _event_id(last_event_id)):
+            if event is not None:
+                await websocket.send_json({"id": event.id, "event": event.event, "data": event.data})
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+
+
+@router.post("/workflows/{workflow_id}/cancel", response_model=WorkflowStatus)
+async def cancel_workflow(
+    workflow_id: str,
+    db: AsyncSession = Depends(get_db),
+    engine: WorkflowEngine = Depends(get_workflow_engine),
+):
+    """Cancel an analysis; a running one stops within a lease period."""
+    wf = await _get_workflow(db, workflow_id)
+    return _status(await engine.cancel(db, wf))
+
+
+async def _result_etag(db: AsyncSession, workflow_id: str) -> str:
+    """The stored result's ETag; stores the result first for workflows completed before results were stored."""
+    etag = await db.scalar(select(WorkflowResult.etag).where(WorkflowResult.workflow_id == workflow_id))
+    if etag is not None:
+        return etag
+    wf = await _get_workflow(db, workflow_id)
+    if wf.status == "failed":
+        raise HTTPException(status_code=400, detail=f"Analysis failed: {wf.error}")
+    if wf.status != "completed":
         raise HTTPException(status_code=400, detail="Analysis not complete")
-    return {
-        "workflow_id": workflow_id,
-        "health_score": 85,
-        "recommendations": [
-            {"title": "Upgrade ServiceNow Version", "priority": "high"},
-            {"title": "Optimize Business Rules", "priority": "medium"},
-            {"title": "Implement Service Portal", "priority": "medium"},
-        ],
-        "estimated_savings": "$45,000/year",
-    }
+    stored = await asyncio.to_thread(encode_result, wf.id, wf.result)
+    etag = stored.etag
+    db.add(stored)
+    try:
+        await db.commit()
+    except IntegrityError:
+        # Another request stored it first; the bytes are the same.
+        await db.rollback()
+    return etag
+
+
+@router.get(
+    "/results/{workflow_id}",
+    response_model=AnalysisResult,
+    responses={304: {"description": "Not modified: the If-None-Match ETag is current"}},
+)
+async def get_results(
+    workflow_id: str,
+    fields: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None),
+    accept_encoding: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_db),
+):
+    """A completed analysis, as stored when it finished.
+
+    ``?fields=health_score,recommendations`` returns only those fields.
+    Responses carry a strong ETag; send it back in ``If-None-Match`` to
+    get a 304 when nothing changed, which results never do.
+    """
+    etag = await _result_etag(db, workflow_id)
+    projection = parse_fields(fields)
+    encoding = choose_encoding(accept_encoding)
+    tag = representation_etag(etag, projection, encoding)
+    headers = {"ETag": tag, "Vary": "Accept-Encoding", "Cache-Control": "private, no-cache"}
+    if etag_matches(if_none_match, tag):
+        return Response(status_code=304, headers=headers)
+    if encoding:
+        headers["Content-Encoding"] = encoding
+
+    if not projection:
+        column = getattr(WorkflowResult, encoding or "body")
+        content = await db.scalar(select(column).where(WorkflowResult.workflow_id == workflow_id))
+        return Response(content, media_type="application/json", headers=headers)
+    content = cached_projection(tag)
+    if content is None:
+        body = await db.scalar(select(WorkflowResult.body).where(WorkflowResult.workflow_id == workflow_id))
+        try:
+            content = await asyncio.to_thread(project, body, tag, projection, encoding)
+        except UnknownFields as exc:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {exc}")
+    return Response(content, media_type="application/json", headers=headers)
@@ -1,16 +1,23 @@
 import os
+import time
 import jwt
 from datetime import datetime, timedelta
 from typing import Optional
 from fastapi import HTTPException, Depends, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from passlib.context import CryptContext
-from sqlalchemy.orm import Session
+from sqlalchemy import event, inspect, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, object_session
 
 from .models.database import Client, get_db
+from .services.password_hasher import PasswordHasher
+from .services.principal_cache import Principal, PrincipalCache
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Password hashing; changing AUTH_BCRYPT_ROUNDS rehashes stored passwords at next login
+BCRYPT_ROUNDS = int(os.getenv("AUTH_BCRYPT_ROUNDS", "12"))
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+password_hasher = PasswordHasher(pwd_context)
 security = HTTPBearer()
 
 SECRET_KEY = os.getenv("JWT_SECRET", "your-secret-key-change-in-production")
@@ -48,19 +55,82 @@ class AuthService:
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Token expired"
             )
-        except jwt.JWTError:
+        except jwt.InvalidTokenError:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Invalid token"
             )
 
+principal_cache = PrincipalCache()
+
+# Cached principals are dropped when a client changes, at flush and again
+# once the change commits: a request that read the old row in between
+# would otherwise cache it again. ORM bulk UPDATE/DELETE statements on
+# clients clear the whole cache. Core statements run on a connection
+# (``connection.execute(update(Client.__table__))``) bypass the session and
+# its events; code issuing them must call ``principal_cache.clear()``.
+_CHANGED_CLIENTS = "principal_cache.changed_clients"  # Session.info keys
+_BULK_CHANGE = "principal_cache.bulk_change"
+
+
+def _client_changed(target) -> None:
+    principal_cache.invalidate_client(target.id)
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault(_CHANGED_CLIENTS, set()).add(target.id)
+
+
+@event.listens_for(Client, "after_update")
+def _invalidate_principal(mapper, connection, target):
+    """Drop cached principals when access-relevant fields change."""
+    state = inspect(target)
+    if any(
+        state.attrs[name].history.has_changes()
+        for name in ("is_active", "tier", "hashed_password", "token_version", "email")
+    ):
+        _client_changed(target)
+
+
+@event.listens_for(Client, "after_delete")
+def _forget_principal(mapper, connection, target):
+    _client_changed(target)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _bulk_client_change(orm_execute_state):
+    if (orm_execute_state.is_update or orm_execute_state.is_delete) and any(
+        mapper.class_ is Client for mapper in orm_execute_state.all_mappers
+    ):
+        principal_cache.clear()
+        orm_execute_state.session.info[_BULK_CHANGE] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed_principals(session):
+    if session.info.pop(_BULK_CHANGE, False):
+        principal_cache.clear()
+    for client_id in session.info.pop(_CHANGED_CLIENTS, ()):
+        principal_cache.invalidate_client(client_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_principal_changes(session):
+    session.info.pop(_BULK_CHANGE, None)
+    session.info.pop(_CHANGED_CLIENTS, None)
+
+
 async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
-) -> Client:
+    db: AsyncSession = Depends(get_db)
+) -> Principal:
     """Get current authenticated user"""
     
-    payload = AuthService.verify_token(credentials.credentials)
+    token = credentials.credentials
+    principal = principal_cache.get(token)
+    if principal is not None:
+        return principal
+    
+    payload = AuthService.verify_token(token)
     user_id = payload.get("sub")
     
     if user_id is None:
@@ -69,11 +139,26 @@ async def get_current_user(
             detail="Invalid token"
         )
     
-    user = db.query(Client).filter(Client.id == user_id).first()
+    user = await db.scalar(select(Client).where(Client.id == user_id))
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="User not found"
         )
     
-    return user
\ No newline at end of file
+    if not user.is_active:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Account is disabled"
+        )
+    
+    if payload.get("ver", 0) != (user.token_version or 0):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token revoked"
+        )
+    
+    principal = Principal.from_client(user)
+    expires_in = payload["exp"] - time.time() if "exp" in payload else None
+    principal_cache.set(token, principal, expires_in)
+    return principal
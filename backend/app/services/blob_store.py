@@ -0,0 +1,146 @@
+"""Content-addressed storage for uploaded files.
+
+Blobs live at ``<root>/<sha[:2]>/<sha[2:4]>/<sha>``, so identical content
+uploaded to any number of projects is stored once. The ``blobs`` table keeps
+a reference count. It is incremented in the same transaction that adds a
+``DocumentFile`` and decremented when one is deleted. Blobs that stay
+unreferenced for ``grace`` seconds are removed by ``collect_garbage``, along
+with stray files a crashed upload left without a row.
+
+The blob's row is the lock between uploads and GC. An upload counts its
+reference (``add_ref``) before it adopts the file and holds the row until
+it commits; GC deletes the row and unlinks the file in one transaction.
+So either GC sees the new reference and keeps the file, or the upload
+waits for GC to finish and ``adopt`` finds the file gone and moves its own
+copy into place.
+"""
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from ..models.database import Blob, SessionLocal
+
+logger = logging.getLogger(__name__)
+
+
+class BlobStore:
+    def __init__(self, root: Optional[str] = None, grace: Optional[float] = None):
+        self.root = root or os.path.join("storage", "blobs")
+        self.grace = grace if grace is not None else float(os.getenv("BLOB_GC_GRACE_SECONDS", "3600"))
+
+    @property
+    def staging_dir(self) -> str:
+        return os.path.join(self.root, "staging")
+
+    def path_for(self, sha256: str) -> str:
+        return os.path.join(self.root, sha256[:2], sha256[2:4], sha256)
+
+    def adopt(self, staged_path: str, sha256: str) -> str:
+        """Move a fully written staging file into place, or drop it if the blob exists.
+
+        Call it after ``add_ref`` and before committing, so GC cannot remove
+        the blob in between.
+        """
+        path = self.path_for(sha256)
+        if os.path.exists(path):
+            os.remove(staged_path)
+            # Refresh mtime so a concurrent GC pass treats the blob as freshly used.
+            os.utime(path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(staged_path, path)
+        return path
+
+    @staticmethod
+    def add_ref(db: Session, sha256: str, size: int) -> None:
+        """Count a new reference to ``sha256`` in the caller's transaction."""
+        now = datetime.utcnow()
+        updated = (
+            db.query(Blob)
+            .filter(Blob.sha256 == sha256)
+            .update({Blob.ref_count: Blob.ref_count + 1, Blob.updated_at: now}, synchronize_session=False)
+        )
+        if updated:
+            return
+        try:
+            with db.begin_nested():
+                db.add(Blob(sha256=sha256, size=size, ref_count=1, created_at=now, updated_at=now))
+        except IntegrityError:
+            # Another upload of the same content inserted the row first.
+            db.query(Blob).filter(Blob.sha256 == sha256).update(
+                {Blob.ref_count: Blob.ref_count + 1, Blob.updated_at: now}, synchronize_session=False
+            )
+
+    @staticmethod
+    def release(db: Session, sha256: str) -> None:
+        """Drop one reference in the caller's transaction; GC reclaims the file later."""
+        db.query(Blob).filter(Blob.sha256 == sha256, Blob.ref_count > 0).update(
+            {Blob.ref_count: Blob.ref_count - 1, Blob.updated_at: datetime.utcnow()}, synchronize_session=False
+        )
+
+    def collect_garbage(self, session_factory=SessionLocal) -> int:
+        """Delete blobs unreferenced for longer than the grace period; return how many."""
+        cutoff = datetime.utcnow() - timedelta(seconds=self.grace)
+        removed = 0
+        with session_factory() as db:
+            candidates = [
+                sha for (sha,) in db.query(Blob.sha256).filter(Blob.ref_count <= 0, Blob.updated_at < cutoff)
+            ]
+            for sha in candidates:
+                path = self.path_for(sha)
+                if os.path.exists(path) and os.path.getmtime(path) > time.time() - self.grace:
+                    continue
+                # The ref count is checked again under the row lock, and the file is
+                # unlinked before that lock is released (see the module docstring).
+                deleted = (
+                    db.query(Blob)
+                    .filter(Blob.sha256 == sha, Blob.ref_count <= 0, Blob.updated_at < cutoff)
+                    .delete(synchronize_session=False)
+                )
+                if deleted and os.path.exists(path):
+                    os.remove(path)
+                    removed += 1
+                db.commit()
+            known = {sha for (sha,) in db.query(Blob.sha256)}
+        removed += self._sweep_strays(known)
+        return removed
+
+    def _sweep_strays(self, known: set) -> int:
+        removed = 0
+        deadline = time.time() - self.grace
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                path = os.path.join(directory, name)
+                stray = name not in known if directory != self.staging_dir else True
+                if stray and os.path.getmtime(path) < deadline:
+                    os.remove(path)
+                    removed += 1
+        return removed
+
+    async def run_gc(self, interval: Optional[float] = None) -> None:
+        """Collect garbage every ``interval`` seconds until cancelled."""
+        interval = interval or float(os.getenv("BLOB_GC_INTERVAL_SECONDS", "3600"))
+        while True:
+            try:
+                removed = await asyncio.to_thread(self.collect_garbage)
+                if removed:
+                    logger.info("Blob GC removed %d files", removed)
+            except Exception:
+                logger.exception("Blob GC failed")
+            await asyncio.sleep(interval)
+
+
+_store: Optional[BlobStore] = None
+
+
+def get_blob_store() -> BlobStore:
+    global _store
+    if _store is None:
+        _store = BlobStore()
+    return _store
@@ -0,0 +1,139 @@
+"""Text extraction and chunking for uploaded documents.
+
+Everything here is CPU-bound and runs inside the ingestion process pool, so
+functions are module-level and take only picklable arguments. Extractors
+yield text segment by segment (page, paragraph, sheet row, slide) and the
+chunker consumes them lazily, so a multi-hundred-page file is never held in
+memory as a whole.
+"""
+import json
+import os
+from typing import Iterable, Iterator
+
+PDF = "pdf"
+DOCX = "docx"
+XLSX = "xlsx"
+PPTX = "pptx"
+TEXT = "text"
+
+_EXTENSIONS = {
+    ".pdf": PDF,
+    ".docx": DOCX,
+    ".xlsx": XLSX,
+    ".xlsm": XLSX,
+    ".pptx": PPTX,
+}
+_CONTENT_TYPES = {
+    "application/pdf": PDF,
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document": DOCX,
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet": XLSX,
+    "application/vnd.openxmlformats-officedocument.presentationml.presentation": PPTX,
+}
+
+
+def detect_kind(filename: str, content_type: str) -> str:
+    kind = _EXTENSIONS.get(os.path.splitext(filename or "")[1].lower())
+    return kind or _CONTENT_TYPES.get(content_type or "", TEXT)
+
+
+def _pdf_segments(path: str) -> Iterator[str]:
+    from PyPDF2 import PdfReader
+
+    reader = PdfReader(path)
+    for page in reader.pages:
+        yield page.extract_text() or ""
+
+
+def _docx_segments(path: str) -> Iterator[str]:
+    import docx
+
+    document = docx.Document(path)
+    for paragraph in document.paragraphs:
+        yield paragraph.text
+    for table in document.tables:
+        for row in table.rows:
+            yield " | ".join(cell.text for cell in row.cells)
+
+
+def _xlsx_segments(path: str) -> Iterator[str]:
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        for sheet in workbook.worksheets:
+            yield f"Sheet: {sheet.title}"
+            for row in sheet.iter_rows(values_only=True):
+                values = [str(value) for value in row if value is not None]
+                if values:
+                    yield " | ".join(values)
+    finally:
+        workbook.close()
+
+
+def _pptx_segments(path: str) -> Iterator[str]:
+    from pptx import Presentation
+
+    presentation = Presentation(path)
+    for number, slide in enumerate(presentation.slides, start=1):
+        yield f"Slide {number}"
+        for shape in slide.shapes:
+            if shape.has_text_frame:
+                yield shape.text_frame.text
+
+
+def _text_segments(path: str) -> Iterator[str]:
+    with open(path, encoding="utf-8", errors="replace") as fh:
+        for line in fh:
+            yield line
+
+
+_EXTRACTORS = {
+    PDF: _pdf_segments,
+    DOCX: _docx_segments,
+    XLSX: _xlsx_segments,
+    PPTX: _pptx_segments,
+    TEXT: _text_segments,
+}
+
+
+def extract_segments(path: str, kind: str) -> Iterator[str]:
+    return _EXTRACTORS[kind](path)
+
+
+def chunk_text(segments: Iterable[str], size: int = 1000, overlap: int = 200) -> Iterator[str]:
+    """Group segments into chunks of about ``size`` characters.
+
+    Consecutive chunks share ``overlap`` trailing characters so a sentence cut
+    at a boundary still appears whole in one of them. Oversized segments are
+    split on their own.
+    """
+    if overlap >= size:
+        raise ValueError("overlap must be smaller than size")
+    buffer = ""
+    for segment in segments:
+        segment = " ".join(segment.split())
+        if not segment:
+            continue
+        buffer = f"{buffer} {segment}" if buffer else segment
+        while len(buffer) >= size:
+            cut = buffer.rfind(" ", size - overlap, size)
+            cut = cut if cut > 0 else size
+            yield buffer[:cut].strip()
+            buffer = buffer[max(cut - overlap, 0):].lstrip()
+    if buffer.strip():
+        yield buffer.strip()
+
+
+def parse_to_spool(
+    path: str, filename: str, content_type: str, spool_path: str, size: int = 1000, overlap: int = 200
+) -> int:
+    """Extract and chunk ``path`` into a JSON-lines spool file; return the chunk count."""
+    kind = detect_kind(filename, content_type)
+    count = 0
+    tmp_path = spool_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as spool:
+        for chunk in chunk_text(extract_segments(path, kind), size, overlap):
+            spool.write(json.dumps(chunk) + "\n")
+            count += 1
+    os.replace(tmp_path, spool_path)
+    return count
@@ -0,0 +1,84 @@
+import asyncio
+import os
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+
+class EmbeddingBatcher:
+    """Merge concurrent embedding requests into list-input API calls.
+
+    Requests that arrive within ``window`` seconds of the first pending one
+    are sent together in a single ``embeddings.create`` call (at most
+    ``max_batch`` inputs, duplicates sent once). Every caller gets its own
+    vector back, or the call's exception.
+    """
+
+    def __init__(
+        self,
+        client,
+        model: str = "text-embedding-3-small",
+        window: Optional[float] = None,
+        max_batch: Optional[int] = None,
+    ):
+        self.client = client
+        self.model = model
+        if window is None:
+            window = float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", "5")) / 1000
+        if max_batch is None:
+            max_batch = int(os.getenv("EMBEDDING_BATCH_MAX", "256"))
+        self.window = window
+        self.max_batch = max_batch
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self.requests = 0
+        self.batches = 0
+
+    async def embed(self, text: str) -> np.ndarray:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+        self.requests += 1
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    async def embed_many(self, texts: List[str]) -> List[np.ndarray]:
+        return list(await asyncio.gather(*(self.embed(text) for text in texts)))
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        task = asyncio.ensure_future(self._send(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, batch: List[Tuple[str, asyncio.Future]]) -> None:
+        inputs = list(dict.fromkeys(text for text, _ in batch))
+        self.batches += 1
+        try:
+            resp = await self.client.embeddings.create(model=self.model, input=inputs)
+        except BaseException as exc:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(exc)
+            if not isinstance(exc, Exception):
+                raise
+            return
+        vectors: Dict[str, np.ndarray] = {}
+        for position, item in enumerate(resp.data):
+            index = getattr(item, "index", position)
+            vectors[inputs[index]] = np.array(item.embedding, dtype=np.float32)
+        for text, future in batch:
+            if not future.done():
+                future.set_result(vectors[text])
+
+    def stats(self) -> Dict[str, int]:
+        return {"requests": self.requests, "batches": self.batches}
@@ -0,0 +1,290 @@
+"""Health scoring over an instance's extracted configuration.
+
+``load_store`` reads the NDJSON extracts Discovery wrote (see
+``servicenow_extractor``) into a ``MetadataStore``. Each table is a set of
+NumPy columns with one row per record, the latest version of each
+``sys_id`` winning. Scripts are not kept, only their length; they are
+checked by ``script_analyzer``. The columns of each table are saved next to its extracts as
+``columns.npz``, so loading again after a rule change skips the JSON.
+
+A ``Rule`` is a vectorized check over the store that returns a
+``Finding`` with a severity between 0 and 1. ``health_report`` weighs the
+findings into a 0-100 score and a ranked list of recommendations.
+Changing the rules only needs a re-score, not a new extraction; bump
+``RULES_VERSION`` so workflow runs do not reuse cached findings.
+"""
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+RULES_VERSION = "2"
+# Bump when the columns built from the extracts change, so saved columns are rebuilt.
+COLUMNS_VERSION = "2"
+
+# Records created or last changed only by these accounts are treated as out of the box.
+SYSTEM_USERS = frozenset({"", "system", "fresh", "maint", "glide.maint"})
+# General availability of each family, for version age.
+RELEASES = {
+    "madrid": "2019-03",
+    "newyork": "2019-09",
+    "orlando": "2020-03",
+    "paris": "2020-09",
+    "quebec": "2021-03",
+    "rome": "2021-09",
+    "sandiego": "2022-03",
+    "tokyo": "2022-09",
+    "utah": "2023-03",
+    "vancouver": "2023-09",
+    "washingtondc": "2024-03",
+    "xanadu": "2024-09",
+    "yokohama": "2025-03",
+    "zurich": "2025-09",
+}
+
+_NAME_BYTES = 80
+
+
+@dataclass
+class TableColumns:
+    sys_id: np.ndarray  # S32
+    name: np.ndarray  # S80, truncated
+    active: np.ndarray  # bool
+    customized: np.ndarray  # bool: changed or created by someone other than the system
+    script_length: np.ndarray  # int32; 0 when there is no script
+
+    def __len__(self) -> int:
+        return len(self.sys_id)
+
+    def names(self, mask: np.ndarray, limit: int = 5) -> List[str]:
+        return [value.decode("utf-8", "ignore") for value in self.name[mask][:limit]]
+
+    @classmethod
+    def empty(cls) -> "TableColumns":
+        return cls.from_rows([])
+
+    @classmethod
+    def from_rows(cls, rows: Sequence[Tuple]) -> "TableColumns":
+        columns = list(zip(*rows)) or [()] * 5
+        return cls(
+            sys_id=np.array(columns[0], dtype="S32"),
+            name=np.array(columns[1], dtype=f"S{_NAME_BYTES}"),
+            active=np.array(columns[2], dtype=bool),
+            customized=np.array(columns[3], dtype=bool),
+            script_length=np.array(columns[4], dtype=np.int32),
+        )
+
+
+def record_features(record: dict) -> Tuple:
+    """One record as a row of ``TableColumns``."""
+    try:
+        mod_count = int(record.get("sys_mod_count") or 0)
+    except ValueError:
+        mod_count = 0
+    customized = mod_count > 0 or any(
+        (record.get(field) or "") not in SYSTEM_USERS for field in ("sys_created_by", "sys_updated_by")
+    )
+    return (
+        record["sys_id"].encode("ascii", "ignore"),
+        (record.get("name") or "").encode("utf-8")[:_NAME_BYTES],
+        str(record.get("active", "true")).lower() == "true",
+        customized,
+        len(record.get("script") or ""),
+    )
+
+
+@dataclass
+class MetadataStore:
+    tables: Dict[str, TableColumns]
+    version: Optional[str] = None  # glide.buildname
+    as_of: datetime = field(default_factory=datetime.utcnow)
+
+    def table(self, name: str) -> TableColumns:
+        return self.tables.get(name) or TableColumns.empty()
+
+    @property
+    def records(self) -> int:
+        return sum(len(table) for table in self.tables.values())
+
+
+def _signature(files: Sequence[str]) -> str:
+    parts = [COLUMNS_VERSION] + [f"{os.path.basename(f)}:{os.path.getsize(f)}" for f in files]
+    return "|".join(parts)
+
+
+def load_table(files: Sequence[str]) -> Tuple[TableColumns, Optional[str]]:
+    """Columns for one table from its extracts (oldest first), plus glide.buildname if present.
+
+    Reuses ``columns.npz`` beside the extracts when they have not changed.
+    """
+    if not files:
+        return TableColumns.empty(), None
+    cache = os.path.join(os.path.dirname(files[0]), "columns.npz")
+    signature = _signature(files)
+    try:
+        with np.load(cache) as saved:
+            if str(saved["signature"]) == signature:
+                version = str(saved["version"]) or None
+                return TableColumns(**{name: saved[name] for name in TableColumns.__dataclass_fields__}), version
+    except (FileNotFoundError, KeyError, ValueError, OSError):
+        pass
+
+    latest: Dict[str, Tuple] = {}
+    version = None
+    for path in files:
+        with open(path, "rb") as handle:
+            for line in handle:
+                record = json.loads(line)
+                latest[record["sys_id"]] = record_features(record)
+                if record.get("name") == "glide.buildname":
+                    version = record.get("value")
+    columns = TableColumns.from_rows(list(latest.values()))
+    staged = cache + ".tmp.npz"
+    np.savez(staged, signature=signature, version=version or "", **asdict(columns))
+    os.replace(staged, cache)
+    return columns, version
+
+
+def load_store(table_files: Dict[str, Sequence[str]]) -> MetadataStore:
+    tables, version = {}, None
+    for name, files in table_files.items():
+        tables[name], found = load_table(files)
+        version = found or version
+    return MetadataStore(tables, version)
+
+
+@dataclass
+class Finding:
+    rule: str
+    title: str
+    category: str  # the agent that reports it: architecture, configuration or scripts
+    weight: float  # points of health score at stake
+    severity: float  # 0 (fine) .. 1 (as bad as it gets)
+    affected: int
+    detail: str
+    examples: List[str] = field(default_factory=list)
+
+    @property
+    def impact(self) -> float:
+        return self.weight * self.severity
+
+
+@dataclass
+class Rule:
+    name: str
+    title: str
+    category: str
+    weight: float
+    check: Callable[[MetadataStore], Tuple[float, int, str, List[str]]]  # severity, affected, detail, examples
+
+    def evaluate(self, store: MetadataStore) -> Finding:
+        severity, affected, detail, examples = self.check(store)
+        return Finding(
+            self.name, self.title, self.category, self.weight, float(np.clip(severity, 0, 1)), int(affected), detail,
+            examples,
+        )
+
+
+def inactive_scripted_rules(store: MetadataStore):
+    rules = store.table("sys_script")
+    mask = ~rules.active & (rules.script_length > 0)
+    count = int(mask.sum())
+    detail = f"{count:,} of {len(rules):,} business rules are inactive but still carry scripts"
+    # A fifth of all rules lying dormant is as bad as it gets.
+    return count / max(len(rules), 1) / 0.2, count, detail, rules.names(mask)
+
+
+def customization_ratio(store: MetadataStore):
+    customized = sum(int(table.customized.sum()) for table in store.tables.values())
+    total = store.records
+    ratio = customized / max(total, 1)
+    detail = f"{ratio:.0%} of {total:,} configuration records are customized"
+    # Up to a fifth is normal; three fifths or more is heavily customized.
+    return (ratio - 0.2) / 0.4, customized, detail, []
+
+
+def release_age_months(version: Optional[str], as_of: datetime) -> Optional[int]:
+    """Months since the family in a glide.buildname such as ``glide-tokyo-07-08-2022__patch4`` shipped."""
+    if not version:
+        return None
+    family = re.sub(r"[^a-z]", "", version.lower().split("__")[0].replace("glide", ""))
+    released = RELEASES.get(family)
+    if released is None:
+        return None
+    year, month = map(int, released.split("-"))
+    return (as_of.year - year) * 12 + as_of.month - month
+
+
+def version_age(store: MetadataStore):
+    months = release_age_months(store.version, store.as_of)
+    if months is None:
+        return 0, 0, f"Release {store.version or 'unknown'} could not be dated", []
+    detail = f"Running {store.version}, released {months} months ago"
+    # A family is supported for roughly two years; past a year old, upgrades get harder.
+    return (months - 12) / 24, 1, detail, [store.version]
+
+
+DEFAULT_RULES = [
+    Rule("inactive_scripted_rules", "Remove inactive business rules", "configuration", 15, inactive_scripted_rules),
+    Rule("customization_ratio", "Reduce customizations", "architecture", 30, customization_ratio),
+    Rule("version_age", "Upgrade ServiceNow Version", "architecture", 25, version_age),
+]
+
+
+def evaluate(
+    store: MetadataStore, rules: Iterable[Rule] = DEFAULT_RULES, category: Optional[str] = None
+) -> List[Finding]:
+    return [rule.evaluate(store) for rule in rules if category is None or rule.category == category]
+
+
+def _priority(severity: float) -> str:
+    if severity >= 2 / 3:
+        return "high"
+    if severity >= 1 / 3:
+        return "medium"
+    return "low"
+
+
+def health_report(findings: Iterable[Finding]) -> dict:
+    """Score out of 100 (each finding costs ``weight * severity``) and recommendations, worst first."""
+    findings = list(findings)
+    score = 100 - sum(finding.impact for finding in findings)
+    recommendations = [
+        {
+            "title": finding.title,
+            "priority": _priority(finding.severity),
+            "rule": finding.rule,
+            "detail": finding.detail,
+            "affected": finding.affected,
+            "impact": round(finding.impact, 1),
+            "examples": finding.examples,
+        }
+        for finding in sorted(findings, key=lambda f: f.impact, reverse=True)
+        if finding.severity > 0
+    ]
+    return {"health_score": int(round(max(score, 0))), "recommendations": recommendations}
+
+
+# Loaded stores by extract signature, so the agents scoring one instance share a load.
+_stores: "OrderedDict[str, MetadataStore]" = OrderedDict()
+_stores_lock = threading.Lock()
+_STORES_KEPT = 4
+
+
+def cached_store(table_files: Dict[str, Sequence[str]]) -> MetadataStore:
+    key = "||".join(f"{name}={_signature(files)}" for name, files in sorted(table_files.items()))
+    with _stores_lock:
+        if key in _stores:
+            _stores.move_to_end(key)
+            return _stores[key]
+        store = load_store(table_files)
+        _stores[key] = store
+        while len(_stores) > _STORES_KEPT:
+            _stores.popitem(last=False)
+        return store
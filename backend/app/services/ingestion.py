@@ -0,0 +1,484 @@
+"""Background ingestion of uploaded documents.
+
+An upload adds an ``IngestionJob`` row in the same transaction as its
+``DocumentFile``, so the queue is exactly as durable as the database. Each
+app process runs an ``IngestionService`` with a few worker tasks. A worker
+claims a queued job with a conditional UPDATE, so only one worker anywhere
+wins it. The file is parsed and chunked in a process pool into a JSON-lines
+spool. The worker then streams the spool back in batches, embeds up to
+``embed_concurrency`` batches at a time and stores the chunks, writing
+progress to the document as it goes.
+
+While a job runs, its worker renews the lease. A claim bumps the job's
+``attempts``, which doubles as the lease token: before the worker deletes
+or writes chunks, or finishes the job, it checks in the same transaction
+that the job is still ``running`` under its attempt, and stops if another
+worker has taken the job over. Jobs left ``running`` by a worker that
+died are re-queued once their lease expires, and failures are retried
+with exponential backoff up to ``max_attempts`` times.
+"""
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from typing import Callable, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from ..models.database import DocumentChunk, DocumentFile, IngestionJob, SessionLocal
+from .document_parsing import parse_to_spool
+
+logger = logging.getLogger(__name__)
+
+# Share of the progress bar spent on parsing; embedding fills the rest.
+PARSE_PROGRESS = 10
+
+
+class LeaseLost(Exception):
+    """Another worker claimed the job after this worker's lease expired."""
+
+
+class IngestionService:
+    """Claims ingestion jobs from the database and runs them to completion."""
+
+    def __init__(
+        self,
+        session_factory=SessionLocal,
+        embed_client=None,
+        embed_model: str = "text-embedding-3-small",
+        processes: Optional[int] = None,
+        workers: Optional[int] = None,
+        embed_batch: Optional[int] = None,
+        embed_concurrency: Optional[int] = None,
+        max_attempts: Optional[int] = None,
+        lease: Optional[float] = None,
+        poll_interval: Optional[float] = None,
+        retry_backoff: Optional[float] = None,
+        spool_dir: Optional[str] = None,
+        chunk_size: int = 1000,
+        chunk_overlap: int = 200,
+        reuse_chunks: bool = True,
+    ):
+        self._session_factory = session_factory
+        self.embed_client = embed_client
+        self.embed_model = embed_model
+        self.processes = processes or int(os.getenv("INGEST_PROCESSES", str(min(4, os.cpu_count() or 1))))
+        self.workers = workers or int(os.getenv("INGEST_WORKERS", "2"))
+        self.embed_batch = embed_batch or int(os.getenv("INGEST_EMBED_BATCH", "64"))
+        self.embed_concurrency = embed_concurrency or int(os.getenv("INGEST_EMBED_CONCURRENCY", "4"))
+        self.max_attempts = max_attempts or int(os.getenv("INGEST_MAX_ATTEMPTS", "3"))
+        self.lease = lease or float(os.getenv("INGEST_LEASE_SECONDS", "60"))
+        self.poll_interval = poll_interval or float(os.getenv("INGEST_POLL_SECONDS", "5"))
+        if retry_backoff is None:
+            retry_backoff = float(os.getenv("INGEST_RETRY_BACKOFF_SECONDS", "5"))
+        self.retry_backoff = retry_backoff
+        self.spool_dir = spool_dir or os.path.join("storage", "ingest_spool")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.reuse_chunks = reuse_chunks
+        self.reused = 0
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+        self._lost: Set[str] = set()
+        self._listeners: List[Callable[[str, str], None]] = []
+
+    @staticmethod
+    def enqueue(db: Session, doc: DocumentFile) -> IngestionJob:
+        """Add a job for ``doc`` to the caller's transaction."""
+        doc.processing_status = "queued"
+        doc.processing_progress = 0
+        job = IngestionJob(document_id=doc.id)
+        db.add(job)
+        return job
+
+    def add_listener(self, listener: Callable[[str, str], None]) -> None:
+        """Call ``listener(project_id, document_id)`` whenever a document finishes ingestion."""
+        self._listeners.append(listener)
+
+    def notify(self) -> None:
+        """Wake idle workers now instead of at their next poll."""
+        if self._wake is not None:
+            self._wake.set()
+
+    async def start(self) -> None:
+        os.makedirs(self.spool_dir, exist_ok=True)
+        self._wake = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._run()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._close_pool()
+
+    def _close_pool(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # Spawned children import only the parsing module, not a fork of the running app.
+            self._pool = ProcessPoolExecutor(self.processes, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                worked = await self.run_once()
+            except Exception:
+                logger.exception("Ingestion worker iteration failed")
+                worked = False
+            if not worked:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wake.clear()
+
+    async def run_once(self) -> bool:
+        """Claim and process one job; return False if the queue was empty."""
+        claimed = await asyncio.to_thread(self._claim)
+        if claimed is None:
+            return False
+        job_id, document_id, attempt = claimed
+        task = asyncio.create_task(self._process(job_id, attempt, document_id))
+        heartbeat = asyncio.create_task(self._heartbeat(job_id, attempt, task))
+        try:
+            total = await task
+            project_id = await asyncio.to_thread(self._complete, job_id, attempt, document_id, total)
+        except asyncio.CancelledError:
+            if job_id not in self._lost:
+                # Shutting down: leave the job to be re-queued when its lease expires.
+                task.cancel()
+                raise
+            logger.warning("Lost the lease on ingestion job %s; another worker has taken it over", job_id)
+        except LeaseLost:
+            logger.warning("Lost the lease on ingestion job %s; another worker has taken it over", job_id)
+        except Exception as exc:
+            logger.warning("Ingestion of document %s failed on attempt %d: %s", document_id, attempt, exc)
+            await asyncio.to_thread(self._fail, job_id, attempt, document_id, str(exc))
+        else:
+            for listener in self._listeners:
+                listener(project_id, document_id)
+        finally:
+            heartbeat.cancel()
+            self._lost.discard(job_id)
+        return True
+
+    async def _heartbeat(self, job_id: str, attempt: int, task: asyncio.Task) -> None:
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            if not await asyncio.to_thread(self._renew, job_id, attempt):
+                self._lost.add(job_id)
+                task.cancel()
+                return
+
+    # Database steps; each runs in a worker thread with its own session.
+
+    def _claim(self) -> Optional[Tuple[str, str, int]]:
+        now = datetime.utcnow()
+        with self._session_factory() as db:
+            db.query(IngestionJob).filter(
+                IngestionJob.status == "running",
+                IngestionJob.locked_at < now - timedelta(seconds=self.lease),
+            ).update({IngestionJob.status: "queued"}, synchronize_session=False)
+            db.commit()
+            candidates = (
+                db.query(IngestionJob.id)
+                .filter(IngestionJob.status == "queued", IngestionJob.available_at <= now)
+                .order_by(IngestionJob.created_at)
+                .limit(8)
+                .all()
+            )
+            for (job_id,) in candidates:
+                won = (
+                    db.query(IngestionJob)
+                    .filter(
+                        IngestionJob.id == job_id,
+                        IngestionJob.status == "queued",
+                        IngestionJob.available_at <= now,
+                    )
+                    .update(
+                        {
+                            IngestionJob.status: "running",
+                            IngestionJob.locked_at: now,
+                            IngestionJob.updated_at: now,
+                            IngestionJob.attempts: IngestionJob.attempts + 1,
+                        },
+                        synchronize_session=False,
+                    )
+                )
+                db.commit()
+                if won:
+                    job = db.get(IngestionJob, job_id)
+                    return job.id, job.document_id, job.attempts
+        return None
+
+    @staticmethod
+    def _hold(db: Session, job_id: str, attempt: int) -> None:
+        """Renew the lease in ``db``'s transaction; raise ``LeaseLost`` if the job was taken over."""
+        held = (
+            db.query(IngestionJob)
+            .filter(IngestionJob.id == job_id, IngestionJob.status == "running", IngestionJob.attempts == attempt)
+            .update({IngestionJob.locked_at: datetime.utcnow()}, synchronize_session=False)
+        )
+        if not held:
+            db.rollback()
+            raise LeaseLost(job_id)
+
+    def _renew(self, job_id: str, attempt: int) -> bool:
+        """Extend the lease; return False if another worker has taken the job over."""
+        with self._session_factory() as db:
+            try:
+                self._hold(db, job_id, attempt)
+            except LeaseLost:
+                return False
+            db.commit()
+            return True
+
+    def _load_document(self, job_id: str, attempt: int, document_id: str) -> Tuple[str, str, str, Optional[str]]:
+        with self._session_factory() as db:
+            self._hold(db, job_id, attempt)
+            doc = db.get(DocumentFile, document_id)
+            if doc is None:
+                raise LookupError(f"Document {document_id} no longer exists")
+            doc.processing_status = "processing"
+            doc.processing_progress = 0
+            doc.processing_error = None
+            db.query(DocumentChunk).filter(DocumentChunk.document_id == document_id).delete(
+                synchronize_session=False
+            )
+            db.commit()
+            return doc.file_path, doc.filename, doc.file_type, doc.content_sha256
+
+    def _reuse_chunks(self, job_id: str, attempt: int, document_id: str, sha256: str) -> Optional[int]:
+        """Copy chunks and embeddings from an already ingested copy of the same content."""
+        with self._session_factory() as db:
+            self._hold(db, job_id, attempt)
+            source = (
+                db.query(DocumentFile.id, DocumentFile.chunk_count)
+                .filter(
+                    DocumentFile.content_sha256 == sha256,
+                    DocumentFile.id != document_id,
+                    DocumentFile.processing_status == "completed",
+                )
+                .first()
+            )
+            if source is None:
+                return None
+            rows = (
+                db.query(DocumentChunk.chunk_index, DocumentChunk.content, DocumentChunk.embedding)
+                .filter(DocumentChunk.document_id == source.id)
+                .yield_per(500)
+            )
+            batch = []
+            for chunk_index, content, embedding in rows:
+                batch.append(
+                    {"document_id": document_id, "chunk_index": chunk_index, "content": content, "embedding": embedding}
+                )
+                if len(batch) >= 500:
+                    db.bulk_insert_mappings(DocumentChunk, batch)
+                    batch = []
+            if batch:
+                db.bulk_insert_mappings(DocumentChunk, batch)
+            db.commit()
+            return source.chunk_count
+
+    def _set_progress(self, document_id: str, progress: int) -> None:
+        with self._session_factory() as db:
+            db.query(DocumentFile).filter(DocumentFile.id == document_id).update(
+                {DocumentFile.processing_progress: progress}, synchronize_session=False
+            )
+            db.commit()
+
+    def _store_chunks(
+        self,
+        job_id: str,
+        attempt: int,
+        document_id: str,
+        first_index: int,
+        texts: List[str],
+        vectors: List[Optional[bytes]],
+    ) -> None:
+        with self._session_factory() as db:
+            self._hold(db, job_id, attempt)
+            db.add_all(
+                DocumentChunk(document_id=document_id, chunk_index=first_index + i, content=text, embedding=vector)
+                for i, (text, vector) in enumerate(zip(texts, vectors))
+            )
+            db.commit()
+
+    def _complete(self, job_id: str, attempt: int, document_id: str, total: int) -> Optional[str]:
+        now = datetime.utcnow()
+        with self._session_factory() as db:
+            self._hold(db, job_id, attempt)
+            db.query(IngestionJob).filter(IngestionJob.id == job_id).update(
+                {IngestionJob.status: "completed", IngestionJob.error: None, IngestionJob.updated_at: now},
+                synchronize_session=False,
+            )
+            db.query(DocumentFile).filter(DocumentFile.id == document_id).update(
+                {
+                    DocumentFile.processed: True,
+                    DocumentFile.chunk_count: total,
+                    DocumentFile.processing_status: "completed",
+                    DocumentFile.processing_progress: 100,
+                    DocumentFile.processing_error: None,
+                },
+                synchronize_session=False,
+            )
+            db.commit()
+            return db.query(DocumentFile.project_id).filter(DocumentFile.id == document_id).scalar()
+
+    def _fail(self, job_id: str, attempt: int, document_id: str, error: str) -> None:
+        retry = attempt < self.max_attempts
+        now = datetime.utcnow()
+        with self._session_factory() as db:
+            updated = (
+                db.query(IngestionJob)
+                .filter(IngestionJob.id == job_id, IngestionJob.status == "running", IngestionJob.attempts == attempt)
+                .update(
+                    {
+                        IngestionJob.status: "queued" if retry else "failed",
+                        IngestionJob.error: error,
+                        IngestionJob.available_at: now + timedelta(seconds=self.retry_backoff * 2 ** (attempt - 1)),
+                        IngestionJob.updated_at: now,
+                    },
+                    synchronize_session=False,
+                )
+            )
+            if not updated:
+                return  # taken over by another worker, which now owns the document's status
+            db.query(DocumentFile).filter(DocumentFile.id == document_id).update(
+                {
+                    DocumentFile.processing_status: "queued" if retry else "failed",
+                    DocumentFile.processing_error: error,
+                },
+                synchronize_session=False,
+            )
+            db.commit()
+
+    # Parsing and embedding.
+
+    async def _process(self, job_id: str, attempt: int, document_id: str) -> int:
+        path, filename, content_type, sha256 = await asyncio.to_thread(
+            self._load_document, job_id, attempt, document_id
+        )
+        if sha256 and self.reuse_chunks:
+            reused = await asyncio.to_thread(self._reuse_chunks, job_id, attempt, document_id, sha256)
+            if reused is not None:
+                self.reused += 1
+                return reused
+        spool_path = os.path.join(self.spool_dir, f"{job_id}.jsonl")
+        os.makedirs(self.spool_dir, exist_ok=True)
+        loop = asyncio.get_running_loop()
+        try:
+            try:
+                total = await loop.run_in_executor(
+                    self._executor(),
+                    parse_to_spool,
+                    path,
+                    filename,
+                    content_type,
+                    spool_path,
+                    self.chunk_size,
+                    self.chunk_overlap,
+                )
+            except BrokenProcessPool:
+                self._close_pool()  # a parser process died; start a fresh pool for the retry
+                raise
+            await asyncio.to_thread(self._set_progress, document_id, PARSE_PROGRESS)
+            await self._embed_spool(job_id, attempt, document_id, spool_path, total)
+        finally:
+            for leftover in (spool_path, spool_path + ".tmp"):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+        return total
+
+    def _read_batches(self, spool_path: str) -> Iterator[List[str]]:
+        batch: List[str] = []
+        with open(spool_path, encoding="utf-8") as spool:
+            for line in spool:
+                batch.append(json.loads(line))
+                if len(batch) >= self.embed_batch:
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
+
+    async def _embed_spool(self, job_id: str, attempt: int, document_id: str, spool_path: str, total: int) -> None:
+        # Acquiring before reading the next batch keeps at most
+        # ``embed_concurrency`` batches in memory at once.
+        semaphore = asyncio.Semaphore(self.embed_concurrency)
+        done = 0
+
+        async def handle(first_index: int, texts: List[str]) -> None:
+            nonlocal done
+            try:
+                vectors = await self._embed(texts)
+                await asyncio.to_thread(
+                    self._store_chunks, job_id, attempt, document_id, first_index, texts, vectors
+                )
+                done += len(texts)
+                progress = PARSE_PROGRESS + (100 - PARSE_PROGRESS) * done // max(total, 1)
+                await asyncio.to_thread(self._set_progress, document_id, min(progress, 99))
+            finally:
+                semaphore.release()
+
+        tasks: List[asyncio.Task] = []
+        index = 0
+        try:
+            for texts in self._read_batches(spool_path):
+                await semaphore.acquire()
+                failed = [task for task in tasks if task.done() and task.exception()]
+                if failed:
+                    semaphore.release()
+                    raise failed[0].exception()
+                tasks.append(asyncio.create_task(handle(index, texts)))
+                index += len(texts)
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+    async def _embed(self, texts: List[str]) -> List[Optional[bytes]]:
+        if self.embed_client is None:
+            return [None] * len(texts)
+        response = await self.embed_client.embeddings.create(model=self.embed_model, input=texts)
+        vectors = []
+        for item in sorted(response.data, key=lambda item: item.index):
+            vec = np.asarray(item.embedding, dtype=np.float32)
+            norm = np.linalg.norm(vec)
+            vectors.append((vec / norm if norm else vec).tobytes())
+        return vectors
+
+
+_service: Optional[IngestionService] = None
+
+
+def get_ingestion_service() -> IngestionService:
+    global _service
+    if _service is None:
+        embed_client = None
+        if os.getenv("OPENAI_API_KEY"):
+            from .ai_gateway import get_ai_gateway
+
+            embed_client = get_ai_gateway().client
+        _service = IngestionService(embed_client=embed_client)
+    return _service
+
+
+async def close_ingestion_service() -> None:
+    global _service
+    if _service is not None:
+        await _service.stop()
+        _service = None
@@ -0,0 +1,275 @@
+"""Model routing for the AI gateway.
+
+Each complexity level maps to a fallback chain of models. The router tracks
+every model's recent latency and errors, rate-limits it with token buckets
+(requests and tokens per minute) and trips a circuit breaker when it keeps
+failing. ``candidates`` returns the chain in the order it should be tried:
+healthy models within their latency SLO first, then the rest in chain order.
+"""
+import os
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+
+def _parse_pairs(name: str) -> Dict[str, str]:
+    """Parse ``key=value,key=value`` from an environment variable."""
+    pairs = {}
+    for item in os.getenv(name, "").split(","):
+        key, sep, value = item.partition("=")
+        if sep and key.strip():
+            pairs[key.strip()] = value.strip()
+    return pairs
+
+
+def parse_model_settings(name: str) -> Dict[str, float]:
+    """Per-model numeric overrides, e.g. ``gpt-4o=8,gpt-4-turbo=8``."""
+    return {model: float(value) for model, value in _parse_pairs(name).items()}
+
+
+class TokenBucket:
+    """Classic token bucket refilled continuously at ``per_minute / 60`` per second."""
+
+    def __init__(self, per_minute: float, clock: Callable[[], float] = time.monotonic):
+        self.rate = per_minute / 60.0
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self._clock = clock
+        self._updated = clock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def available(self, amount: float) -> bool:
+        if self.rate <= 0:
+            return True
+        self._refill()
+        return self.tokens >= min(amount, self.capacity)
+
+    def take(self, amount: float) -> None:
+        """Consume ``amount``; may go negative to record usage beyond the estimate."""
+        if self.rate <= 0:
+            return
+        self._refill()
+        self.tokens -= amount
+
+
+class ModelHealth:
+    """Rolling latency and error statistics over the last ``window`` seconds."""
+
+    def __init__(
+        self, window: float = 60.0, max_samples: int = 500, clock: Callable[[], float] = time.monotonic
+    ):
+        self.window = window
+        self._clock = clock
+        self._samples: Deque[Tuple[float, float, bool]] = deque(maxlen=max_samples)
+
+    def record(self, latency: float, ok: bool) -> None:
+        self._samples.append((self._clock(), latency, ok))
+
+    def _recent(self) -> List[Tuple[float, float, bool]]:
+        cutoff = self._clock() - self.window
+        while self._samples and self._samples[0][0] < cutoff:
+            self._samples.popleft()
+        return list(self._samples)
+
+    def error_rate(self) -> Tuple[float, int]:
+        samples = self._recent()
+        if not samples:
+            return 0.0, 0
+        return sum(1 for _, _, ok in samples if not ok) / len(samples), len(samples)
+
+    def p95_latency(self) -> Optional[float]:
+        latencies = sorted(latency for _, latency, ok in self._recent() if ok)
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+
+
+class CircuitBreaker:
+    """Closed -> open after repeated failures -> half-open trial after ``reset_timeout``."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        error_rate_threshold: float = 0.5,
+        min_samples: int = 10,
+        reset_timeout: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.failure_threshold = failure_threshold
+        self.error_rate_threshold = error_rate_threshold
+        self.min_samples = min_samples
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self.state = self.CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+
+    def allow(self) -> bool:
+        if self.state == self.OPEN and self._clock() - self._opened_at >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+            self._trial_in_flight = False
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.HALF_OPEN and not self._trial_in_flight:
+            return True
+        return False
+
+    def on_attempt(self) -> None:
+        if self.state == self.HALF_OPEN:
+            self._trial_in_flight = True
+
+    def on_success(self) -> None:
+        self.state = self.CLOSED
+        self._consecutive_failures = 0
+        self._trial_in_flight = False
+
+    def on_release(self) -> None:
+        """An attempt ended without an outcome; a half-open breaker may send another trial."""
+        self._trial_in_flight = False
+
+    def on_failure(self, error_rate: float, samples: int) -> None:
+        self._consecutive_failures += 1
+        tripped = self._consecutive_failures >= self.failure_threshold or (
+            samples >= self.min_samples and error_rate >= self.error_rate_threshold
+        )
+        if self.state == self.HALF_OPEN or tripped:
+            self.state = self.OPEN
+            self._opened_at = self._clock()
+            self._trial_in_flight = False
+
+
+@dataclass
+class ModelLimits:
+    requests_per_minute: float
+    tokens_per_minute: float
+    latency_slo: float  # seconds, compared against rolling p95
+
+
+class ModelRouter:
+    """Chooses which model serves a request and records how it went."""
+
+    DEFAULT_CHAINS = {
+        "simple": ["gpt-3.5-turbo", "gpt-4o"],
+        "medium": ["gpt-4-turbo", "gpt-4o", "gpt-3.5-turbo"],
+        "advanced": ["gpt-4o", "gpt-4-turbo"],
+    }
+    DEFAULT_LIMITS = {
+        "gpt-3.5-turbo": ModelLimits(3500, 1_000_000, 10.0),
+        "gpt-4-turbo": ModelLimits(500, 300_000, 30.0),
+        "gpt-4o": ModelLimits(500, 300_000, 20.0),
+    }
+    FALLBACK_LIMITS = ModelLimits(500, 300_000, 30.0)
+
+    def __init__(
+        self,
+        chains: Optional[Dict[str, List[str]]] = None,
+        limits: Optional[Dict[str, ModelLimits]] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.chains = chains if chains is not None else self._chains_from_env()
+        self.limits = limits if limits is not None else self._limits_from_env()
+        self._clock = clock
+        self._requests: Dict[str, TokenBucket] = {}
+        self._tokens: Dict[str, TokenBucket] = {}
+        self._health: Dict[str, ModelHealth] = {}
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self.fallbacks = 0
+
+    @classmethod
+    def _chains_from_env(cls) -> Dict[str, List[str]]:
+        chains = {name: list(models) for name, models in cls.DEFAULT_CHAINS.items()}
+        for complexity, models in _parse_pairs("AI_ROUTER_CHAINS").items():
+            chains[complexity] = [m for m in models.split("|") if m]
+        return chains
+
+    @classmethod
+    def _limits_from_env(cls) -> Dict[str, ModelLimits]:
+        limits = dict(cls.DEFAULT_LIMITS)
+        rpm = _parse_pairs("AI_ROUTER_RPM")
+        tpm = _parse_pairs("AI_ROUTER_TPM")
+        slo = _parse_pairs("AI_ROUTER_LATENCY_SLO_MS")
+        for model in set(rpm) | set(tpm) | set(slo):
+            base = limits.get(model, cls.FALLBACK_LIMITS)
+            limits[model] = ModelLimits(
+                float(rpm.get(model, base.requests_per_minute)),
+                float(tpm.get(model, base.tokens_per_minute)),
+                float(slo[model]) / 1000 if model in slo else base.latency_slo,
+            )
+        return limits
+
+    def _limit(self, model: str) -> ModelLimits:
+        return self.limits.get(model, self.FALLBACK_LIMITS)
+
+    def _state(self, model: str) -> Tuple[TokenBucket, TokenBucket, ModelHealth, CircuitBreaker]:
+        if model not in self._health:
+            limit = self._limit(model)
+            self._requests[model] = TokenBucket(limit.requests_per_minute, self._clock)
+            self._tokens[model] = TokenBucket(limit.tokens_per_minute, self._clock)
+            self._health[model] = ModelHealth(clock=self._clock)
+            self._breakers[model] = CircuitBreaker(clock=self._clock)
+        return self._requests[model], self._tokens[model], self._health[model], self._breakers[model]
+
+    def primary(self, complexity: str) -> str:
+        return self.chains.get(complexity, self.chains["medium"])[0]
+
+    def candidates(self, complexity: str, tokens: int) -> List[str]:
+        """Models to try, best first; empty if every model is unavailable."""
+        within_slo, over_slo = [], []
+        for model in self.chains.get(complexity, self.chains["medium"]):
+            requests, token_bucket, health, breaker = self._state(model)
+            if not breaker.allow() or not requests.available(1) or not token_bucket.available(tokens):
+                continue
+            p95 = health.p95_latency()
+            if p95 is not None and p95 > self._limit(model).latency_slo:
+                over_slo.append((p95, model))
+            else:
+                within_slo.append(model)
+        return within_slo + [model for _, model in sorted(over_slo)]
+
+    def acquire(self, model: str, tokens: int) -> bool:
+        requests, token_bucket, _, breaker = self._state(model)
+        if not breaker.allow() or not requests.available(1) or not token_bucket.available(tokens):
+            return False
+        requests.take(1)
+        token_bucket.take(tokens)
+        breaker.on_attempt()
+        return True
+
+    def record_success(self, model: str, latency: float, estimated_tokens: int, used_tokens: Optional[int]) -> None:
+        _, token_bucket, health, breaker = self._state(model)
+        if used_tokens is not None:
+            token_bucket.take(used_tokens - estimated_tokens)
+        health.record(latency, True)
+        breaker.on_success()
+
+    def record_failure(self, model: str, latency: float) -> None:
+        _, _, health, breaker = self._state(model)
+        health.record(latency, False)
+        breaker.on_failure(*health.error_rate())
+
+    def release(self, model: str) -> None:
+        """End an acquired attempt that has no outcome, e.g. because its caller was cancelled."""
+        self._state(model)[3].on_release()
+
+    def stats(self) -> Dict[str, Dict[str, object]]:
+        stats: Dict[str, Dict[str, object]] = {}
+        for model in self._health:
+            _, _, health, breaker = self._state(model)
+            error_rate, samples = health.error_rate()
+            stats[model] = {
+                "state": breaker.state,
+                "error_rate": error_rate,
+                "samples": samples,
+                "p95_latency": health.p95_latency(),
+            }
+        return stats
@@ -0,0 +1,104 @@
+"""Password hashing off the event loop.
+
+bcrypt is deliberately slow, so hashes and verifications run on a dedicated
+thread pool (the bcrypt C code releases the GIL, so threads hash in
+parallel). ``workers`` bounds the concurrent hashes; at most ``max_queue``
+further requests wait for a free worker. Past that the hasher sheds load
+with ``HasherBusy`` rather than letting a login burst build an unbounded
+backlog. ``verify`` also reports a replacement hash whenever the stored one
+was made with a different cost than the context's current setting, so
+callers can upgrade it transparently.
+"""
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional, Tuple, TypeVar
+
+from passlib.context import CryptContext
+
+T = TypeVar("T")
+
+
+class HasherBusy(Exception):
+    """Raised when every worker is busy and the wait queue is full."""
+
+
+class PasswordHasher:
+    def __init__(
+        self,
+        context: CryptContext,
+        workers: Optional[int] = None,
+        max_queue: Optional[int] = None,
+        queue_timeout: Optional[float] = None,
+    ):
+        self.context = context
+        self.workers = workers or int(os.getenv("AUTH_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+        self.max_queue = max_queue if max_queue is not None else int(os.getenv("AUTH_HASH_QUEUE", "64"))
+        if queue_timeout is None:
+            queue_timeout = float(os.getenv("AUTH_HASH_QUEUE_TIMEOUT", "5"))
+        self.queue_timeout = queue_timeout
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._slots_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._waiting = 0
+        self.completed = 0
+        self.shed = 0
+        self.rehashed = 0
+        self.busy_seconds = 0.0
+
+    def _pool(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="password-hash")
+        loop = asyncio.get_running_loop()
+        if self._slots_loop is not loop:
+            # asyncio primitives belong to one loop; tests and reloads may bring a new one.
+            self._slots = asyncio.Semaphore(self.workers)
+            self._slots_loop = loop
+        return self._executor
+
+    async def _run(self, fn: Callable[..., T], *args) -> T:
+        pool = self._pool()
+        if self._slots.locked() and self._waiting >= self.max_queue:
+            self.shed += 1
+            raise HasherBusy("Too many concurrent sign-ins, try again shortly")
+        self._waiting += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.shed += 1
+            raise HasherBusy("Too many concurrent sign-ins, try again shortly")
+        finally:
+            self._waiting -= 1
+        start = time.monotonic()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(pool, fn, *args)
+        finally:
+            self._slots.release()
+            self.completed += 1
+            self.busy_seconds += time.monotonic() - start
+
+    async def hash(self, password: str) -> str:
+        return await self._run(self.context.hash, password)
+
+    async def verify(self, password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+        """Return ``(valid, new_hash)``; ``new_hash`` is set when the stored hash is outdated."""
+        valid, new_hash = await self._run(self.context.verify_and_update, password, hashed)
+        if new_hash:
+            self.rehashed += 1
+        return valid, new_hash
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "workers": self.workers,
+            "waiting": self._waiting,
+            "completed": self.completed,
+            "shed": self.shed,
+            "rehashed": self.rehashed,
+            "avg_hash_ms": 1000 * self.busy_seconds / self.completed if self.completed else 0.0,
+        }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
@@ -0,0 +1,126 @@
+"""Bounded TTL cache from verified access tokens to principals.
+
+``get_current_user`` runs on every authenticated request. A hit skips both
+JWT verification and the ``Client`` lookup. Entries live for at most
+``ttl`` seconds and never past the token's own expiry. The least recently
+used entries are dropped beyond ``max_size``. Entries for a client are
+dropped as soon as this process sees the client deactivated, moved to
+another tier or its credentials rotated (see ``app.auth``); other
+processes catch up within ``ttl``.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Dict, Optional, Set, Tuple
+
+
+@dataclass(frozen=True)
+class Principal:
+    """The authenticated client, detached from any database session."""
+
+    id: str
+    email: str
+    name: str
+    company: str
+    tier: str
+    is_active: bool
+    token_version: int
+    created_at: Optional[datetime]
+
+    @classmethod
+    def from_client(cls, client) -> "Principal":
+        return cls(
+            id=client.id,
+            email=client.email,
+            name=client.name,
+            company=client.company,
+            tier=client.tier,
+            is_active=bool(client.is_active),
+            token_version=client.token_version or 0,
+            created_at=client.created_at,
+        )
+
+
+class PrincipalCache:
+    def __init__(
+        self,
+        max_size: Optional[int] = None,
+        ttl: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_size = max_size or int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+        self.ttl = ttl if ttl is not None else float(os.getenv("AUTH_CACHE_TTL", "60"))
+        self._clock = clock
+        self._entries: "OrderedDict[str, Tuple[Principal, float]]" = OrderedDict()
+        self._by_client: Dict[str, Set[str]] = {}
+        # Event hooks may fire from worker threads.
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _key(token: str) -> str:
+        return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+    def _drop(self, key: str) -> None:
+        principal, _ = self._entries.pop(key)
+        keys = self._by_client.get(principal.id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_client[principal.id]
+
+    def get(self, token: str) -> Optional[Principal]:
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= self._clock():
+                if entry is not None:
+                    self._drop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, token: str, principal: Principal, token_expires_in: Optional[float] = None) -> None:
+        lifetime = self.ttl if token_expires_in is None else min(self.ttl, token_expires_in)
+        if lifetime <= 0:
+            return
+        key = self._key(token)
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (principal, self._clock() + lifetime)
+            self._by_client.setdefault(principal.id, set()).add(key)
+            while len(self._entries) > self.max_size:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate_client(self, client_id: str) -> None:
+        with self._lock:
+            for key in list(self._by_client.get(client_id, ())):
+                self._drop(key)
+                self.invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._by_client.clear()
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,338 @@
+"""Hybrid retrieval over a project's document chunks.
+
+Every project gets its own in-memory shard holding a BM25 inverted index
+and a vector index (see ``vector_index``) over the chunk embeddings written
+by ingestion. A query runs both and fuses the two rankings with reciprocal
+rank fusion, so exact ServiceNow identifiers (table names, sys_ids, error
+codes) and paraphrased questions both find their chunks.
+
+Shards load lazily on first use. They stay in sync incrementally: documents
+that finish ingestion are added and deleted documents are dropped, either
+right away when this process ran the ingestion or at the next refresh
+check. Only chunk ids and statistics live in memory; chunk text is read
+from the database for the final hits.
+"""
+import asyncio
+import math
+import os
+import re
+import threading
+import time
+from array import array
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+from openai import OpenAIError
+
+from ..models.database import DocumentChunk, DocumentFile, SessionLocal
+from .vector_index import VectorIndex, index_from_env, top_k
+
+_TOKEN = re.compile(r"[a-z0-9_.]+")
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have how i if in into is it its of on or that the their "
+    "there these this to was we what when where which who why will with you your".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for token in _TOKEN.findall(text.lower()):
+        token = token.strip(".")
+        if token and token not in STOPWORDS:
+            tokens.append(token)
+    return tokens
+
+
+class BM25Index:
+    """Okapi BM25 over an append-only set of rows with tombstoned deletes.
+
+    Postings are kept per term as compact arrays and converted to numpy on
+    first use after a change, so a query costs one vectorized pass per query
+    term over that term's postings only.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Tuple[array, array]] = {}
+        self._arrays: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self._lengths = np.zeros(1024, dtype=np.float32)
+        self._live = np.zeros(1024, dtype=bool)
+        self._size = 0
+        self._count = 0
+        self._total_length = 0.0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def add(self, row: int, tokens: List[str]) -> None:
+        if row >= self._lengths.shape[0]:
+            capacity = max(row + 1, self._lengths.shape[0] * 2)
+            self._lengths = np.resize(self._lengths, capacity)
+            live = np.zeros(capacity, dtype=bool)
+            live[:self._live.shape[0]] = self._live
+            self._live = live
+        for term, tf in Counter(tokens).items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = (array("l"), array("f"))
+            postings[0].append(row)
+            postings[1].append(tf)
+            self._arrays.pop(term, None)
+        self._lengths[row] = len(tokens)
+        self._live[row] = True
+        self._size = max(self._size, row + 1)
+        self._count += 1
+        self._total_length += len(tokens)
+
+    def remove(self, row: int) -> None:
+        if row < self._size and self._live[row]:
+            self._live[row] = False
+            self._count -= 1
+            self._total_length -= float(self._lengths[row])
+
+    def _term_arrays(self, term: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        cached = self._arrays.get(term)
+        if cached is None:
+            postings = self._postings.get(term)
+            if postings is None:
+                return None
+            cached = self._arrays[term] = (
+                np.array(postings[0], dtype=np.int64),
+                np.array(postings[1], dtype=np.float32),
+            )
+        return cached
+
+    def search_k(self, terms: Iterable[str], k: int) -> Tuple[np.ndarray, np.ndarray]:
+        empty = np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        if not self._count or k <= 0:
+            return empty
+        avg_length = self._total_length / self._count or 1.0
+        scores = np.zeros(self._size, dtype=np.float32)
+        for term in set(terms):
+            arrays = self._term_arrays(term)
+            if arrays is None:
+                continue
+            rows, tf = arrays
+            idf = math.log(1 + (self._count - rows.shape[0] + 0.5) / (rows.shape[0] + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * self._lengths[rows] / avg_length)
+            scores[rows] += idf * tf * (self.k1 + 1) / (tf + norm)
+        scores[~self._live[:self._size]] = 0
+        rows = np.flatnonzero(scores)
+        if not rows.shape[0]:
+            return empty
+        return top_k(rows, scores[rows], k)
+
+
+def reciprocal_rank_fusion(rankings: List[np.ndarray], k: int, constant: int = 60) -> List[Tuple[int, float]]:
+    """Fuse ranked row lists: each row scores the sum of ``1 / (constant + rank)``."""
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, row in enumerate(ranking.tolist(), start=1):
+            fused[row] = fused.get(row, 0.0) + 1.0 / (constant + rank)
+    return sorted(fused.items(), key=lambda item: -item[1])[:k]
+
+
+class ProjectShard:
+    """BM25 and vector indexes over one project's chunks.
+
+    Rows are append-only; removing a document tombstones its rows. Callers
+    rebuild the shard once ``dead_ratio`` gets high. All methods take the
+    shard lock, so the shard can be used from worker threads.
+    """
+
+    def __init__(self, index_factory: Callable[[], VectorIndex] = index_from_env):
+        self.bm25 = BM25Index()
+        self.vector_index = index_factory()
+        self.vectors: Optional[np.ndarray] = None
+        self._chunk_ids: List[str] = []
+        self._rows_by_document: Dict[str, List[int]] = {}
+        self._dead = 0
+        self.lock = threading.RLock()
+
+    @property
+    def documents(self) -> Set[str]:
+        with self.lock:
+            return set(self._rows_by_document)
+
+    @property
+    def dead_ratio(self) -> float:
+        return self._dead / len(self._chunk_ids) if self._chunk_ids else 0.0
+
+    def _store_vector(self, row: int, embedding: bytes) -> bool:
+        vec = np.frombuffer(embedding, dtype=np.float32)
+        if self.vectors is None:
+            self.vectors = np.zeros((1024, vec.shape[0]), dtype=np.float32)
+        if vec.shape[0] != self.vectors.shape[1]:
+            return False  # Embedded with a different model; BM25 still covers it.
+        if row >= self.vectors.shape[0]:
+            grown = np.zeros((max(row + 1, self.vectors.shape[0] * 2), self.vectors.shape[1]), dtype=np.float32)
+            grown[:self.vectors.shape[0]] = self.vectors
+            self.vectors = grown
+        self.vectors[row] = vec
+        return True
+
+    def add_document(self, document_id: str, chunks: Iterable[Tuple[str, str, Optional[bytes]]]) -> None:
+        """Index ``(chunk_id, content, embedding)`` rows for ``document_id``."""
+        with self.lock:
+            if document_id in self._rows_by_document:
+                return
+            rows = self._rows_by_document[document_id] = []
+            for chunk_id, content, embedding in chunks:
+                row = len(self._chunk_ids)
+                self._chunk_ids.append(chunk_id)
+                rows.append(row)
+                self.bm25.add(row, tokenize(content))
+                if embedding and self._store_vector(row, embedding):
+                    self.vector_index.add(row, self.vectors)
+            if self.vector_index.training_due():
+                # Shards are updated in worker threads, so training here keeps it off the event loop.
+                self.vector_index.train(self.vectors)
+
+    def remove_document(self, document_id: str) -> None:
+        with self.lock:
+            for row in self._rows_by_document.pop(document_id, []):
+                self.bm25.remove(row)
+                self.vector_index.remove(row)
+                self._dead += 1
+
+    def search(
+        self, terms: List[str], query: Optional[np.ndarray], k: int, candidates: int = 50
+    ) -> List[Tuple[str, float]]:
+        """Return up to ``k`` ``(chunk_id, fused_score)`` pairs, best first."""
+        with self.lock:
+            depth = max(k, candidates)
+            rankings = [self.bm25.search_k(terms, depth)[0]]
+            if query is not None and self.vectors is not None and query.shape[0] == self.vectors.shape[1]:
+                rankings.append(self.vector_index.search_k(self.vectors, query, depth)[0])
+            return [(self._chunk_ids[row], score) for row, score in reciprocal_rank_fusion(rankings, k)]
+
+
+@dataclass
+class RetrievedChunk:
+    chunk_id: str
+    document_id: str
+    filename: str
+    chunk_index: int
+    content: str
+    score: float
+
+
+class RetrievalEngine:
+    """Per-project shards, loaded lazily and kept in sync with ingestion."""
+
+    def __init__(
+        self,
+        session_factory=SessionLocal,
+        embed_client=None,
+        embed_model: str = "text-embedding-3-small",
+        max_shards: Optional[int] = None,
+        refresh_interval: Optional[float] = None,
+        index_factory: Callable[[], VectorIndex] = index_from_env,
+    ):
+        self._session_factory = session_factory
+        self.embed_client = embed_client
+        self.embed_model = embed_model
+        self.max_shards = max_shards or int(os.getenv("RETRIEVAL_MAX_SHARDS", "16"))
+        if refresh_interval is None:
+            refresh_interval = float(os.getenv("RETRIEVAL_REFRESH_SECONDS", "10"))
+        self.refresh_interval = refresh_interval
+        self._index_factory = index_factory
+        self._shards: "OrderedDict[str, ProjectShard]" = OrderedDict()
+        self._refreshed: Dict[str, float] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    def document_ready(self, project_id: str, document_id: str) -> None:
+        """Ingestion listener: make the next query pick up the document."""
+        self._refreshed.pop(project_id, None)
+
+    async def _shard(self, project_id: str) -> ProjectShard:
+        lock = self._locks.setdefault(project_id, asyncio.Lock())
+        async with lock:
+            shard = self._shards.get(project_id)
+            if shard is None or shard.dead_ratio > 0.5:
+                shard = ProjectShard(self._index_factory)
+                self._refreshed.pop(project_id, None)
+            due = time.monotonic() - self._refreshed.get(project_id, float("-inf")) >= self.refresh_interval
+            if due:
+                await asyncio.to_thread(self._sync_shard, project_id, shard)
+                self._refreshed[project_id] = time.monotonic()
+            self._shards[project_id] = shard
+            self._shards.move_to_end(project_id)
+            while len(self._shards) > self.max_shards:
+                evicted, _ = self._shards.popitem(last=False)
+                self._refreshed.pop(evicted, None)
+        return shard
+
+    def _sync_shard(self, project_id: str, shard: ProjectShard) -> None:
+        with self._session_factory() as db:
+            ready = {
+                doc_id
+                for (doc_id,) in db.query(DocumentFile.id).filter(
+                    DocumentFile.project_id == project_id, DocumentFile.processing_status == "completed"
+                )
+            }
+            loaded = shard.documents
+            for document_id in loaded - ready:
+                shard.remove_document(document_id)
+            for document_id in ready - loaded:
+                chunks = (
+                    db.query(DocumentChunk.id, DocumentChunk.content, DocumentChunk.embedding)
+                    .filter(DocumentChunk.document_id == document_id)
+                    .order_by(DocumentChunk.chunk_index)
+                    .yield_per(1000)
+                )
+                shard.add_document(document_id, chunks)
+
+    async def _embed_query(self, query: str) -> Optional[np.ndarray]:
+        if self.embed_client is None:
+            return None
+        try:
+            response = await self.embed_client.embeddings.create(model=self.embed_model, input=query)
+        except OpenAIError:
+            return None  # Lexical results alone beat failing the request.
+        vec = np.asarray(response.data[0].embedding, dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
+
+    def _load_chunks(self, hits: List[Tuple[str, float]]) -> List[RetrievedChunk]:
+        if not hits:
+            return []
+        with self._session_factory() as db:
+            rows = (
+                db.query(DocumentChunk, DocumentFile.filename)
+                .join(DocumentFile, DocumentFile.id == DocumentChunk.document_id)
+                .filter(DocumentChunk.id.in_([chunk_id for chunk_id, _ in hits]))
+                .all()
+            )
+        by_id = {chunk.id: (chunk, filename) for chunk, filename in rows}
+        results = []
+        for chunk_id, score in hits:
+            if chunk_id in by_id:
+                chunk, filename = by_id[chunk_id]
+                results.append(
+                    RetrievedChunk(chunk.id, chunk.document_id, filename, chunk.chunk_index, chunk.content, score)
+                )
+        return results
+
+    async def search(self, project_id: str, query: str, k: int = 6) -> List[RetrievedChunk]:
+        shard, vector = await asyncio.gather(self._shard(project_id), self._embed_query(query))
+        hits = await asyncio.to_thread(shard.search, tokenize(query), vector, k)
+        return await asyncio.to_thread(self._load_chunks, hits)
+
+
+_engine: Optional[RetrievalEngine] = None
+
+
+def get_retrieval_engine() -> RetrievalEngine:
+    global _engine
+    if _engine is None:
+        embed_client = None
+        if os.getenv("OPENAI_API_KEY"):
+            from .ai_gateway import get_ai_gateway
+
+            embed_client = get_ai_gateway().client
+        _engine = RetrievalEngine(embed_client=embed_client)
+    return _engine
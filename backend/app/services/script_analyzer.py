@@ -0,0 +1,205 @@
+"""Static analysis of an instance's server and client scripts.
+
+``ScriptAnalyzer.analyze_instance`` reads the scripts out of the extracts
+Discovery wrote (see ``servicenow_extractor``) and runs the checks in
+``script_checks`` over them in a process pool, a batch of scripts per
+task. Issues are cached in ``script_analyses`` by a hash of the script and
+the checks version, so a script analyzed in any earlier assessment, or
+shared by several records, is not analyzed again. The issues are then
+summarized into health-score findings (see ``health_scoring``).
+"""
+import asyncio
+import hashlib
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import asdict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
+
+from sqlalchemy.exc import IntegrityError
+
+from ..models.database import ScriptAnalysis, SessionLocal
+from .health_scoring import Finding
+from .script_checks import CHECKS_VERSION, CURRENT_UPDATE, GET_ROW_COUNT, MESSAGES, QUERY_IN_LOOP, SYNC_AJAX
+from .script_checks import analyze_batch
+from .servicenow_extractor import get_servicenow_extractor
+
+# Bump when the findings change for the same issues (titles, weights, thresholds).
+RULES_VERSION = "2"
+VERSION = f"{CHECKS_VERSION}.{RULES_VERSION}"
+
+SCRIPT_TABLES = ("sys_script", "sys_script_include", "sys_script_client", "sys_ui_action")
+# Title, points of health score at stake, the share of active scripts with the
+# issue at which it is as bad as it gets, and the tables it applies to (None for
+# all of them). current.update() is only a problem in business rules: UI actions
+# and script includes call it on purpose.
+SCRIPT_RULES = {
+    QUERY_IN_LOOP: ("Move GlideRecord queries out of loops", 15, 0.05, None),
+    GET_ROW_COUNT: ("Count with GlideAggregate instead of getRowCount()", 5, 0.05, None),
+    SYNC_AJAX: ("Replace synchronous AJAX calls", 5, 0.02, None),
+    CURRENT_UPDATE: ("Stop calling current.update() in business rules", 5, 0.02, ("sys_script",)),
+}
+_LOOKUP_BATCH = 500  # keys per IN (...) when reading the cache
+
+
+def script_key(script: str) -> str:
+    return hashlib.sha256(f"{CHECKS_VERSION}\n{script}".encode("utf-8")).hexdigest()
+
+
+def read_scripts(table_files: Dict[str, Sequence[str]]) -> List[Dict[str, Any]]:
+    """The records with a script in each table's extracts (oldest first), latest version of each."""
+    scripts = []
+    for table, files in table_files.items():
+        latest: Dict[str, Dict[str, Any]] = {}
+        for path in files:
+            with open(path, "rb") as handle:
+                for line in handle:
+                    record = json.loads(line)
+                    latest[record["sys_id"]] = record
+        for record in latest.values():
+            if record.get("script"):
+                scripts.append(
+                    {
+                        "table": table,
+                        "sys_id": record["sys_id"],
+                        "name": record.get("name") or record["sys_id"],
+                        "active": str(record.get("active", "true")).lower() == "true",
+                        "script": record["script"],
+                    }
+                )
+    return scripts
+
+
+def summarize(scripts: Sequence[Dict[str, Any]], issues: Sequence[List[Dict]]) -> Dict[str, Any]:
+    """Counts per check and one finding per check, over the active scripts of the tables it applies to."""
+    active = [(script, found) for script, found in zip(scripts, issues) if script["active"]]
+    findings = []
+    counts = {}
+    for check, (title, weight, worst, tables) in SCRIPT_RULES.items():
+        scope = [(script, found) for script, found in active if tables is None or script["table"] in tables]
+        hits = []
+        for script, found in scope:
+            first = next((issue for issue in found if issue["check"] == check), None)
+            if first is not None:
+                hits.append((script, first))
+        counts[check] = len(hits)
+        finding = Finding(
+            rule=check,
+            title=title,
+            category="scripts",
+            weight=weight,
+            severity=min(len(hits) / max(len(scope), 1) / worst, 1.0),
+            affected=len(hits),
+            detail=f"{len(hits):,} of {len(scope):,} active scripts. {MESSAGES[check]}",
+            examples=[f"{script['table']}: {script['name']} (line {issue['line']})" for script, issue in hits[:5]],
+        )
+        findings.append(asdict(finding))
+    return {"scripts": len(scripts), "active": len(active), "issues": counts, "findings": findings}
+
+
+class ScriptAnalyzer:
+    def __init__(self, session_factory=SessionLocal, processes: Optional[int] = None, batch_size: Optional[int] = None):
+        self._session_factory = session_factory
+        self.processes = processes or int(os.getenv("SCRIPT_ANALYSIS_PROCESSES", str(min(4, os.cpu_count() or 1))))
+        self.batch_size = batch_size or int(os.getenv("SCRIPT_ANALYSIS_BATCH", "200"))
+        self.analyzed = 0  # scripts run through the checks
+        self.reused = 0  # scripts whose issues came from the cache
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # Spawned children import only the checks module, not a fork of the running app.
+            self._pool = ProcessPoolExecutor(self.processes, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def analyze_instance(
+        self,
+        instance_url: str,
+        tables: Sequence[str] = SCRIPT_TABLES,
+        extractor=None,
+        progress: Optional[Callable[[float], Awaitable[None]]] = None,
+    ) -> Dict[str, Any]:
+        extractor = extractor or get_servicenow_extractor()
+        files = {table: extractor.table_files(instance_url, table) for table in tables}
+        scripts = await asyncio.to_thread(read_scripts, files)
+        issues = await self.analyze([script["script"] for script in scripts], progress)
+        return summarize(scripts, issues)
+
+    async def analyze(
+        self, scripts: Sequence[str], progress: Optional[Callable[[float], Awaitable[None]]] = None
+    ) -> List[List[Dict]]:
+        """Issues for each of ``scripts``, from the cache where possible."""
+        keys = [script_key(script) for script in scripts]
+        unique = dict(zip(keys, scripts))
+        issues = await asyncio.to_thread(self._cached, list(unique))
+        missing = [key for key in unique if key not in issues]
+        self.reused += len(unique) - len(missing)
+        if missing:
+            loop = asyncio.get_running_loop()
+            done = 0
+
+            async def run(batch: List[str]) -> None:
+                nonlocal done
+                found = await loop.run_in_executor(self._executor(), analyze_batch, [unique[key] for key in batch])
+                fresh = dict(zip(batch, found))
+                # Stored as each batch lands, so a run that times out still saves what it did.
+                await asyncio.to_thread(self._store, fresh)
+                issues.update(fresh)
+                self.analyzed += len(fresh)
+                done += len(fresh)
+                if progress is not None:
+                    await progress(done / len(missing))
+
+            try:
+                async with asyncio.TaskGroup() as group:
+                    for i in range(0, len(missing), self.batch_size):
+                        group.create_task(run(missing[i:i + self.batch_size]))
+            except BaseExceptionGroup as errors:
+                if any(isinstance(error, BrokenProcessPool) for error in errors.exceptions):
+                    self.close()  # a worker died; start a fresh pool next time
+                raise errors.exceptions[0] from None
+        return [issues[key] for key in keys]
+
+    def _cached(self, keys: List[str]) -> Dict[str, List[Dict]]:
+        found = {}
+        with self._session_factory() as db:
+            for i in range(0, len(keys), _LOOKUP_BATCH):
+                rows = db.query(ScriptAnalysis.key, ScriptAnalysis.issues).filter(
+                    ScriptAnalysis.key.in_(keys[i:i + _LOOKUP_BATCH])
+                )
+                found.update(rows)
+        return found
+
+    def _store(self, issues: Dict[str, List[Dict]]) -> None:
+        with self._session_factory() as db:
+            stored = {key for (key,) in db.query(ScriptAnalysis.key).filter(ScriptAnalysis.key.in_(list(issues)))}
+            db.add_all(ScriptAnalysis(key=key, issues=found) for key, found in issues.items() if key not in stored)
+            try:
+                db.commit()
+            except IntegrityError:
+                # Another run analyzed some of the same scripts first.
+                db.rollback()
+
+
+_analyzer: Optional[ScriptAnalyzer] = None
+
+
+def get_script_analyzer() -> ScriptAnalyzer:
+    global _analyzer
+    if _analyzer is None:
+        _analyzer = ScriptAnalyzer()
+    return _analyzer
+
+
+def close_script_analyzer() -> None:
+    global _analyzer
+    if _analyzer is not None:
+        _analyzer.close()
+        _analyzer = None
@@ -0,0 +1,102 @@
+"""Static checks for ServiceNow scripts.
+
+Everything here is CPU-bound and runs inside the script analysis process
+pool, so functions are module-level and take only picklable arguments.
+Comments and string literals are blanked out before matching (keeping line
+numbers), so commented-out code and queries named in strings are not
+reported. Bump ``CHECKS_VERSION`` whenever a check changes: cached issues
+are keyed by it.
+"""
+import re
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+CHECKS_VERSION = "1"
+
+QUERY_IN_LOOP = "query_in_loop"
+GET_ROW_COUNT = "get_row_count"
+SYNC_AJAX = "sync_ajax"
+CURRENT_UPDATE = "current_update"
+
+MESSAGES = {
+    QUERY_IN_LOOP: "Database query inside a loop; query once outside it, e.g. with addQuery('field', 'IN', ids)",
+    GET_ROW_COUNT: "getRowCount() fetches every row to count them; use GlideAggregate COUNT, or setLimit(1) to test",
+    SYNC_AJAX: "Synchronous server call blocks the browser; use getXMLAnswer() or a callback",
+    CURRENT_UPDATE: "current.update() in a business rule runs the rules again; use a before rule instead",
+}
+
+_LOOP = re.compile(r"\b(?:while|for)\s*\(|\.forEach\s*\(")
+_QUERY = re.compile(r"\bnew\s+Glide(?:Record|Aggregate)(?:Secure)?\s*\(|\.query\s*\(|\.get\s*\(")
+_GET_ROW_COUNT = re.compile(r"\.getRowCount\s*\(")
+# getXMLWait() always blocks; getReference() does when it is not given a callback.
+_SYNC_AJAX = re.compile(r"\.getXMLWait\s*\(|\.getReference\s*\(\s*(?:'[^']*'|\"[^\"]*\"|[\w.$]+)\s*\)")
+_CURRENT_UPDATE = re.compile(r"\bcurrent\s*\.\s*update\s*\(")
+# Comments and string literals, leftmost first, so a quote in a comment or a // in a string is not misread.
+_LITERAL = re.compile(
+    r"//[^\n]*|/\*.*?(?:\*/|\Z)|'(?:\\.|[^'\\\n])*'?|\"(?:\\.|[^\"\\\n])*\"?|`(?:\\.|[^`\\])*`?", re.S
+)
+_NOT_NEWLINE = re.compile(r"[^\n]")
+_BRACKETS = {"(": re.compile(r"[()]"), "{": re.compile(r"[{}]")}
+
+
+def _blank(match: "re.Match") -> str:
+    text = match.group()
+    if text[0] in "'\"`" and len(text) > 1 and text[-1] == text[0]:
+        # Keep the quotes, so a string still reads as an argument.
+        return text[0] + _NOT_NEWLINE.sub(" ", text[1:-1]) + text[-1]
+    return _NOT_NEWLINE.sub(" ", text)
+
+
+def blank_literals(script: str) -> str:
+    """``script`` with comments and the contents of string literals replaced by spaces."""
+    return _LITERAL.sub(_blank, script)
+
+
+def _closing(code: str, start: int, opening: str) -> int:
+    """Index just past the bracket matching the ``(`` or ``{`` at ``start``."""
+    depth = 0
+    for match in _BRACKETS[opening].finditer(code, start):
+        depth += 1 if match.group() == opening else -1
+        if depth == 0:
+            return match.end()
+    return len(code)
+
+
+def _loop_bodies(code: str) -> Iterator[Tuple[int, int]]:
+    for match in _LOOP.finditer(code):
+        header_end = _closing(code, match.end() - 1, "(")
+        if match.group().startswith("."):
+            # forEach(function () {...}): the callback is the body.
+            yield match.end(), header_end
+            continue
+        body = header_end
+        while body < len(code) and code[body].isspace():
+            body += 1
+        if body < len(code) and code[body] == "{":
+            yield body, _closing(code, body, "{")
+        else:
+            end = code.find(";", body)
+            yield body, len(code) if end < 0 else end
+
+
+def _line(code: str, index: int) -> int:
+    return code.count("\n", 0, index) + 1
+
+
+def analyze_script(script: Optional[str]) -> List[Dict]:
+    """Issues found in one script, as ``{"check", "line"}`` in order of appearance."""
+    if not script:
+        return []
+    code = blank_literals(script)
+    issues = set()
+    for start, end in _loop_bodies(code):
+        for match in _QUERY.finditer(code, start, end):
+            issues.add((QUERY_IN_LOOP, _line(code, match.start())))
+    for check, pattern in ((GET_ROW_COUNT, _GET_ROW_COUNT), (SYNC_AJAX, _SYNC_AJAX), (CURRENT_UPDATE, _CURRENT_UPDATE)):
+        for match in pattern.finditer(code):
+            issues.add((check, _line(code, match.start())))
+    return [{"check": check, "line": line} for check, line in sorted(issues, key=lambda issue: (issue[1], issue[0]))]
+
+
+def analyze_batch(scripts: Sequence[str]) -> List[List[Dict]]:
+    """``analyze_script`` over a batch, so one round trip to the pool covers many scripts."""
+    return [analyze_script(script) for script in scripts]
@@ -0,0 +1,297 @@
+"""Append-only, memory-mapped storage for semantic cache entries.
+
+The store is a directory shared by every worker process on a host::
+
+    CURRENT               number of the live generation
+    lock                  flock(2) target serializing writers
+    gen-000001/
+        meta.json         {"dim": <embedding dimension>}
+        embeddings.f32    float32 rows, one per entry, in row order
+        payloads.bin      UTF-8 response payloads, back to back
+        entries.jsonl     one record per line: entry additions and deletions
+
+Readers map ``embeddings.f32`` and ``payloads.bin`` read-only, so every worker
+scores against the same page-cache pages without copying them. Writers append
+the payload and the embedding first and only then the index line, so a crash
+can at worst leave unreferenced bytes behind; partial trailing rows and lines
+are trimmed by the next writer. Compaction rewrites the live entries into a new
+generation and switches ``CURRENT`` atomically.
+"""
+import fcntl
+import json
+import os
+import shutil
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+class MmapSemanticStore:
+    """On-disk, multi-process store of (embedding, payload) entries."""
+
+    def __init__(self, path: str, fsync: bool = True, compact_min: int = 1024):
+        self.path = path
+        self.fsync = fsync
+        self.compact_min = compact_min
+        os.makedirs(path, exist_ok=True)
+
+        self.generation: Optional[int] = None
+        self.dim: Optional[int] = None
+        self.embeddings: Optional[np.ndarray] = None
+        self.rows = 0
+        self.live = 0
+        self.dead = 0
+        self._payloads: Optional[np.ndarray] = None
+        self._index_offset = 0
+        self._seen: Optional[Tuple] = None
+
+    # Layout helpers
+
+    def _gen_dir(self, generation: int) -> str:
+        return os.path.join(self.path, f"gen-{generation:06d}")
+
+    def _file(self, name: str, generation: Optional[int] = None) -> str:
+        gen = self.generation if generation is None else generation
+        return os.path.join(self._gen_dir(gen), name)
+
+    def _current(self) -> int:
+        try:
+            with open(os.path.join(self.path, "CURRENT")) as fh:
+                return int(fh.read().strip() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def _read_dim(self, generation: int) -> Optional[int]:
+        try:
+            with open(self._file("meta.json", generation)) as fh:
+                return int(json.load(fh)["dim"])
+        except (FileNotFoundError, ValueError, KeyError):
+            return None
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        with open(os.path.join(self.path, "lock"), "a+") as fh:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+
+    def _sync_file(self, fh) -> None:
+        fh.flush()
+        if self.fsync:
+            os.fsync(fh.fileno())
+
+    # Reading
+
+    @staticmethod
+    def _stat(path: str) -> Optional[Tuple[int, int, int]]:
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_size, st.st_mtime_ns
+
+    def _stamp(self) -> Tuple:
+        """What ``refresh`` reads, in two stats: ``CURRENT`` and the loaded generation's index."""
+        index = None if self.generation is None else self._stat(self._file("entries.jsonl"))
+        return self._stat(os.path.join(self.path, "CURRENT")), index
+
+    def refresh(self) -> Tuple[bool, List[Dict]]:
+        """Read index records appended since the last call.
+
+        Returns ``(reset, records)``. ``reset`` is true when the generation
+        changed (first call or after a compaction), in which case ``records``
+        is the full index of the new generation and row numbers restart.
+        Returns early, without reading anything, when neither ``CURRENT``
+        nor the index has changed since the last call.
+        """
+        stamp = self._stamp()
+        if stamp == self._seen:
+            return False, []
+        generation = self._current()
+        reset = generation != self.generation
+        if reset:
+            self.generation = generation
+            self.dim = self._read_dim(generation)
+            self.embeddings = None
+            self._payloads = None
+            self.rows = 0
+            self.live = 0
+            self.dead = 0
+            self._index_offset = 0
+            stamp = self._stamp()
+        # Taken before reading, so anything appended meanwhile is read next time.
+        self._seen = stamp
+        records = self._read_index()
+        if records or reset:
+            self._remap()
+        return reset, records
+
+    def _read_index(self) -> List[Dict]:
+        try:
+            with open(self._file("entries.jsonl"), "rb") as fh:
+                fh.seek(self._index_offset)
+                data = fh.read()
+        except FileNotFoundError:
+            return []
+        end = data.rfind(b"\n")
+        if end < 0:
+            return []
+        self._index_offset += end + 1
+        records = []
+        for line in data[:end].split(b"\n"):
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get("op") == "add":
+                self.live += 1
+            elif record.get("op") == "del":
+                self.live -= 1
+                self.dead += 1
+            records.append(record)
+        return records
+
+    def _remap(self) -> None:
+        if self.dim is None:
+            self.dim = self._read_dim(self.generation)
+        if self.dim is None:
+            return
+        try:
+            rows = os.path.getsize(self._file("embeddings.f32")) // (self.dim * 4)
+            payload_size = os.path.getsize(self._file("payloads.bin"))
+        except FileNotFoundError:
+            return
+        if rows and rows != self.rows:
+            self.embeddings = np.memmap(
+                self._file("embeddings.f32"), dtype=np.float32, mode="r", shape=(rows, self.dim)
+            )
+            self.rows = rows
+        if payload_size and (self._payloads is None or payload_size != self._payloads.shape[0]):
+            self._payloads = np.memmap(self._file("payloads.bin"), dtype=np.uint8, mode="r")
+
+    def read_value(self, offset: int, length: int) -> str:
+        if not length:
+            return ""
+        if self._payloads is None or offset + length > self._payloads.shape[0]:
+            self._remap()
+        return bytes(self._payloads[offset:offset + length]).decode("utf-8")
+
+    # Writing
+
+    def _trim_partial_rows(self, generation: int, row_bytes: int) -> None:
+        emb_path = self._file("embeddings.f32", generation)
+        size = os.path.getsize(emb_path) if os.path.exists(emb_path) else 0
+        if size % row_bytes:
+            os.truncate(emb_path, size - size % row_bytes)
+
+    def _append_records(self, generation: int, records: Sequence[Dict]) -> None:
+        index_path = self._file("entries.jsonl", generation)
+        with open(index_path, "ab+") as fh:
+            size = fh.seek(0, os.SEEK_END)
+            if size:
+                fh.seek(size - 1)
+                if fh.read(1) != b"\n":
+                    # Drop a torn line left behind by a writer that crashed mid-append.
+                    fh.seek(0)
+                    fh.truncate(fh.read().rfind(b"\n") + 1)
+            fh.write(b"".join(json.dumps(record).encode("utf-8") + b"\n" for record in records))
+            self._sync_file(fh)
+
+    def append(self, key: str, vec: np.ndarray, value: str, ts: float) -> None:
+        """Durably append an entry; it becomes visible on the next ``refresh``."""
+        vec = np.ascontiguousarray(vec, dtype=np.float32)
+        payload = value.encode("utf-8")
+        with self._locked():
+            generation = self._current()
+            gen_dir = self._gen_dir(generation)
+            os.makedirs(gen_dir, exist_ok=True)
+            dim = self._read_dim(generation)
+            if dim is None:
+                dim = vec.shape[0]
+                with open(self._file("meta.json", generation), "w") as fh:
+                    json.dump({"dim": dim}, fh)
+                    self._sync_file(fh)
+            elif vec.shape[0] != dim:
+                raise ValueError(f"Embedding dimension {vec.shape[0]} does not match store dimension {dim}")
+            self._trim_partial_rows(generation, dim * 4)
+
+            with open(self._file("payloads.bin", generation), "ab") as fh:
+                offset = fh.tell()
+                fh.write(payload)
+                self._sync_file(fh)
+            with open(self._file("embeddings.f32", generation), "ab") as fh:
+                row = fh.tell() // (dim * 4)
+                fh.write(vec.tobytes())
+                self._sync_file(fh)
+            self._append_records(
+                generation,
+                [{"op": "add", "row": row, "key": key, "ts": ts, "off": offset, "len": len(payload)}],
+            )
+
+    def delete(self, rows: Sequence[int], generation: int) -> None:
+        """Tombstone ``rows`` of ``generation``, with one flush and fsync for all of them."""
+        with self._locked():
+            if self._current() != generation:
+                # Rows were renumbered by a compaction; the reader will reload.
+                return
+            self._append_records(generation, [{"op": "del", "row": row} for row in rows])
+
+    def should_compact(self) -> bool:
+        return self.dead >= self.compact_min and self.dead >= self.live
+
+    def compact(self) -> None:
+        """Rewrite live entries into a new generation and switch to it."""
+        with self._locked():
+            generation = self._current()
+            dim = self._read_dim(generation)
+            if dim is None:
+                return
+            entries: Dict[int, Dict] = {}
+            with open(self._file("entries.jsonl", generation), "rb") as fh:
+                for line in fh:
+                    if not line.endswith(b"\n"):
+                        break
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    if record.get("op") == "add":
+                        entries[record["row"]] = record
+                    elif record.get("op") == "del":
+                        entries.pop(record["row"], None)
+
+            old_emb = np.memmap(self._file("embeddings.f32", generation), dtype=np.float32, mode="r")
+            old_emb = old_emb[: old_emb.shape[0] // dim * dim].reshape(-1, dim)
+            with open(self._file("payloads.bin", generation), "rb") as fh:
+                old_payloads = fh.read()
+
+            new_gen = generation + 1
+            new_dir = self._gen_dir(new_gen)
+            shutil.rmtree(new_dir, ignore_errors=True)
+            os.makedirs(new_dir)
+            with open(self._file("meta.json", new_gen), "w") as meta, \
+                    open(self._file("embeddings.f32", new_gen), "wb") as emb, \
+                    open(self._file("payloads.bin", new_gen), "wb") as payloads, \
+                    open(self._file("entries.jsonl", new_gen), "wb") as index:
+                json.dump({"dim": dim}, meta)
+                for new_row, (old_row, record) in enumerate(sorted(entries.items())):
+                    data = old_payloads[record["off"]:record["off"] + record["len"]]
+                    emb.write(np.ascontiguousarray(old_emb[old_row]).tobytes())
+                    offset = payloads.tell()
+                    payloads.write(data)
+                    record = dict(record, row=new_row, off=offset)
+                    index.write(json.dumps(record).encode("utf-8") + b"\n")
+                for fh in (meta, emb, payloads, index):
+                    self._sync_file(fh)
+
+            tmp = os.path.join(self.path, "CURRENT.tmp")
+            with open(tmp, "w") as fh:
+                fh.write(str(new_gen))
+                self._sync_file(fh)
+            os.replace(tmp, os.path.join(self.path, "CURRENT"))
+            del old_emb
+            # Other workers keep their existing mappings valid after the unlink.
+            shutil.rmtree(self._gen_dir(generation), ignore_errors=True)
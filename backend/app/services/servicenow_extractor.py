@@ -0,0 +1,405 @@
+"""Bulk extraction from a ServiceNow instance's Table API.
+
+``ServiceNowExtractor.sync`` pulls a set of tables into NDJSON files under
+``<root>/<instance>/<table>/``. The first sync of a table reads all of it;
+later syncs read only rows whose ``sys_updated_on`` is past the watermark
+stored for that instance and table. Watermarks live in the shared database
+but extracts are local to each node, so a node without a full extract of a
+table reads all of it whatever the watermark says.
+
+Each table is read over a window of ``sys_updated_on`` that ends ``lag``
+seconds in the past. The window is cut into time slices read concurrently.
+Each slice pages by keyset on ``(sys_updated_on, sys_id)``, so rows updated
+during the pull cannot shift pages the way they do with offsets. Page size
+adapts to how long the instance takes per page. A 429 pauses every request
+to that instance for its ``Retry-After``. 5xx responses and timeouts are
+retried with backoff on a smaller page.
+
+Pages are written to disk as they arrive. A table's file is moved into
+place, and its watermark advanced, only once the whole table has been
+read, so a failed sync is simply repeated from the old watermark.
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import re
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import IO, Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+from sqlalchemy.exc import IntegrityError
+
+from ..models.database import ServiceNowWatermark, SessionLocal
+
+logger = logging.getLogger(__name__)
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+DEFAULT_TABLES = (
+    "sys_script",
+    "sys_script_include",
+    "sys_ui_policy",
+    "sys_ui_action",
+    "sys_script_client",
+    "sys_properties",
+)
+_UNSAFE = re.compile(r"[^A-Za-z0-9_.-]")
+
+
+class ServiceNowError(Exception):
+    """A Table API request failed for good."""
+
+
+class ServiceNowAuthError(ServiceNowError):
+    """The instance rejected the credentials."""
+
+
+class TableUnavailable(ServiceNowError):
+    """The table does not exist or the user may not read it."""
+
+
+@dataclass
+class Page:
+    data: bytes  # the rows as NDJSON
+    count: int
+    last: Optional[Tuple[str, str]]  # (sys_updated_on, sys_id) of the last row
+
+
+def encode_page(content: bytes) -> Page:
+    rows = json.loads(content)["result"]
+    data = "".join(json.dumps(row, separators=(",", ":")) + "\n" for row in rows).encode("utf-8")
+    last = (rows[-1]["sys_updated_on"], rows[-1]["sys_id"]) if rows else None
+    return Page(data, len(rows), last)
+
+
+@dataclass
+class PageSizer:
+    """Grows pages while the instance answers quickly and shrinks them when it struggles."""
+
+    size: int
+    minimum: int
+    maximum: int
+    target: float  # seconds a page should take
+
+    def observe(self, elapsed: float, requested: int, rows: int) -> None:
+        if elapsed > self.target:
+            self.size = max(self.minimum, min(self.size, int(requested * self.target / elapsed)))
+        elif elapsed < self.target / 2 and rows >= requested:
+            self.size = min(self.maximum, max(self.size, requested * 2))
+
+    def shrink(self) -> None:
+        self.size = max(self.minimum, self.size // 2)
+
+
+def time_slices(lo: str, latest: str, count: int, hi: Optional[str] = None) -> List[Tuple[str, str]]:
+    """Split ``(lo, latest]`` into up to ``count`` whole-second slices.
+
+    The last slice runs on to ``hi`` to catch rows updated since ``latest``.
+    """
+    start = datetime.strptime(lo, TIME_FORMAT)
+    end = datetime.strptime(latest, TIME_FORMAT)
+    seconds = int((end - start).total_seconds())
+    count = max(1, min(count, seconds))
+    bounds = [start + timedelta(seconds=seconds * i // count) for i in range(count)] + [end]
+    slices = [(a.strftime(TIME_FORMAT), b.strftime(TIME_FORMAT)) for a, b in zip(bounds, bounds[1:])]
+    if hi is not None:
+        slices[-1] = (slices[-1][0], hi)
+    return slices
+
+
+class ServiceNowExtractor:
+    def __init__(
+        self,
+        client: Optional[httpx.AsyncClient] = None,
+        root: Optional[str] = None,
+        session_factory=SessionLocal,
+        max_connections: Optional[int] = None,
+        partitions: Optional[int] = None,
+        page_size: Optional[int] = None,
+        min_page_size: Optional[int] = None,
+        max_page_size: Optional[int] = None,
+        page_target: Optional[float] = None,
+        lag: Optional[float] = None,
+        max_retries: Optional[int] = None,
+        backoff: Optional[float] = None,
+    ):
+        self.max_connections = max_connections or int(os.getenv("SERVICENOW_MAX_CONNECTIONS", "8"))
+        if client is None:
+            client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=self.max_connections, max_keepalive_connections=self.max_connections
+                ),
+                timeout=float(os.getenv("SERVICENOW_TIMEOUT_SECONDS", "120")),
+            )
+        self.client = client
+        self.root = root or os.getenv("SERVICENOW_EXTRACT_DIR", os.path.join("storage", "extracts"))
+        self._session_factory = session_factory
+        self.partitions = partitions or int(os.getenv("SERVICENOW_PARTITIONS", "4"))
+        self.page_size = page_size or int(os.getenv("SERVICENOW_PAGE_SIZE", "1000"))
+        self.min_page_size = min_page_size or int(os.getenv("SERVICENOW_MIN_PAGE_SIZE", "100"))
+        self.max_page_size = max_page_size or int(os.getenv("SERVICENOW_MAX_PAGE_SIZE", "10000"))
+        self.page_target = page_target or float(os.getenv("SERVICENOW_PAGE_TARGET_SECONDS", "2"))
+        self.lag = lag if lag is not None else float(os.getenv("SERVICENOW_WATERMARK_LAG_SECONDS", "60"))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv("SERVICENOW_MAX_RETRIES", "8"))
+        self.backoff = backoff if backoff is not None else float(os.getenv("SERVICENOW_BACKOFF_SECONDS", "1"))
+        # Waiting here, rather than in the client's pool, keeps queued requests from timing out.
+        self._requests = asyncio.Semaphore(self.max_connections)
+        self._paused_until: Dict[str, float] = {}
+
+    async def sync(
+        self,
+        instance_url: str,
+        username: str,
+        password: str,
+        tables: Sequence[str] = DEFAULT_TABLES,
+        full: bool = False,
+        progress: Optional[Callable[[float], Awaitable[None]]] = None,
+    ) -> Dict[str, Dict[str, Any]]:
+        """Bring the local copy of ``tables`` up to date; return a summary per table.
+
+        Tables the user cannot read are reported with an ``error`` instead of
+        failing the sync. ``full`` ignores the stored watermarks.
+        """
+        base = instance_url.rstrip("/")
+        instance = urlsplit(base).netloc or base
+        hi = (datetime.utcnow() - timedelta(seconds=self.lag)).strftime(TIME_FORMAT)
+        auth = (username, password)
+        summary: Dict[str, Dict[str, Any]] = {}
+
+        async def one(table: str) -> None:
+            try:
+                summary[table] = await self._sync_table(base, instance, table, auth, hi, full)
+            except TableUnavailable as exc:
+                summary[table] = {"error": str(exc)}
+            if progress is not None:
+                await progress(len(summary) / len(tables))
+
+        try:
+            async with asyncio.TaskGroup() as group:
+                for table in tables:
+                    group.create_task(one(table))
+        except BaseExceptionGroup as errors:
+            raise _first_error(errors) from None
+        return {table: summary[table] for table in tables}
+
+    async def _sync_table(
+        self, base: str, instance: str, table: str, auth: Tuple[str, str], hi: str, full: bool
+    ) -> Dict[str, Any]:
+        # A delta is only useful on top of a full extract; this node may never have pulled one.
+        full = full or not any(name.endswith("-full.ndjson") for name in self.table_files(base, table))
+        watermark = None if full else await asyncio.to_thread(self._watermark, instance, table)
+        mode = "full" if watermark is None else "delta"
+        lo, latest = await self._bounds(base, table, auth, watermark, hi)
+        rows, path = 0, None
+        if latest is not None:
+            directory = self.table_dir(base, table)
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, f"{datetime.utcnow():%Y%m%dT%H%M%S}-{mode}.ndjson")
+            sizer = PageSizer(self.page_size, self.min_page_size, self.max_page_size, self.page_target)
+            lock = asyncio.Lock()
+            try:
+                with open(path + ".part", "wb") as handle:
+                    async with asyncio.TaskGroup() as group:
+                        slices = [
+                            group.create_task(self._read_slice(base, table, auth, a, b, sizer, handle, lock))
+                            for a, b in time_slices(lo, latest, self.partitions, hi)
+                        ]
+                rows = sum(task.result() for task in slices)
+            except BaseException as exc:
+                os.remove(path + ".part")
+                if isinstance(exc, BaseExceptionGroup):
+                    raise _first_error(exc) from None
+                raise
+            if rows:
+                os.replace(path + ".part", path)
+            else:
+                os.remove(path + ".part")
+                path = None
+        await asyncio.to_thread(self._advance, instance, table, hi, rows)
+        return {"mode": mode, "rows": rows, "path": path, "watermark": hi}
+
+    def table_dir(self, instance_url: str, table: str) -> str:
+        instance = urlsplit(instance_url.rstrip("/")).netloc or instance_url
+        return os.path.join(self.root, _UNSAFE.sub("_", instance), table)
+
+    def table_files(self, instance_url: str, table: str) -> List[str]:
+        """The extracts that make up a table now: its latest full pull and the deltas since, oldest first."""
+        try:
+            names = sorted(name for name in os.listdir(self.table_dir(instance_url, table)) if name.endswith(".ndjson"))
+        except FileNotFoundError:
+            return []
+        fulls = [i for i, name in enumerate(names) if name.endswith("-full.ndjson")]
+        names = names[fulls[-1]:] if fulls else names
+        return [os.path.join(self.table_dir(instance_url, table), name) for name in names]
+
+    async def _bounds(
+        self, base: str, table: str, auth: Tuple[str, str], watermark: Optional[str], hi: str
+    ) -> Tuple[str, Optional[str]]:
+        """Where the rows of the window (watermark, hi] start and end; None if there are none.
+
+        Slicing between the oldest and newest rows, rather than over the
+        whole window, keeps every slice busy when the data is clustered.
+        """
+        probe = PageSizer(1, 1, 1, 0)
+        window = f"sys_updated_on>{watermark}^" if watermark else ""
+        newest = await self._get(base, table, auth, f"{window}sys_updated_on<={hi}^ORDERBYDESCsys_updated_on", probe)
+        if newest.last is None:
+            return hi, None
+        if watermark is not None:
+            return watermark, newest.last[0]
+        oldest = await self._get(base, table, auth, f"sys_updated_on<={hi}^ORDERBYsys_updated_on", probe)
+        before = datetime.strptime(oldest.last[0], TIME_FORMAT) - timedelta(seconds=1)
+        return before.strftime(TIME_FORMAT), newest.last[0]
+
+    async def _read_slice(
+        self,
+        base: str,
+        table: str,
+        auth: Tuple[str, str],
+        lo: str,
+        hi: str,
+        sizer: PageSizer,
+        handle: IO[bytes],
+        lock: asyncio.Lock,
+    ) -> int:
+        rows = 0
+        query = f"sys_updated_on>{lo}^sys_updated_on<={hi}^ORDERBYsys_updated_on^ORDERBYsys_id"
+        while True:
+            page = await self._get(base, table, auth, query, sizer)
+            # Pages may come back shorter than asked (the instance caps them), so only an empty one ends the slice.
+            if not page.count:
+                return rows
+            async with lock:
+                await asyncio.to_thread(handle.write, page.data)
+            rows += page.count
+            updated, sys_id = page.last
+            query = (
+                f"sys_updated_on>{updated}^sys_updated_on<={hi}"
+                f"^NQsys_updated_on={updated}^sys_id>{sys_id}^ORDERBYsys_updated_on^ORDERBYsys_id"
+            )
+
+    async def _get(self, base: str, table: str, auth: Tuple[str, str], query: str, sizer: PageSizer) -> Page:
+        url = f"{base}/api/now/table/{table}"
+        error: Exception = ServiceNowError(f"{url} failed")
+        for attempt in range(self.max_retries + 1):
+            await self._wait_for(base)
+            requested = sizer.size
+            params = {
+                "sysparm_query": query,
+                "sysparm_limit": requested,
+                "sysparm_no_count": "true",
+                "sysparm_exclude_reference_link": "true",
+            }
+            async with self._requests:
+                started = time.monotonic()
+                try:
+                    response = await self.client.get(
+                        url, params=params, auth=auth, headers={"Accept": "application/json"}
+                    )
+                except httpx.TransportError as exc:
+                    response, error = None, exc
+                elapsed = time.monotonic() - started
+            if response is not None:
+                if response.status_code == 200:
+                    page = await asyncio.to_thread(encode_page, response.content)
+                    sizer.observe(elapsed, requested, page.count)
+                    return page
+                if response.status_code == 401:
+                    raise ServiceNowAuthError(f"{base} rejected the credentials")
+                if response.status_code in (403, 404) or (
+                    response.status_code == 400 and "Invalid table" in response.text
+                ):
+                    raise TableUnavailable(f"{table} is not readable ({response.status_code})")
+                if response.status_code == 429:
+                    delay = _retry_after(response) or self._backoff(attempt)
+                    logger.info("%s is rate limiting; pausing %.1fs", base, delay)
+                    self._paused_until[base] = max(self._paused_until.get(base, 0.0), time.monotonic() + delay)
+                    error = ServiceNowError(f"{base} kept rate limiting requests")
+                    continue
+                if response.status_code < 500:
+                    raise ServiceNowError(f"{url} returned {response.status_code}: {response.text[:200]}")
+                error = ServiceNowError(f"{url} returned {response.status_code}")
+            logger.warning("Reading %s failed (attempt %d): %s", table, attempt + 1, error)
+            sizer.shrink()
+            await asyncio.sleep(self._backoff(attempt))
+        raise error
+
+    async def _wait_for(self, base: str) -> None:
+        while True:
+            delay = self._paused_until.get(base, 0.0) - time.monotonic()
+            if delay <= 0:
+                return
+            await asyncio.sleep(delay)
+
+    def _backoff(self, attempt: int) -> float:
+        return min(60.0, self.backoff * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+    # Watermarks; each helper runs in a worker thread with its own session.
+
+    def _watermark(self, instance: str, table: str) -> Optional[str]:
+        with self._session_factory() as db:
+            return (
+                db.query(ServiceNowWatermark.watermark)
+                .filter(ServiceNowWatermark.instance == instance, ServiceNowWatermark.table_name == table)
+                .scalar()
+            )
+
+    def _advance(self, instance: str, table: str, watermark: str, rows: int) -> None:
+        now = datetime.utcnow()
+        with self._session_factory() as db:
+            updated = (
+                db.query(ServiceNowWatermark)
+                .filter(ServiceNowWatermark.instance == instance, ServiceNowWatermark.table_name == table)
+                .update(
+                    {
+                        ServiceNowWatermark.watermark: watermark,
+                        ServiceNowWatermark.rows: rows,
+                        ServiceNowWatermark.synced_at: now,
+                    },
+                    synchronize_session=False,
+                )
+            )
+            if not updated:
+                db.add(
+                    ServiceNowWatermark(
+                        instance=instance, table_name=table, watermark=watermark, rows=rows, synced_at=now
+                    )
+                )
+            try:
+                db.commit()
+            except IntegrityError:
+                # A concurrent sync of the same table inserted first; it covered the same window.
+                db.rollback()
+
+
+def _first_error(errors: BaseExceptionGroup) -> BaseException:
+    error = errors.exceptions[0]
+    return _first_error(error) if isinstance(error, BaseExceptionGroup) else error
+
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    try:
+        return max(0.0, float(response.headers["Retry-After"]))
+    except (KeyError, ValueError):
+        return None
+
+
+_extractor: Optional[ServiceNowExtractor] = None
+
+
+def get_servicenow_extractor() -> ServiceNowExtractor:
+    global _extractor
+    if _extractor is None:
+        _extractor = ServiceNowExtractor()
+    return _extractor
+
+
+async def close_servicenow_extractor() -> None:
+    global _extractor
+    if _extractor is not None:
+        await _extractor.client.aclose()
+        _extractor = None
@@ -0,0 +1,93 @@
+"""Streaming upload storage.
+
+Uploaded files are copied to disk in fixed-size chunks. Each write, and the
+SHA-256 update in the same pass, runs in a worker thread, so a large upload
+never blocks the event loop. The per-tier size limit is checked as bytes
+arrive. The data lands in a hidden temp file in the destination directory
+and is renamed into place only once it is complete, so readers never see a
+partial file.
+"""
+import asyncio
+import hashlib
+import os
+from dataclasses import dataclass
+from typing import BinaryIO, Dict, Optional
+
+from fastapi import UploadFile
+
+MB = 1024 * 1024
+DEFAULT_TIER_LIMITS = {"starter": 25 * MB, "professional": 100 * MB, "enterprise": 500 * MB}
+
+
+class UploadTooLarge(Exception):
+    def __init__(self, limit: int):
+        super().__init__(f"File exceeds the {limit // MB} MB upload limit for this plan")
+        self.limit = limit
+
+
+@dataclass
+class StoredUpload:
+    path: str
+    size: int
+    sha256: str
+
+
+def tier_limits() -> Dict[str, int]:
+    """Upload limits per tier, overridable as ``UPLOAD_TIER_LIMITS_MB=starter=50,...``."""
+    limits = dict(DEFAULT_TIER_LIMITS)
+    for item in os.getenv("UPLOAD_TIER_LIMITS_MB", "").split(","):
+        tier, sep, value = item.partition("=")
+        if sep and tier.strip():
+            limits[tier.strip()] = int(float(value) * MB)
+    return limits
+
+
+def max_upload_bytes(tier: Optional[str]) -> int:
+    limits = tier_limits()
+    return limits.get(tier or "", limits["starter"])
+
+
+def _write_chunk(fh: BinaryIO, digest, chunk: bytes) -> None:
+    # hashlib releases the GIL for large buffers, so hashing here is truly off-loop.
+    digest.update(chunk)
+    fh.write(chunk)
+
+
+def _finish(fh: BinaryIO, tmp_path: str, path: str) -> None:
+    fh.flush()
+    os.fsync(fh.fileno())
+    fh.close()
+    os.replace(tmp_path, path)
+
+
+def _discard(fh: BinaryIO, tmp_path: str) -> None:
+    fh.close()
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+
+async def save_upload(
+    upload: UploadFile, directory: str, filename: str, max_bytes: int, chunk_size: Optional[int] = None
+) -> StoredUpload:
+    """Stream ``upload`` to ``directory/filename``; raise ``UploadTooLarge`` past ``max_bytes``."""
+    chunk_size = chunk_size or int(os.getenv("UPLOAD_CHUNK_BYTES", str(MB)))
+    await asyncio.to_thread(os.makedirs, directory, exist_ok=True)
+    path = os.path.join(directory, filename)
+    tmp_path = os.path.join(directory, f".{filename}.part")
+    fh = await asyncio.to_thread(open, tmp_path, "wb")
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        while True:
+            chunk = await upload.read(chunk_size)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_bytes:
+                raise UploadTooLarge(max_bytes)
+            await asyncio.to_thread(_write_chunk, fh, digest, chunk)
+        await asyncio.to_thread(_finish, fh, tmp_path, path)
+    except BaseException:
+        await asyncio.to_thread(_discard, fh, tmp_path)
+        raise
+    return StoredUpload(path=path, size=size, sha256=digest.hexdigest())
@@ -0,0 +1,324 @@
+"""Nearest-neighbour indexes over the rows of a semantic cache matrix.
+
+An index only tracks row numbers; the vectors themselves stay in the cache's
+matrix (in memory or memory-mapped), which is passed to every call. All
+vectors are expected to be L2-normalized, so inner product is cosine
+similarity.
+"""
+import os
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+class VectorIndex:
+    """Interface shared by the semantic cache indexes."""
+
+    def add(self, row: int, vectors: np.ndarray) -> None:
+        raise NotImplementedError
+
+    def remove(self, row: int) -> None:
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+    def search(self, vectors: np.ndarray, query: np.ndarray) -> Tuple[int, float]:
+        """Return ``(row, score)`` of the best match, or ``(-1, -inf)`` if empty."""
+        raise NotImplementedError
+
+    def search_k(self, vectors: np.ndarray, query: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Return up to ``k`` ``(rows, scores)``, best first."""
+        raise NotImplementedError
+
+    def training_due(self) -> bool:
+        """Whether the index should be (re)trained; see ``IVFIndex``."""
+        return False
+
+
+def top_k(rows: np.ndarray, scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    if scores.shape[0] > k:
+        part = np.argpartition(-scores, k - 1)[:k]
+        rows, scores = rows[part], scores[part]
+    order = np.argsort(-scores, kind="stable")
+    return rows[order], scores[order]
+
+
+class ExactIndex(VectorIndex):
+    """Brute-force scan: one matrix-vector product over every live row."""
+
+    def __init__(self):
+        self._live = np.zeros(0, dtype=bool)
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def add(self, row: int, vectors: np.ndarray) -> None:
+        if row >= self._live.shape[0]:
+            grown = np.zeros(max(row + 1, self._live.shape[0] * 2, 1024), dtype=bool)
+            grown[:self._live.shape[0]] = self._live
+            self._live = grown
+        if not self._live[row]:
+            self._live[row] = True
+            self._count += 1
+
+    def remove(self, row: int) -> None:
+        if row < self._live.shape[0] and self._live[row]:
+            self._live[row] = False
+            self._count -= 1
+
+    def clear(self) -> None:
+        self._live = np.zeros(0, dtype=bool)
+        self._count = 0
+
+    def search(self, vectors: np.ndarray, query: np.ndarray) -> Tuple[int, float]:
+        if not self._count:
+            return -1, float("-inf")
+        rows = min(self._live.shape[0], vectors.shape[0])
+        scores = vectors[:rows] @ query
+        scores[~self._live[:rows]] = -np.inf
+        best = int(np.argmax(scores))
+        return best, float(scores[best])
+
+    def search_k(self, vectors: np.ndarray, query: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        if not self._count or k <= 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        limit = min(self._live.shape[0], vectors.shape[0])
+        rows = np.flatnonzero(self._live[:limit])
+        return top_k(rows, np.asarray(vectors[:limit] @ query)[rows], k)
+
+
+class Training:
+    """One training run: the rows it trains on, and what changed while it ran."""
+
+    def __init__(self, rows: np.ndarray):
+        self.rows = rows
+        self.changes: List[Tuple[str, int]] = []
+        self.result: Optional[Tuple[np.ndarray, List[np.ndarray], List[int], Dict[int, Tuple[int, int]]]] = None
+
+
+class IVFIndex(VectorIndex):
+    """Inverted-file index: rows are bucketed by their nearest k-means centroid.
+
+    A query scores the centroids, then scans only the ``nprobe`` closest
+    buckets. Raising ``nprobe`` trades latency for recall; ``nprobe == nlist``
+    is an exact scan. Until ``train_size`` rows have been added the index
+    falls back to an exact scan. It is due for retraining once it has grown
+    by ``retrain_factor`` since the last training, or once ``retrain_churn``
+    times as many rows as it was trained on have been added since, as in a
+    full cache whose entries keep being replaced.
+
+    ``add`` never trains. Callers check ``training_due`` and either call
+    ``train``, or run the k-means step elsewhere: ``begin_training`` on the
+    caller's thread, ``fit`` on any thread, then ``install`` on the caller's
+    thread again. Searches keep using the old buckets until ``install``,
+    which also replays the adds and removes made while ``fit`` ran.
+    """
+
+    def __init__(
+        self,
+        nlist: int = 256,
+        nprobe: int = 16,
+        train_size: Optional[int] = None,
+        retrain_factor: float = 4.0,
+        retrain_churn: float = 1.0,
+        iterations: int = 10,
+        seed: int = 0,
+    ):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.train_size = train_size if train_size is not None else nlist * 32
+        self.retrain_factor = retrain_factor
+        self.retrain_churn = retrain_churn
+        self.iterations = iterations
+        self._rng = np.random.default_rng(seed)
+        self.centroids: Optional[np.ndarray] = None
+        self._trained_at = 0
+        self._added_since = 0  # rows added since the last training
+        self._training: Optional[Training] = None
+        self._lists: List[np.ndarray] = []
+        self._list_sizes: List[int] = []
+        self._where: Dict[int, Tuple[int, int]] = {}  # row -> (list, position)
+        self._untrained = ExactIndex()
+
+    def __len__(self) -> int:
+        return len(self._where) if self.centroids is not None else len(self._untrained)
+
+    def _live_rows(self) -> np.ndarray:
+        if self.centroids is None:
+            return np.flatnonzero(self._untrained._live)
+        return np.fromiter(self._where.keys(), dtype=np.int64, count=len(self._where))
+
+    def training_due(self) -> bool:
+        if self._training is not None:
+            return False
+        if self.centroids is None:
+            return len(self._untrained) >= self.train_size
+        return (
+            len(self._where) >= self._trained_at * self.retrain_factor
+            or self._added_since >= self._trained_at * self.retrain_churn
+        )
+
+    def train(self, vectors: np.ndarray) -> None:
+        """Fit centroids with spherical k-means and reassign every live row."""
+        training = self.begin_training()
+        self.fit(vectors, training)
+        self.install(training, vectors)
+
+    def begin_training(self) -> Training:
+        """Snapshot the live rows to train on; adds and removes from now on are recorded for ``install``."""
+        self._training = Training(self._live_rows())
+        return self._training
+
+    def fit(self, vectors: np.ndarray, training: Training) -> None:
+        """Run k-means over ``training.rows`` and bucket them; reads no other index state."""
+        rows = training.rows
+        if rows.shape[0] == 0:
+            return
+        nlist = min(self.nlist, rows.shape[0])
+        sample = rows
+        if rows.shape[0] > nlist * 64:
+            sample = self._rng.choice(rows, nlist * 64, replace=False)
+        data = np.asarray(vectors[np.sort(sample)], dtype=np.float32)
+        centroids = data[self._rng.choice(data.shape[0], nlist, replace=False)].copy()
+        for _ in range(self.iterations):
+            assign = np.argmax(data @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, data)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            empty = norms[:, 0] == 0
+            # Reseed empty clusters from random points so no bucket stays dead.
+            sums[empty] = data[self._rng.choice(data.shape[0], int(empty.sum()))]
+            norms[empty] = 1.0
+            centroids = sums / norms
+
+        assign = np.concatenate(
+            [
+                np.argmax(np.asarray(vectors[rows[start:start + 8192]]) @ centroids.T, axis=1)
+                for start in range(0, rows.shape[0], 8192)
+            ]
+        )
+        order = np.argsort(assign, kind="stable")
+        sizes = np.bincount(assign, minlength=nlist)
+        lists, where = [], {}
+        for bucket, members in enumerate(np.split(rows[order], np.cumsum(sizes)[:-1])):
+            stored = np.zeros(max(16, 2 * members.shape[0]), dtype=np.int64)
+            stored[:members.shape[0]] = members
+            lists.append(stored)
+            where.update(zip(members.tolist(), ((bucket, position) for position in range(members.shape[0]))))
+        training.result = (centroids, lists, sizes.tolist(), where)
+
+    def install(self, training: Training, vectors: np.ndarray) -> None:
+        """Swap in the buckets ``fit`` built and replay the changes made meanwhile.
+
+        Does nothing if the index was cleared or retrained since ``begin_training``.
+        """
+        if self._training is not training:
+            return
+        self._training = None
+        if training.result is None:
+            return
+        self.centroids, self._lists, self._list_sizes, self._where = training.result
+        self._trained_at = training.rows.shape[0]
+        self._added_since = 0
+        self._untrained.clear()
+        for change, row in training.changes:
+            if change == "add":
+                self.add(row, vectors)
+            else:
+                self.remove(row)
+
+    def abandon(self, training: Training) -> None:
+        """Give up on ``training`` (e.g. ``fit`` failed), so the index can be trained again later."""
+        if self._training is training:
+            self._training = None
+
+    def _append(self, bucket: int, row: int) -> None:
+        size = self._list_sizes[bucket]
+        if size == self._lists[bucket].shape[0]:
+            grown = np.zeros(size * 2, dtype=np.int64)
+            grown[:size] = self._lists[bucket]
+            self._lists[bucket] = grown
+        self._lists[bucket][size] = row
+        self._list_sizes[bucket] = size + 1
+        self._where[row] = (bucket, size)
+
+    def add(self, row: int, vectors: np.ndarray) -> None:
+        if self._training is not None:
+            self._training.changes.append(("add", row))
+        if self.centroids is None:
+            self._untrained.add(row, vectors)
+            return
+        if row in self._where:
+            return
+        bucket = int(np.argmax(self.centroids @ vectors[row]))
+        self._append(bucket, row)
+        self._added_since += 1
+
+    def remove(self, row: int) -> None:
+        if self._training is not None:
+            self._training.changes.append(("remove", row))
+        if self.centroids is None:
+            self._untrained.remove(row)
+            return
+        location = self._where.pop(row, None)
+        if location is None:
+            return
+        bucket, position = location
+        last = self._list_sizes[bucket] - 1
+        if position != last:
+            moved = int(self._lists[bucket][last])
+            self._lists[bucket][position] = moved
+            self._where[moved] = (bucket, position)
+        self._list_sizes[bucket] = last
+
+    def clear(self) -> None:
+        self.centroids = None
+        self._lists = []
+        self._list_sizes = []
+        self._where = {}
+        self._trained_at = 0
+        self._added_since = 0
+        self._training = None
+        self._untrained.clear()
+
+    def search(self, vectors: np.ndarray, query: np.ndarray) -> Tuple[int, float]:
+        if self.centroids is None:
+            return self._untrained.search(vectors, query)
+        if not self._where:
+            return -1, float("-inf")
+        nprobe = min(self.nprobe, self.centroids.shape[0])
+        centroid_scores = self.centroids @ query
+        probe = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+        candidates = np.concatenate([self._lists[b][:self._list_sizes[b]] for b in probe])
+        if candidates.shape[0] == 0:
+            return -1, float("-inf")
+        scores = vectors[candidates] @ query
+        best = int(np.argmax(scores))
+        return int(candidates[best]), float(scores[best])
+
+    def search_k(self, vectors: np.ndarray, query: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        if self.centroids is None:
+            return self._untrained.search_k(vectors, query, k)
+        if not self._where or k <= 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        nprobe = min(self.nprobe, self.centroids.shape[0])
+        probe = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+        candidates = np.concatenate([self._lists[b][:self._list_sizes[b]] for b in probe])
+        if candidates.shape[0] == 0:
+            return candidates, np.zeros(0, dtype=np.float32)
+        return top_k(candidates, np.asarray(vectors[candidates] @ query), k)
+
+
+def index_from_env() -> VectorIndex:
+    """Build the index selected by ``SEMANTIC_CACHE_INDEX`` (``exact`` or ``ivf``)."""
+    kind = os.getenv("SEMANTIC_CACHE_INDEX", "exact").lower()
+    if kind == "exact":
+        return ExactIndex()
+    if kind == "ivf":
+        return IVFIndex(
+            nlist=int(os.getenv("SEMANTIC_CACHE_IVF_NLIST", "256")),
+            nprobe=int(os.getenv("SEMANTIC_CACHE_IVF_NPROBE", "16")),
+        )
+    raise ValueError(f"Unknown SEMANTIC_CACHE_INDEX: {kind}")
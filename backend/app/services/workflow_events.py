@@ -0,0 +1,286 @@
+"""Progress events for running workflows.
+
+The engine publishes each workflow's progress, step and outcome events to
+a broker. The broker keeps a bounded, ordered log per workflow, so a
+client that reconnects with the last event id it saw replays what it
+missed. ``RedisBroker`` stores the log in a Redis stream that every
+process can read. ``InProcessBroker`` serves a single process and tests.
+
+``WorkflowEventHub`` fans events out to local subscribers. It runs one
+reader per workflow, whatever the number of subscribers, and gives each
+subscriber a bounded buffer. A subscriber that falls a whole buffer
+behind is closed rather than slowing the others. SSE clients then
+reconnect with ``Last-Event-ID`` and catch up from the log.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_EVENTS = ("completed", "failed", "cancelled")
+
+
+@dataclass(frozen=True)
+class WorkflowEvent:
+    id: Optional[str]
+    event: str
+    data: dict
+
+    @property
+    def terminal(self) -> bool:
+        return self.event in TERMINAL_EVENTS
+
+
+def event_order(event_id: str) -> Tuple[int, ...]:
+    """Sort key for event ids: ``"7"`` in-process, ``"1718000000000-3"`` from Redis."""
+    return tuple(int(part) for part in event_id.split("-"))
+
+
+class EventBroker:
+    async def publish(self, workflow_id: str, event: str, data: dict) -> str:
+        raise NotImplementedError
+
+    async def read(self, workflow_id: str, after: Optional[str], timeout: float) -> List[WorkflowEvent]:
+        """Return events after ``after`` (all kept events if None), waiting up to ``timeout`` for one."""
+        raise NotImplementedError
+
+    async def last_id(self, workflow_id: str) -> Optional[str]:
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+
+class InProcessBroker(EventBroker):
+    def __init__(self, history: Optional[int] = None, ttl: Optional[float] = None):
+        self.history = history or int(os.getenv("WORKFLOW_EVENTS_HISTORY", "500"))
+        self.ttl = ttl if ttl is not None else float(os.getenv("WORKFLOW_EVENTS_TTL", "3600"))
+        self._logs: Dict[str, Deque[WorkflowEvent]] = {}
+        self._sequence: Dict[str, int] = {}
+        self._finished: Dict[str, float] = {}
+        self._waiters: Dict[str, Set[asyncio.Future]] = {}
+
+    def _prune(self) -> None:
+        cutoff = time.monotonic() - self.ttl
+        for workflow_id in [w for w, at in self._finished.items() if at < cutoff]:
+            del self._finished[workflow_id]
+            self._logs.pop(workflow_id, None)
+            self._sequence.pop(workflow_id, None)
+
+    async def publish(self, workflow_id: str, event: str, data: dict) -> str:
+        self._prune()
+        sequence = self._sequence.get(workflow_id, 0) + 1
+        self._sequence[workflow_id] = sequence
+        item = WorkflowEvent(str(sequence), event, data)
+        self._logs.setdefault(workflow_id, deque(maxlen=self.history)).append(item)
+        if item.terminal:
+            self._finished[workflow_id] = time.monotonic()
+        for waiter in self._waiters.pop(workflow_id, ()):
+            # Waiters may belong to another event loop (tests, threaded servers).
+            waiter.get_loop().call_soon_threadsafe(_resolve, waiter)
+        return item.id
+
+    def _after(self, workflow_id: str, after: Optional[str]) -> List[WorkflowEvent]:
+        log = self._logs.get(workflow_id, ())
+        if after is None:
+            return list(log)
+        position = event_order(after)
+        return [item for item in log if event_order(item.id) > position]
+
+    async def read(self, workflow_id: str, after: Optional[str], timeout: float) -> List[WorkflowEvent]:
+        events = self._after(workflow_id, after)
+        if events or timeout <= 0:
+            return events
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(workflow_id, set()).add(waiter)
+        try:
+            await asyncio.wait_for(waiter, timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            self._waiters.get(workflow_id, set()).discard(waiter)
+        return self._after(workflow_id, after)
+
+    async def last_id(self, workflow_id: str) -> Optional[str]:
+        log = self._logs.get(workflow_id)
+        return log[-1].id if log else None
+
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class RedisBroker(EventBroker):
+    def __init__(self, url: Optional[str] = None, client=None, history: Optional[int] = None, ttl: Optional[float] = None):
+        if client is None:
+            import redis.asyncio as redis
+
+            client = redis.from_url(url or os.getenv("REDIS_URL", "redis://localhost:6379"))
+        self.client = client
+        self.history = history or int(os.getenv("WORKFLOW_EVENTS_HISTORY", "500"))
+        self.ttl = int(ttl if ttl is not None else float(os.getenv("WORKFLOW_EVENTS_TTL", "3600")))
+
+    @staticmethod
+    def _key(workflow_id: str) -> str:
+        return f"workflows:events:{workflow_id}"
+
+    @staticmethod
+    def _decode(value) -> str:
+        return value.decode() if isinstance(value, bytes) else value
+
+    async def publish(self, workflow_id: str, event: str, data: dict) -> str:
+        key = self._key(workflow_id)
+        event_id = await self.client.xadd(
+            key, {"event": event, "data": json.dumps(data, default=str)}, maxlen=self.history, approximate=True
+        )
+        await self.client.expire(key, self.ttl)
+        return self._decode(event_id)
+
+    async def read(self, workflow_id: str, after: Optional[str], timeout: float) -> List[WorkflowEvent]:
+        block = int(timeout * 1000) if timeout > 0 else None
+        response = await self.client.xread({self._key(workflow_id): after or "0-0"}, block=block)
+        events = []
+        for _, entries in response or ():
+            for event_id, fields in entries:
+                fields = {self._decode(k): self._decode(v) for k, v in fields.items()}
+                events.append(WorkflowEvent(self._decode(event_id), fields["event"], json.loads(fields["data"])))
+        return events
+
+    async def last_id(self, workflow_id: str) -> Optional[str]:
+        entries = await self.client.xrevrange(self._key(workflow_id), count=1)
+        return self._decode(entries[0][0]) if entries else None
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+
+def create_event_broker(url: Optional[str] = None) -> EventBroker:
+    """Build the broker named by ``WORKFLOW_EVENTS_URL``: a ``redis://`` URL or ``memory``.
+
+    Defaults to ``REDIS_URL`` when that is set, otherwise in-process.
+    """
+    if url is None:
+        url = os.getenv("WORKFLOW_EVENTS_URL") or os.getenv("REDIS_URL") or "memory"
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBroker(url)
+    if url != "memory":
+        raise ValueError(f"Unsupported WORKFLOW_EVENTS_URL {url!r}")
+    return InProcessBroker()
+
+
+class Subscription:
+    """One client's view of a workflow's events, in order and without duplicates."""
+
+    def __init__(self, hub: "WorkflowEventHub", workflow_id: str, last_event_id: Optional[str], buffer: int):
+        self._hub = hub
+        self.workflow_id = workflow_id
+        self.last_event_id = last_event_id
+        self._backlog: Deque[WorkflowEvent] = deque()
+        self._queue: asyncio.Queue = asyncio.Queue(buffer)
+        self.overflowed = False
+        self.finished = False
+
+    def _deliver(self, event: WorkflowEvent) -> None:
+        if self.overflowed:
+            return
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    def _fresh(self, event: WorkflowEvent) -> bool:
+        return self.last_event_id is None or event_order(event.id) > event_order(self.last_event_id)
+
+    async def next(self, timeout: float) -> Optional[WorkflowEvent]:
+        """Return the next event, or None after ``timeout`` seconds or once closed."""
+        deadline = asyncio.get_running_loop().time() + timeout
+        while not self.closed:
+            if self._backlog:
+                event = self._backlog.popleft()
+            else:
+                remaining = deadline - asyncio.get_running_loop().time()
+                if remaining <= 0:
+                    return None
+                try:
+                    event = await asyncio.wait_for(self._queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    return None
+            if not self._fresh(event):
+                continue
+            self.last_event_id = event.id
+            self.finished = event.terminal
+            return event
+        return None
+
+    @property
+    def closed(self) -> bool:
+        # An overflowed subscriber still drains its backlog; it only ends once that is empty.
+        return self.finished or (self.overflowed and not self._backlog and self._queue.empty())
+
+    def close(self) -> None:
+        self._hub._unsubscribe(self)
+
+
+class WorkflowEventHub:
+    def __init__(self, broker: EventBroker, buffer: Optional[int] = None, poll_interval: float = 5.0):
+        self.broker = broker
+        self.buffer = buffer or int(os.getenv("WORKFLOW_EVENTS_BUFFER", "256"))
+        self.poll_interval = poll_interval
+        self._subscribers: Dict[str, Set[Subscription]] = {}
+        self._readers: Dict[str, asyncio.Task] = {}
+
+    async def subscribe(self, workflow_id: str, last_event_id: Optional[str] = None) -> Subscription:
+        """Follow ``workflow_id``, replaying kept events after ``last_event_id`` first."""
+        subscription = Subscription(self, workflow_id, last_event_id, self.buffer)
+        self._subscribers.setdefault(workflow_id, set()).add(subscription)
+        if workflow_id not in self._readers:
+            # Start reading from before the backlog is fetched so nothing falls in between.
+            cursor = await self.broker.last_id(workflow_id)
+            if workflow_id not in self._readers:
+                self._readers[workflow_id] = asyncio.create_task(self._read(workflow_id, cursor))
+        # Live events from the reader may overlap the backlog; Subscription drops repeats by id.
+        subscription._backlog.extend(await self.broker.read(workflow_id, last_event_id, timeout=0))
+        return subscription
+
+    def _unsubscribe(self, subscription: Subscription) -> None:
+        subscribers = self._subscribers.get(subscription.workflow_id)
+        if subscribers is None:
+            return
+        subscribers.discard(subscription)
+        if not subscribers:
+            del self._subscribers[subscription.workflow_id]
+            reader = self._readers.pop(subscription.workflow_id, None)
+            if reader is not None:
+                reader.cancel()
+
+    async def _read(self, workflow_id: str, cursor: Optional[str]) -> None:
+        try:
+            while self._subscribers.get(workflow_id):
+                events = await self.broker.read(workflow_id, cursor, self.poll_interval)
+                for event in events:
+                    cursor = event.id
+                    for subscription in list(self._subscribers.get(workflow_id, ())):
+                        subscription._deliver(event)
+        except Exception:
+            logger.exception("Reading events for workflow %s failed", workflow_id)
+            # Wake subscribers so they fall back to the database instead of waiting forever.
+            for subscription in list(self._subscribers.get(workflow_id, ())):
+                subscription.overflowed = True
+        # Whoever cancels a reader has already removed it.
+        if self._readers.get(workflow_id) is asyncio.current_task():
+            del self._readers[workflow_id]
+
+    async def close(self) -> None:
+        for reader in list(self._readers.values()):
+            reader.cancel()
+        await asyncio.gather(*self._readers.values(), return_exceptions=True)
+        self._readers.clear()
+        self._subscribers.clear()
+        await self.broker.close()
@@ -0,0 +1,85 @@
+"""Dispatch queues for the workflow engine.
+
+The ``workflows`` table is the source of truth. A queue only carries
+workflow ids so that an idle worker hears about new work at once, not at
+its next poll. Delivery may be lost or duplicated: the engine claims each
+workflow with a conditional UPDATE and sweeps the table for anything a
+queue dropped. ``RedisQueue`` shares one list between every app process.
+``InProcessQueue`` serves a single process and tests.
+"""
+import asyncio
+import os
+from typing import Optional
+
+
+class WorkflowQueue:
+    async def put(self, workflow_id: str) -> None:
+        raise NotImplementedError
+
+    async def get(self, timeout: float) -> Optional[str]:
+        """Return the next workflow id, or None if nothing arrives within ``timeout`` seconds."""
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+
+class InProcessQueue(WorkflowQueue):
+    def __init__(self):
+        self._queue: Optional[asyncio.Queue] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _current(self) -> asyncio.Queue:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # asyncio primitives belong to one loop; tests and reloads may bring a new one.
+            self._queue = asyncio.Queue()
+            self._loop = loop
+        return self._queue
+
+    async def put(self, workflow_id: str) -> None:
+        self._current().put_nowait(workflow_id)
+
+    async def get(self, timeout: float) -> Optional[str]:
+        try:
+            return await asyncio.wait_for(self._current().get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class RedisQueue(WorkflowQueue):
+    def __init__(self, url: Optional[str] = None, key: str = "workflows:queue", client=None):
+        if client is None:
+            import redis.asyncio as redis
+
+            client = redis.from_url(url or os.getenv("REDIS_URL", "redis://localhost:6379"))
+        self.client = client
+        self.key = key
+
+    async def put(self, workflow_id: str) -> None:
+        await self.client.lpush(self.key, workflow_id)
+
+    async def get(self, timeout: float) -> Optional[str]:
+        # BRPOP takes whole seconds, and 0 means block forever.
+        item = await self.client.brpop([self.key], timeout=max(1, int(timeout)))
+        if item is None:
+            return None
+        value = item[1]
+        return value.decode() if isinstance(value, bytes) else value
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+
+def create_workflow_queue(url: Optional[str] = None) -> WorkflowQueue:
+    """Build the queue named by ``WORKFLOW_QUEUE_URL``: a ``redis://`` URL or ``memory``.
+
+    Defaults to ``REDIS_URL`` when that is set, otherwise in-process.
+    """
+    if url is None:
+        url = os.getenv("WORKFLOW_QUEUE_URL") or os.getenv("REDIS_URL") or "memory"
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisQueue(url)
+    if url != "memory":
+        raise ValueError(f"Unsupported WORKFLOW_QUEUE_URL {url!r}")
+    return InProcessQueue()
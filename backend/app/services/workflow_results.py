@@ -0,0 +1,133 @@
+"""Stored, precompressed workflow results.
+
+A workflow's result never changes once it completes, so the engine
+serializes it once, when it finishes the workflow, into a
+``WorkflowResult`` row: the JSON that ``/api/results`` serves, its gzip
+and brotli copies and a strong ETag. The endpoint answers
+``If-None-Match`` by comparing ETags, without reading the result itself,
+and otherwise sends the stored bytes in the best encoding the client
+accepts.
+
+Each encoding is a representation with its own ETag (the result's, with
+the encoding appended). So are projections (``?fields=``), which are
+built from the stored JSON on first request and kept in a small
+in-process LRU. Their ETags derive from the result's, so revalidating a
+projection costs the same as revalidating the whole result.
+"""
+import gzip
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+import brotli
+
+from ..models.database import WorkflowResult
+
+ENCODINGS = ("br", "gzip")  # in order of preference
+# Stored copies are compressed once, so they get slow, small settings. Brotli
+# stops at 9: 10 and 11 shrink results by a few percent more but take ~50x longer.
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 9
+# Projections are compressed on request.
+PROJECTION_GZIP_LEVEL = 6
+PROJECTION_BROTLI_QUALITY = 5
+PROJECTIONS_KEPT = int(os.getenv("RESULTS_PROJECTION_CACHE", "256"))
+
+
+class UnknownFields(ValueError):
+    """A projection named fields the result does not have."""
+
+
+def serialize(workflow_id: str, result: Dict[str, Any]) -> bytes:
+    return json.dumps({"workflow_id": workflow_id, **result}, separators=(",", ":")).encode("utf-8")
+
+
+def compress(body: bytes, encoding: Optional[str], projection: bool = False) -> bytes:
+    if encoding == "gzip":
+        return gzip.compress(body, PROJECTION_GZIP_LEVEL if projection else GZIP_LEVEL, mtime=0)
+    if encoding == "br":
+        return brotli.compress(body, quality=PROJECTION_BROTLI_QUALITY if projection else BROTLI_QUALITY)
+    return body
+
+
+def encode_result(workflow_id: str, result: Dict[str, Any]) -> WorkflowResult:
+    body = serialize(workflow_id, result)
+    return WorkflowResult(
+        workflow_id=workflow_id,
+        etag=f'"{hashlib.sha256(body).hexdigest()[:32]}"',
+        body=body,
+        gzip=compress(body, "gzip"),
+        br=compress(body, "br"),
+    )
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """The preferred encoding of ``ENCODINGS`` the client accepts, or None for identity."""
+    accepted, refused = set(), set()
+    for part in (accept_encoding or "").lower().split(","):
+        coding, _, params = part.strip().partition(";")
+        quality = params.strip()
+        try:
+            zero = quality.startswith("q=") and float(quality[2:]) == 0
+        except ValueError:
+            zero = True
+        (refused if zero else accepted).add(coding.strip())
+    for encoding in ENCODINGS:
+        if encoding in accepted or ("*" in accepted and encoding not in refused):
+            return encoding
+    return None
+
+
+def parse_fields(fields: Optional[str]) -> Tuple[str, ...]:
+    """Sorted, distinct field names of a ``?fields=a,b`` projection; () for the whole result."""
+    names = {name.strip() for name in (fields or "").split(",") if name.strip()}
+    return tuple(sorted(names | {"workflow_id"})) if names else ()
+
+
+def representation_etag(etag: str, fields: Sequence[str], encoding: Optional[str]) -> str:
+    tag = etag.strip('"')
+    if fields:
+        tag += "." + hashlib.sha256(",".join(fields).encode("utf-8")).hexdigest()[:8]
+    if encoding:
+        tag += "-" + encoding
+    return f'"{tag}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether ``If-None-Match`` lists ``etag`` (weak comparison, as RFC 9110 asks for this header)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+_projections: "OrderedDict[str, bytes]" = OrderedDict()
+_projections_lock = threading.Lock()
+
+
+def cached_projection(tag: str) -> Optional[bytes]:
+    """A projection built earlier, by its representation ETag."""
+    with _projections_lock:
+        projected = _projections.get(tag)
+        if projected is not None:
+            _projections.move_to_end(tag)
+        return projected
+
+
+def project(body: bytes, tag: str, fields: Sequence[str], encoding: Optional[str]) -> bytes:
+    """``fields`` of the serialized result ``body``, encoded, and kept under ``tag``, its ETag."""
+    payload = json.loads(body)
+    unknown = [name for name in fields if name not in payload]
+    if unknown:
+        raise UnknownFields(", ".join(unknown))
+    projected = json.dumps({name: payload[name] for name in fields}, separators=(",", ":")).encode("utf-8")
+    projected = compress(projected, encoding, projection=True)
+    with _projections_lock:
+        _projections[tag] = projected
+        while len(_projections) > PROJECTIONS_KEPT:
+            _projections.popitem(last=False)
+    return projected
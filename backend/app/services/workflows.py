@@ -0,0 +1,611 @@
+"""Persistent execution of analysis workflows.
+
+``submit`` stores a ``Workflow`` row and drops its id on the dispatch queue
+(see ``workflow_queue``). Every app process runs a ``WorkflowEngine`` with a
+few worker tasks. A worker claims a queued workflow with a conditional
+UPDATE, so only one worker anywhere runs it, and then runs its steps,
+writing progress and the running steps to the row as it goes.
+
+Steps form a dependency graph: each starts as soon as the steps it
+``depends_on`` have finished, so independent steps run concurrently. A
+step may cap how many of its runs a process allows at once (across
+workflows) and is stopped after its timeout. Each step's output is stored
+under a hash of its inputs, so a retry, or a new run with the same
+inputs, reuses finished steps instead of repeating them.
+
+While a workflow runs, its worker renews the lease and watches for a
+cancellation requested through any process. Workflows left ``running`` by
+a worker that died are re-queued once their lease expires. The claim's
+attempt number is the lease token: every write a worker makes checks it,
+so a worker that stalled past its lease and was taken over stops without
+touching the row. Failures are
+retried with exponential backoff up to ``max_attempts`` times, unless the
+step raised ``PermanentFailure``. Credentials are dropped from the stored
+parameters when a workflow finishes, however it finishes.
+
+Progress, step and outcome events go to an event broker as they happen;
+``hub`` fans them out to subscribers (see ``workflow_events``).
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from ..models.database import SessionLocal, Workflow, WorkflowStepOutput
+from .workflow_events import EventBroker, WorkflowEventHub, create_event_broker
+from .workflow_queue import WorkflowQueue, create_workflow_queue
+from .workflow_results import encode_result
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = ("completed", "failed", "cancelled")
+# Credential fields kept after a workflow finishes; everything else is dropped.
+PUBLIC_CREDENTIAL_FIELDS = ("instance_url", "username")
+
+
+class PermanentFailure(Exception):
+    """Raised by a step when retrying cannot help (bad input, missing access)."""
+
+
+class IdempotencyConflict(Exception):
+    """Raised when an idempotency key is reused for a different request."""
+
+
+class StepTimeout(Exception):
+    """Raised when a step runs past its timeout; retried like other failures."""
+
+
+class LeaseLost(Exception):
+    """Another worker claimed the workflow after this worker's lease expired."""
+
+
+@dataclass
+class StepContext:
+    workflow_id: str
+    params: Dict[str, Any]
+    # Outputs of the steps this one depends on, by step name.
+    outputs: Dict[str, Any] = field(default_factory=dict)
+    report: Callable[[float], Awaitable[None]] = None
+
+    async def progress(self, fraction: float) -> None:
+        """Report how far (0..1) the current step has got."""
+        if self.report is not None:
+            await self.report(min(max(fraction, 0.0), 1.0))
+
+
+@dataclass
+class WorkflowStep:
+    name: str
+    run: Callable[[StepContext], Awaitable[Any]]
+    weight: float = 1.0  # share of the progress bar
+    depends_on: Tuple[str, ...] = ()  # steps whose outputs this one reads
+    timeout: Optional[float] = None  # seconds; the engine's step_timeout when None
+    max_concurrency: Optional[int] = None  # runs at once per process, across workflows
+    cache: bool = True  # reuse the output of an earlier run with the same inputs
+    version: str = "1"  # change to invalidate cached outputs when the step's logic changes
+
+
+def validate_steps(steps: Sequence[WorkflowStep]) -> None:
+    """Raise ValueError for duplicate names, unknown dependencies or cycles."""
+    names = [step.name for step in steps]
+    if len(set(names)) != len(names):
+        raise ValueError("Workflow step names must be unique")
+    remaining = {step.name: set(step.depends_on) for step in steps}
+    for name, deps in remaining.items():
+        unknown = deps - remaining.keys()
+        if unknown:
+            raise ValueError(f"Step {name!r} depends on unknown steps {sorted(unknown)}")
+    while remaining:
+        ready = [name for name, deps in remaining.items() if not deps]
+        if not ready:
+            raise ValueError(f"Workflow steps have a dependency cycle among {sorted(remaining)}")
+        for name in ready:
+            del remaining[name]
+        for deps in remaining.values():
+            deps.difference_update(ready)
+
+
+def step_key(step: WorkflowStep, params: Dict[str, Any], inputs: Dict[str, Any]) -> str:
+    """Cache key for a step's output: the step, the workflow's public params and its inputs."""
+    raw = json.dumps(
+        {"step": step.name, "version": step.version, "params": redact(params), "inputs": inputs},
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def request_hash(analysis_type: str, params: Dict[str, Any]) -> str:
+    raw = json.dumps({"analysis_type": analysis_type, "params": params}, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def redact(params: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    if not params or "credentials" not in params:
+        return params
+    credentials = params.get("credentials") or {}
+    public = {k: v for k, v in credentials.items() if k in PUBLIC_CREDENTIAL_FIELDS}
+    return dict(params, credentials=public)
+
+
+class WorkflowEngine:
+    """Claims workflows from the database and runs their steps to completion."""
+
+    def __init__(
+        self,
+        steps: Sequence[WorkflowStep],
+        session_factory=SessionLocal,
+        queue: Optional[WorkflowQueue] = None,
+        events: Optional[EventBroker] = None,
+        workers: Optional[int] = None,
+        max_attempts: Optional[int] = None,
+        lease: Optional[float] = None,
+        poll_interval: Optional[float] = None,
+        retry_backoff: Optional[float] = None,
+        step_timeout: Optional[float] = None,
+        cache_ttl: Optional[float] = None,
+    ):
+        validate_steps(steps)
+        self.steps = list(steps)
+        self._session_factory = session_factory
+        self.queue = queue or create_workflow_queue()
+        self.events = events or create_event_broker()
+        self.hub = WorkflowEventHub(self.events)
+        self.workers = workers or int(os.getenv("WORKFLOW_WORKERS", "4"))
+        self.max_attempts = max_attempts or int(os.getenv("WORKFLOW_MAX_ATTEMPTS", "3"))
+        self.lease = lease or float(os.getenv("WORKFLOW_LEASE_SECONDS", "60"))
+        self.poll_interval = poll_interval or float(os.getenv("WORKFLOW_POLL_SECONDS", "5"))
+        if retry_backoff is None:
+            retry_backoff = float(os.getenv("WORKFLOW_RETRY_BACKOFF_SECONDS", "5"))
+        self.retry_backoff = retry_backoff
+        self.step_timeout = step_timeout or float(os.getenv("WORKFLOW_STEP_TIMEOUT_SECONDS", "900"))
+        if cache_ttl is None:
+            cache_ttl = float(os.getenv("WORKFLOW_STEP_CACHE_TTL_SECONDS", "3600"))
+        self.cache_ttl = cache_ttl  # 0 turns the step output cache off
+        self._limits: Dict[str, asyncio.Semaphore] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._retries: Set[asyncio.Task] = set()
+        self._running: Dict[str, asyncio.Task] = {}
+        self._cancelling: Set[str] = set()
+        self._lost: Set[str] = set()
+
+    # Submission and control, called from request handlers.
+
+    async def submit(
+        self,
+        db: AsyncSession,
+        analysis_type: str,
+        params: Dict[str, Any],
+        idempotency_key: Optional[str] = None,
+    ) -> Tuple[Workflow, bool]:
+        """Store and dispatch a workflow; return it and whether it is new.
+
+        Resubmitting with the same ``idempotency_key`` returns the original
+        workflow instead of starting another.
+        """
+        digest = request_hash(analysis_type, params)
+        if idempotency_key:
+            existing = await self._existing(db, idempotency_key, digest)
+            if existing is not None:
+                return existing, False
+        workflow = Workflow(
+            idempotency_key=idempotency_key or None,
+            request_hash=digest,
+            analysis_type=analysis_type,
+            params=params,
+        )
+        db.add(workflow)
+        try:
+            await db.commit()
+        except IntegrityError:
+            # A concurrent submission with the same key won the insert.
+            await db.rollback()
+            return await self._existing(db, idempotency_key, digest), False
+        await self.queue.put(workflow.id)
+        return workflow, True
+
+    @staticmethod
+    async def _existing(db: AsyncSession, idempotency_key: str, digest: str) -> Optional[Workflow]:
+        workflow = await db.scalar(select(Workflow).where(Workflow.idempotency_key == idempotency_key))
+        if workflow is not None and workflow.request_hash != digest:
+            raise IdempotencyConflict("Idempotency-Key was already used for a different request")
+        return workflow
+
+    async def cancel(self, db: AsyncSession, workflow: Workflow) -> Workflow:
+        """Cancel a queued workflow now, or ask the worker running it to stop."""
+        if workflow.status in TERMINAL_STATUSES:
+            return workflow
+        now = datetime.utcnow()
+        workflow.cancel_requested = True
+        workflow.updated_at = now
+        if workflow.status == "queued":
+            workflow.status = "cancelled"
+            workflow.finished_at = now
+            workflow.params = redact(workflow.params)
+        await db.commit()
+        if workflow.status == "cancelled":
+            await self._publish(workflow.id, "cancelled", {})
+        task = self._running.get(workflow.id)
+        if task is not None:
+            # Running here: stop now rather than at the next heartbeat.
+            self._cancelling.add(workflow.id)
+            task.cancel()
+        return workflow
+
+    # Worker pool.
+
+    async def start(self) -> None:
+        self._tasks = [asyncio.create_task(self._run()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in [*self._tasks, *self._retries]:
+            task.cancel()
+        await asyncio.gather(*self._tasks, *self._retries, return_exceptions=True)
+        self._tasks = []
+        await self.queue.close()
+        await self.hub.close()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                workflow_id = await self.queue.get(self.poll_interval)
+                if workflow_id is None or not await self.run_once(workflow_id):
+                    # Nothing dispatched, or someone else got it: sweep for anything the queue missed.
+                    while await self.run_once():
+                        pass
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Workflow worker iteration failed")
+                await asyncio.sleep(self.poll_interval)
+
+    async def run_once(self, workflow_id: Optional[str] = None) -> bool:
+        """Claim and run one workflow (``workflow_id`` or the oldest ready); return False if none."""
+        claimed = await asyncio.to_thread(self._claim, workflow_id)
+        if claimed is None:
+            return False
+        workflow_id, params, attempts = claimed
+        await self._publish(workflow_id, "started", {"attempt": attempts})
+        task = asyncio.create_task(self._execute(workflow_id, attempts, params))
+        self._running[workflow_id] = task
+        heartbeat = asyncio.create_task(self._heartbeat(workflow_id, attempts, task))
+        try:
+            result = await task
+        except asyncio.CancelledError:
+            if workflow_id in self._lost:
+                logger.warning("Lost the lease on workflow %s; another worker has taken it over", workflow_id)
+                return True
+            if workflow_id not in self._cancelling:
+                # Shutting down: leave the workflow to be re-queued when its lease expires.
+                task.cancel()
+                raise
+            if await asyncio.to_thread(self._finish, workflow_id, attempts, "cancelled"):
+                await self._publish(workflow_id, "cancelled", {})
+        except LeaseLost:
+            logger.warning("Lost the lease on workflow %s; another worker has taken it over", workflow_id)
+        except Exception as exc:
+            logger.warning("Workflow %s failed on attempt %d: %s", workflow_id, attempts, exc)
+            retry = attempts < self.max_attempts and not isinstance(exc, PermanentFailure)
+            delay = self.retry_backoff * 2 ** (attempts - 1)
+            error = str(exc) or type(exc).__name__
+            if not await asyncio.to_thread(self._fail, workflow_id, attempts, error, retry, delay):
+                logger.warning("Lost the lease on workflow %s; another worker has taken it over", workflow_id)
+            elif retry:
+                await self._publish(workflow_id, "retrying", {"attempt": attempts, "error": error, "retry_in": delay})
+                retry_task = asyncio.create_task(self._dispatch_later(workflow_id, delay))
+                self._retries.add(retry_task)
+                retry_task.add_done_callback(self._retries.discard)
+            else:
+                await self._publish(workflow_id, "failed", {"error": error})
+        else:
+            if await asyncio.to_thread(self._finish, workflow_id, attempts, "completed", result):
+                await self._publish(workflow_id, "completed", {"result": result})
+            else:
+                logger.warning("Lost the lease on workflow %s; another worker has taken it over", workflow_id)
+        finally:
+            heartbeat.cancel()
+            self._running.pop(workflow_id, None)
+            self._cancelling.discard(workflow_id)
+            self._lost.discard(workflow_id)
+        return True
+
+    async def _publish(self, workflow_id: str, event: str, data: dict) -> None:
+        # Events are a convenience for watchers; the row stays authoritative, so never fail a run over one.
+        try:
+            await self.events.publish(workflow_id, event, data)
+        except Exception:
+            logger.exception("Publishing %s for workflow %s failed", event, workflow_id)
+
+    async def _dispatch_later(self, workflow_id: str, delay: float) -> None:
+        await asyncio.sleep(delay)
+        await self.queue.put(workflow_id)
+
+    async def _heartbeat(self, workflow_id: str, attempt: int, task: asyncio.Task) -> None:
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            try:
+                cancel_requested = await asyncio.to_thread(self._renew, workflow_id, attempt)
+            except LeaseLost:
+                self._lost.add(workflow_id)
+                task.cancel()
+                return
+            if cancel_requested:
+                self._cancelling.add(workflow_id)
+                task.cancel()
+                return
+
+    async def _execute(self, workflow_id: str, attempt: int, params: Dict[str, Any]) -> Any:
+        """Run the steps as their dependencies finish; return the last listed step's output.
+
+        After a step fails no new steps start, but the running ones finish
+        (and are cached) before the error is raised.
+        """
+        steps = {step.name: step for step in self.steps}
+        total = sum(step.weight for step in self.steps) or 1.0
+        fractions = {name: 0.0 for name in steps}
+        active: Set[str] = set()
+        shown: Tuple[int, Optional[str]] = (-1, None)
+        lock = asyncio.Lock()
+
+        async def update(name: str) -> None:
+            nonlocal shown
+            async with lock:
+                progress = min(int(100 * sum(steps[n].weight * f for n, f in fractions.items()) / total), 99)
+                current = ", ".join(sorted(active)) or None
+                if (progress, current) == shown:
+                    return
+                shown = (progress, current)
+                await asyncio.to_thread(self._set_progress, workflow_id, attempt, progress, current)
+                await self._publish(workflow_id, "progress", {"progress": progress, "step": name})
+
+        async def report(name: str, fraction: float) -> None:
+            fractions[name] = max(fractions[name], fraction)
+            await update(name)
+
+        async def run(step: WorkflowStep) -> Tuple[Any, bool]:
+            inputs = {dep: outputs[dep] for dep in step.depends_on}
+            key = step_key(step, params, inputs) if step.cache and self.cache_ttl > 0 else None
+            if key is not None:
+                hit = await asyncio.to_thread(self._cached_output, key)
+                if hit is not None:
+                    return hit[0], True
+            async with self._limit(step):
+                active.add(step.name)
+                await update(step.name)
+                context = StepContext(
+                    workflow_id=workflow_id,
+                    params=params,
+                    outputs=inputs,
+                    report=lambda fraction: report(step.name, fraction),
+                )
+                timeout = step.timeout or self.step_timeout
+                try:
+                    output = await asyncio.wait_for(step.run(context), timeout)
+                except asyncio.TimeoutError:
+                    raise StepTimeout(f"Step {step.name} timed out after {timeout:g}s") from None
+                finally:
+                    active.discard(step.name)
+            if key is not None:
+                await asyncio.to_thread(self._store_output, key, step.name, workflow_id, output)
+            return output, False
+
+        outputs: Dict[str, Any] = {}
+        pending = dict(steps)
+        running: Dict[asyncio.Task, WorkflowStep] = {}
+        error: Optional[Exception] = None
+        try:
+            while True:
+                if error is None:
+                    for name, step in list(pending.items()):
+                        if all(dep in outputs for dep in step.depends_on):
+                            del pending[name]
+                            running[asyncio.create_task(run(step))] = step
+                if not running:
+                    break
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    step = running.pop(task)
+                    try:
+                        outputs[step.name], cached = task.result()
+                    except Exception as exc:
+                        error = error or exc
+                        continue
+                    fractions[step.name] = 1.0
+                    await update(step.name)
+                    progress = int(100 * sum(steps[n].weight * f for n, f in fractions.items()) / total)
+                    await self._publish(
+                        workflow_id, "step_completed", {"step": step.name, "progress": progress, "cached": cached}
+                    )
+        finally:
+            for task in running:
+                task.cancel()
+            await asyncio.gather(*running, return_exceptions=True)
+        if error is not None:
+            raise error
+        return outputs[self.steps[-1].name] if self.steps else None
+
+    def _limit(self, step: WorkflowStep):
+        if not step.max_concurrency:
+            return nullcontext()
+        if step.name not in self._limits:
+            self._limits[step.name] = asyncio.Semaphore(step.max_concurrency)
+        return self._limits[step.name]
+
+    # Database steps; each runs in a worker thread with its own session.
+
+    def _claim(self, workflow_id: Optional[str]) -> Optional[Tuple[str, Dict[str, Any], int]]:
+        now = datetime.utcnow()
+        with self._session_factory() as db:
+            stale = db.query(Workflow).filter(
+                Workflow.status == "running",
+                Workflow.locked_at < now - timedelta(seconds=self.lease),
+            )
+            for workflow in stale.filter(Workflow.cancel_requested.is_(True)):
+                workflow.status = "cancelled"
+                workflow.params = redact(workflow.params)
+                workflow.finished_at = now
+            db.flush()
+            stale.update({Workflow.status: "queued"}, synchronize_session=False)
+            db.commit()
+            if workflow_id is not None:
+                candidates = [workflow_id]
+            else:
+                candidates = [
+                    row.id
+                    for row in db.query(Workflow.id)
+                    .filter(Workflow.status == "queued", Workflow.available_at <= now)
+                    .order_by(Workflow.created_at)
+                    .limit(8)
+                ]
+            for candidate in candidates:
+                won = (
+                    db.query(Workflow)
+                    .filter(
+                        Workflow.id == candidate,
+                        Workflow.status == "queued",
+                        Workflow.available_at <= now,
+                    )
+                    .update(
+                        {
+                            Workflow.status: "running",
+                            Workflow.locked_at: now,
+                            Workflow.updated_at: now,
+                            Workflow.started_at: now,
+                            Workflow.attempts: Workflow.attempts + 1,
+                        },
+                        synchronize_session=False,
+                    )
+                )
+                db.commit()
+                if won:
+                    workflow = db.get(Workflow, candidate)
+                    return workflow.id, workflow.params or {}, workflow.attempts
+        return None
+
+    @staticmethod
+    def _hold(db: Session, workflow_id: str, attempt: int, values: Dict[Any, Any]) -> bool:
+        """Apply ``values`` to the row if this worker still holds its lease; roll back and return False if not."""
+        held = (
+            db.query(Workflow)
+            .filter(Workflow.id == workflow_id, Workflow.status == "running", Workflow.attempts == attempt)
+            .update(values, synchronize_session=False)
+        )
+        if not held:
+            db.rollback()
+        return bool(held)
+
+    def _renew(self, workflow_id: str, attempt: int) -> bool:
+        """Extend the lease; return True if cancellation was requested.
+
+        Raises ``LeaseLost`` if another worker has taken the workflow over.
+        """
+        with self._session_factory() as db:
+            if not self._hold(db, workflow_id, attempt, {Workflow.locked_at: datetime.utcnow()}):
+                raise LeaseLost(workflow_id)
+            db.commit()
+            return bool(db.query(Workflow.cancel_requested).filter(Workflow.id == workflow_id).scalar())
+
+    def _set_progress(self, workflow_id: str, attempt: int, progress: int, step: Optional[str]) -> None:
+        now = datetime.utcnow()
+        values = {
+            Workflow.progress: progress,
+            Workflow.current_step: step,
+            Workflow.locked_at: now,
+            Workflow.updated_at: now,
+        }
+        with self._session_factory() as db:
+            if not self._hold(db, workflow_id, attempt, values):
+                raise LeaseLost(workflow_id)
+            db.commit()
+
+    def _cached_output(self, key: str) -> Optional[Tuple[Any]]:
+        """Return ``(output,)`` for a fresh cached output, or None."""
+        cutoff = datetime.utcnow() - timedelta(seconds=self.cache_ttl)
+        with self._session_factory() as db:
+            stored = db.get(WorkflowStepOutput, key)
+            if stored is None or stored.created_at < cutoff:
+                return None
+            return (stored.output,)
+
+    def _store_output(self, key: str, step: str, workflow_id: str, output: Any) -> None:
+        now = datetime.utcnow()
+        with self._session_factory() as db:
+            db.query(WorkflowStepOutput).filter(
+                WorkflowStepOutput.created_at < now - timedelta(seconds=self.cache_ttl)
+            ).delete(synchronize_session=False)
+            db.merge(WorkflowStepOutput(key=key, step=step, workflow_id=workflow_id, output=output, created_at=now))
+            try:
+                db.commit()
+            except IntegrityError:
+                # Another run stored the same output first.
+                db.rollback()
+
+    def _finish(self, workflow_id: str, attempt: int, status: str, result: Any = None) -> bool:
+        """Record the outcome; return False, writing nothing, if the lease was lost."""
+        now = datetime.utcnow()
+        values = {
+            Workflow.status: status,
+            Workflow.result: result,
+            Workflow.error: None,
+            Workflow.finished_at: now,
+            Workflow.updated_at: now,
+        }
+        if status == "completed":
+            values.update({Workflow.progress: 100, Workflow.current_step: None})
+        with self._session_factory() as db:
+            if not self._hold(db, workflow_id, attempt, values):
+                return False
+            # The row is ours for the rest of this transaction.
+            workflow = db.get(Workflow, workflow_id)
+            if status == "completed" and isinstance(result, dict):
+                # Serialized and compressed once here; /api/results serves the stored bytes.
+                db.merge(encode_result(workflow_id, result))
+            workflow.params = redact(workflow.params)
+            db.commit()
+            return True
+
+    def _fail(self, workflow_id: str, attempt: int, error: str, retry: bool, delay: float) -> bool:
+        """Re-queue or fail the workflow; return False, writing nothing, if the lease was lost."""
+        now = datetime.utcnow()
+        values = {Workflow.error: error, Workflow.updated_at: now}
+        if retry:
+            values.update({Workflow.status: "queued", Workflow.available_at: now + timedelta(seconds=delay)})
+        else:
+            values.update({Workflow.status: "failed", Workflow.finished_at: now})
+        with self._session_factory() as db:
+            if not self._hold(db, workflow_id, attempt, values):
+                return False
+            if not retry:
+                workflow = db.get(Workflow, workflow_id)
+                workflow.params = redact(workflow.params)
+            db.commit()
+            return True
+
+
+_engine: Optional[WorkflowEngine] = None
+
+
+def get_workflow_engine() -> WorkflowEngine:
+    global _engine
+    if _engine is None:
+        from .analysis import ANALYSIS_STEPS
+
+        _engine = WorkflowEngine(ANALYSIS_STEPS)
+    return _engine
+
+
+async def close_workflow_engine() -> None:
+    global _engine
+    if _engine is not None:
+        await _engine.stop()
+        _engine = None
@@ -0,0 +1,131 @@
+"""Table API extraction benchmark.
+
+Pulls the default configuration tables from the fake instance in
+``fake_servicenow.py`` (mounted in-process) with ``ServiceNowExtractor``,
+then resyncs after touching a few rows. ``--sequential`` runs the old
+approach for comparison: one table after another, fixed-size offset
+pages, every row held in memory until the table is done.
+
+    python benchmarks/bench_extract.py --rows 200000 --latency-ms 50 --row-latency-us 20
+    python benchmarks/bench_extract.py --rows 200000 --latency-ms 50 --row-latency-us 20 --sequential
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+
+root = Path(__file__).resolve().parents[1]
+sys.path.append(str(root))
+
+from app.models.database import Base, build_engine
+from app.services.servicenow_extractor import DEFAULT_TABLES, ServiceNowExtractor
+from benchmarks.fake_servicenow import FakeSettings, create_app
+from sqlalchemy.orm import sessionmaker
+
+INSTANCE = "http://fake"
+
+
+async def sequential_pull(client: httpx.AsyncClient, out_dir: str, page_size: int) -> int:
+    total = 0
+    for table in DEFAULT_TABLES:
+        rows: List[dict] = []
+        while True:
+            response = await client.get(
+                f"{INSTANCE}/api/now/table/{table}",
+                params={"sysparm_limit": page_size, "sysparm_offset": len(rows)},
+                auth=("admin", "admin"),
+            )
+            response.raise_for_status()
+            page = response.json()["result"]
+            if not page:
+                break
+            rows.extend(page)
+        with open(os.path.join(out_dir, f"{table}.json"), "w") as handle:
+            json.dump(rows, handle)
+        total += len(rows)
+    return total
+
+
+async def run_benchmark(args) -> Dict[str, float]:
+    settings = FakeSettings(
+        tables={table: args.rows for table in DEFAULT_TABLES},
+        latency=args.latency_ms / 1000,
+        row_latency=args.row_latency_us / 1_000_000,
+        rate_limit=args.rate_limit,
+        retry_after=0.2,
+    )
+    fake = create_app(settings)
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=fake), timeout=None)
+    with tempfile.TemporaryDirectory() as tmp:
+        results: Dict[str, float] = {}
+        started = time.perf_counter()
+        if args.sequential:
+            rows = await sequential_pull(client, tmp, args.page_size)
+        else:
+            engine = build_engine(f"sqlite:///{tmp}/bench.db")
+            Base.metadata.create_all(bind=engine)
+            extractor = ServiceNowExtractor(
+                client=client,
+                root=tmp,
+                session_factory=sessionmaker(bind=engine),
+                max_connections=args.connections,
+                partitions=args.partitions,
+                page_size=args.page_size,
+                lag=0,
+            )
+            summary = await extractor.sync(INSTANCE, "admin", "admin")
+            rows = sum(table.get("rows", 0) for table in summary.values())
+        elapsed = time.perf_counter() - started
+        results.update(rows=rows, seconds=elapsed, rows_per_second=rows / elapsed)
+        results.update(requests=fake.state.stats.requests, throttled=fake.state.stats.throttled)
+        if not args.sequential:
+            await asyncio.sleep(1)
+            rng = random.Random(0)
+            for table in DEFAULT_TABLES:
+                fake.state.tables[table].touch(args.touch, rng)
+            requests = fake.state.stats.requests
+            started = time.perf_counter()
+            summary = await extractor.sync(INSTANCE, "admin", "admin")
+            results.update(
+                resync_rows=sum(table.get("rows", 0) for table in summary.values()),
+                resync_seconds=time.perf_counter() - started,
+                resync_requests=fake.state.stats.requests - requests,
+            )
+            engine.dispose()
+    await client.aclose()
+    return results
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Table API extraction benchmark")
+    parser.add_argument("--rows", type=int, default=50000, help="rows in each table")
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--row-latency-us", type=float, default=20)
+    parser.add_argument("--rate-limit", type=int, default=0)
+    parser.add_argument("--connections", type=int, default=8)
+    parser.add_argument("--partitions", type=int, default=4)
+    parser.add_argument("--page-size", type=int, default=1000)
+    parser.add_argument("--touch", type=int, default=100, help="rows per table updated before the resync")
+    parser.add_argument("--sequential", action="store_true", help="one table at a time, buffered (old approach)")
+    return parser.parse_args(argv)
+
+
+def main() -> None:
+    args = parse_args()
+    results = asyncio.run(run_benchmark(args))
+    width = max(len(name) for name in results)
+    for name, value in results.items():
+        shown = f"{value:.3f}" if isinstance(value, float) else str(value)
+        print(f"{name:<{width}}  {shown}")
+
+
+if __name__ == "__main__":
+    main()
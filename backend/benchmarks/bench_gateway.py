@@ -0,0 +1,141 @@
+"""Micro-benchmark for AIGateway.generate_config against the fake OpenAI API.
+
+Drives the real gateway (semantic cache, coalescing, embedding batching) with
+a configurable request mix and reports latency percentiles, throughput, cache
+hit ratio and upstream call counts. The fake API runs in-process through
+``httpx.ASGITransport`` unless ``--base-url`` points at a running server.
+
+    python benchmarks/bench_gateway.py --requests 2000 --concurrency 64 \\
+        --unique 200 --distribution zipf --chat-latency-ms 300
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+import numpy as np
+from openai import AsyncOpenAI
+
+root = Path(__file__).resolve().parents[1]
+sys.path.append(str(root))
+
+from app.services.ai_gateway import AIGateway
+from benchmarks.fake_openai import FakeSettings, create_app
+
+COMPLEXITIES = ["simple", "medium", "advanced"]
+
+
+def build_workload(args, rng: np.random.Generator) -> List[tuple]:
+    """Draw ``(requirements, complexity)`` pairs with the requested repetition."""
+    if args.distribution == "zipf":
+        ranks = np.arange(1, args.unique + 1, dtype=np.float64)
+        weights = ranks ** -args.zipf_s
+        picks = rng.choice(args.unique, size=args.requests, p=weights / weights.sum())
+    else:
+        picks = rng.integers(0, args.unique, size=args.requests)
+    workload = []
+    for pick in picks:
+        requirements = f"Story {pick}: auto-assign incidents for group {pick % 17} and notify manager {pick}"
+        if rng.random() < args.paraphrase_rate:
+            # Same words, different whitespace and a filler word: misses the exact tier only.
+            requirements = "Please,  " + requirements
+        workload.append((requirements, COMPLEXITIES[pick % len(COMPLEXITIES)]))
+    return workload
+
+
+async def run_benchmark(args) -> Dict[str, float]:
+    rng = np.random.default_rng(args.seed)
+    workload = build_workload(args, rng)
+
+    if args.base_url:
+        http = httpx.AsyncClient(base_url=args.base_url.rsplit("/v1", 1)[0])
+        base_url = args.base_url
+    else:
+        settings = FakeSettings(
+            chat_latency=args.chat_latency_ms / 1000,
+            chat_jitter=args.chat_jitter_ms / 1000,
+            embed_latency=args.embed_latency_ms / 1000,
+            embed_jitter=args.embed_jitter_ms / 1000,
+            error_rate=args.error_rate,
+            dim=args.dim,
+            seed=args.seed,
+        )
+        http = httpx.AsyncClient(transport=httpx.ASGITransport(app=create_app(settings)), base_url="http://fake")
+        base_url = "http://fake/v1"
+    client = AsyncOpenAI(api_key="bench", base_url=base_url, http_client=http, max_retries=args.max_retries)
+    gateway = AIGateway(client=client)
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies: List[float] = []
+    errors = 0
+
+    async def one(requirements: str, complexity: str) -> None:
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await gateway.generate_config(requirements, complexity)
+            except RuntimeError:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(req, cx) for req, cx in workload))
+    elapsed = time.perf_counter() - started
+
+    upstream = (await http.get("/stats")).json()
+    await http.aclose()
+    stats = gateway.stats()
+    ms = np.array(latencies) * 1000
+    return {
+        "requests": len(workload),
+        "errors": errors,
+        "elapsed_s": elapsed,
+        "throughput_rps": len(workload) / elapsed,
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "cache_hit_ratio": stats["cache"]["hit_ratio"],
+        "exact_hits": stats["cache"]["exact_hits"],
+        "coalesced": stats["coalescing"]["coalesced"],
+        "upstream_chat_calls": upstream["chat_calls"],
+        "upstream_embedding_calls": upstream["embedding_calls"],
+        "upstream_embedding_inputs": upstream["embedding_inputs"],
+    }
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="AIGateway micro-benchmark")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--unique", type=int, default=100, help="distinct prompts in the workload")
+    parser.add_argument("--distribution", choices=["uniform", "zipf"], default="zipf")
+    parser.add_argument("--zipf-s", type=float, default=1.1)
+    parser.add_argument("--paraphrase-rate", type=float, default=0.0)
+    parser.add_argument("--chat-latency-ms", type=float, default=200)
+    parser.add_argument("--chat-jitter-ms", type=float, default=50)
+    parser.add_argument("--embed-latency-ms", type=float, default=20)
+    parser.add_argument("--embed-jitter-ms", type=float, default=5)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--max-retries", type=int, default=0)
+    parser.add_argument("--base-url", default=os.getenv("BENCH_OPENAI_BASE_URL"))
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args(argv)
+
+
+def main() -> None:
+    args = parse_args()
+    results = asyncio.run(run_benchmark(args))
+    width = max(len(name) for name in results)
+    for name, value in results.items():
+        shown = f"{value:.3f}" if isinstance(value, float) else str(value)
+        print(f"{name:<{width}}  {shown}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Health scoring benchmark.
+
+Writes extracts of the default configuration tables as Discovery would,
+using the records of the fake instance in ``fake_servicenow.py``, then
+times loading them into columns from the NDJSON, loading them again from
+the saved columns (a re-score after a rule change), and running the rules.
+
+    python benchmarks/bench_health.py --rows 100000
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+root = Path(__file__).resolve().parents[1]
+sys.path.append(str(root))
+
+from app.services.health_scoring import evaluate, health_report, load_store
+from app.services.servicenow_extractor import DEFAULT_TABLES
+from benchmarks.fake_servicenow import FakeSettings, create_app
+
+
+def write_extracts(out_dir: str, rows: int) -> Dict[str, List[str]]:
+    fake = create_app(FakeSettings(tables={table: rows for table in DEFAULT_TABLES}))
+    files = {}
+    for table in DEFAULT_TABLES:
+        directory = os.path.join(out_dir, table)
+        os.makedirs(directory)
+        path = os.path.join(directory, "20260101T000000-full.ndjson")
+        with open(path, "w") as handle:
+            for index in range(rows):
+                handle.write(json.dumps(fake.state.tables[table].record(index)) + "\n")
+        files[table] = [path]
+    return files
+
+
+def run_benchmark(args) -> Dict[str, float]:
+    with tempfile.TemporaryDirectory() as tmp:
+        files = write_extracts(tmp, args.rows)
+        results: Dict[str, float] = {"records": args.rows * len(files)}
+        started = time.perf_counter()
+        load_store(files)
+        results["load_seconds"] = time.perf_counter() - started
+        started = time.perf_counter()
+        store = load_store(files)
+        results["reload_seconds"] = time.perf_counter() - started
+        started = time.perf_counter()
+        for _ in range(args.repeat):
+            report = health_report(evaluate(store))
+        results["score_seconds"] = (time.perf_counter() - started) / args.repeat
+        results["health_score"] = report["health_score"]
+    return results
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Health scoring benchmark")
+    parser.add_argument("--rows", type=int, default=50000, help="rows in each table")
+    parser.add_argument("--repeat", type=int, default=10, help="scoring passes to average")
+    return parser.parse_args(argv)
+
+
+def main() -> None:
+    args = parse_args()
+    results = run_benchmark(args)
+    width = max(len(name) for name in results)
+    for name, value in results.items():
+        shown = f"{value:.3f}" if isinstance(value, float) else str(value)
+        print(f"{name:<{width}}  {shown}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""Login throughput benchmark.
+
+Fires a burst of ``/api/auth/login`` requests at the real auth router (on a
+throwaway SQLite database) while a probe measures event-loop lag: how late
+a timer scheduled every ``--probe-interval-ms`` actually fires. Lag is what
+every other request on the worker pays while hashing runs on the loop;
+``--inline`` swaps in the old behaviour of verifying on the loop thread for
+comparison.
+
+    python benchmarks/bench_login.py --requests 200 --concurrency 50 --rounds 12
+    python benchmarks/bench_login.py --requests 200 --concurrency 50 --rounds 12 --inline
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+import numpy as np
+from fastapi import FastAPI
+
+root = Path(__file__).resolve().parents[1]
+sys.path.append(str(root))
+
+from passlib.context import CryptContext
+
+from app import auth
+from app.api import auth as auth_api
+from app.models.database import Base, Client, SessionLocal, async_session_factory, build_async_engine, build_engine, get_db
+from app.services.password_hasher import PasswordHasher
+
+PASSWORD = "correct horse battery staple"
+
+
+class InlineHasher(PasswordHasher):
+    """Verifies on the calling thread, as the handlers used to."""
+
+    async def _run(self, fn, *args):
+        return fn(*args)
+
+
+def build_app(args, db_path: str):
+    context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=args.rounds)
+    hasher_cls = InlineHasher if args.inline else PasswordHasher
+    auth_api.password_hasher = hasher_cls(context, workers=args.workers, max_queue=args.queue)
+
+    engine = build_engine(f"sqlite:///{db_path}")
+    Base.metadata.create_all(bind=engine)
+    hashed = context.hash(PASSWORD)
+    with SessionLocal(bind=engine) as db:
+        for i in range(args.users):
+            db.add(Client(email=f"user{i}@example.com", name="U", company="Co", hashed_password=hashed))
+        db.commit()
+    engine.dispose()
+
+    async_engine = build_async_engine(f"sqlite:///{db_path}")
+    factory = async_session_factory(async_engine)
+
+    async def override_db():
+        async with factory() as db:
+            yield db
+
+    app = FastAPI()
+    app.include_router(auth_api.router)
+    app.dependency_overrides[get_db] = override_db
+
+    return app, async_engine
+
+
+async def run_benchmark(args) -> Dict[str, float]:
+    original = auth_api.password_hasher
+    try:
+        return await _run(args)
+    finally:
+        auth_api.password_hasher.shutdown()
+        auth_api.password_hasher = original
+
+
+async def _run(args) -> Dict[str, float]:
+    with tempfile.TemporaryDirectory() as tmp:
+        app, engine = build_app(args, os.path.join(tmp, "bench.db"))
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+            semaphore = asyncio.Semaphore(args.concurrency)
+            latencies: List[float] = []
+            statuses: Dict[int, int] = {}
+            probes: List[float] = []
+            done = asyncio.Event()
+
+            async def login(i: int) -> None:
+                async with semaphore:
+                    start = time.perf_counter()
+                    resp = await http.post(
+                        "/api/auth/login",
+                        json={"email": f"user{i % args.users}@example.com", "password": PASSWORD},
+                    )
+                    latencies.append(time.perf_counter() - start)
+                    statuses[resp.status_code] = statuses.get(resp.status_code, 0) + 1
+
+            async def probe() -> None:
+                interval = args.probe_interval_ms / 1000
+                while not done.is_set():
+                    due = time.perf_counter() + interval
+                    await asyncio.sleep(interval)
+                    probes.append(max(0.0, time.perf_counter() - due))
+
+            prober = asyncio.create_task(probe())
+            started = time.perf_counter()
+            await asyncio.gather(*(login(i) for i in range(args.requests)))
+            elapsed = time.perf_counter() - started
+            done.set()
+            await prober
+        await engine.dispose()
+
+    login_ms = np.array(latencies) * 1000
+    lag_ms = np.array(probes or [0.0]) * 1000
+    return {
+        "requests": args.requests,
+        "ok": statuses.get(200, 0),
+        "shed_503": statuses.get(503, 0),
+        "elapsed_s": elapsed,
+        "logins_per_s": args.requests / elapsed,
+        "login_p50_ms": float(np.percentile(login_ms, 50)),
+        "login_p95_ms": float(np.percentile(login_ms, 95)),
+        "loop_lag_p50_ms": float(np.percentile(lag_ms, 50)),
+        "loop_lag_p99_ms": float(np.percentile(lag_ms, 99)),
+        "loop_lag_max_ms": float(lag_ms.max()),
+    }
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Login throughput benchmark")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--rounds", type=int, default=auth.BCRYPT_ROUNDS)
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1))
+    parser.add_argument("--queue", type=int, default=256)
+    parser.add_argument("--probe-interval-ms", type=float, default=10)
+    parser.add_argument("--inline", action="store_true", help="verify on the event loop (old behaviour)")
+    return parser.parse_args(argv)
+
+
+def main() -> None:
+    args = parse_args()
+    results = asyncio.run(run_benchmark(args))
+    width = max(len(name) for name in results)
+    for name, value in results.items():
+        shown = f"{value:.3f}" if isinstance(value, float) else str(value)
+        print(f"{name:<{width}}  {shown}")
+
+
+if __name__ == "__main__":
+    main()
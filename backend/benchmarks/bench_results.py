@@ -0,0 +1,126 @@
+"""Analysis results benchmark.
+
+Serves one completed workflow with a large result from the real
+workflows router (on a throwaway SQLite database) and times repeated
+``/api/results`` loads: a first load in each encoding, a dashboard's
+projection, and revalidation with ``If-None-Match``. ``rebuild`` is the
+old cost of a load for comparison: validating the result against the
+response model, serializing it and gzipping it on every request.
+
+    python benchmarks/bench_results.py --recommendations 20000 --requests 200
+"""
+import argparse
+import asyncio
+import gzip
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+from fastapi import FastAPI
+
+root = Path(__file__).resolve().parents[1]
+sys.path.append(str(root))
+
+from app.api import workflows as workflows_api
+from app.models.database import Base, Workflow, async_session_factory, build_async_engine, build_engine, get_db
+from app.services.workflow_results import encode_result
+from sqlalchemy.orm import sessionmaker
+
+WORKFLOW_ID = "bench"
+SIZES = (("result_kb", "body"), ("gzip_kb", "gzip"), ("br_kb", "br"))
+
+
+def make_result(count: int) -> dict:
+    return {
+        "health_score": 61,
+        "recommendations": [
+            {
+                "title": f"Move GlideRecord queries out of loops ({i})",
+                "priority": "high",
+                "rule": "query_in_loop",
+                "detail": f"sys_script: rule {i} queries task inside a while loop",
+                "affected": i,
+                "impact": 1.5,
+                "examples": [f"sys_script: rule {i} (line {i % 40})"],
+            }
+            for i in range(count)
+        ],
+        "estimated_savings": "$45,000/year",
+    }
+
+
+async def timed(client: httpx.AsyncClient, count: int, **kwargs) -> float:
+    started = time.perf_counter()
+    for _ in range(count):
+        response = await client.get(f"/api/results/{WORKFLOW_ID}", **kwargs)
+        assert response.status_code in (200, 304), response.text
+    return (time.perf_counter() - started) / count * 1000
+
+
+async def run_benchmark(args) -> Dict[str, float]:
+    result = make_result(args.recommendations)
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite:///{tmp}/bench.db"
+        engine = build_engine(url)
+        Base.metadata.create_all(bind=engine)
+        started = time.perf_counter()
+        stored = encode_result(WORKFLOW_ID, result)
+        encode_seconds = time.perf_counter() - started
+        sizes = {name: len(getattr(stored, column)) / 1024 for name, column in SIZES}
+        with sessionmaker(bind=engine)() as db:
+            db.add(Workflow(id=WORKFLOW_ID, status="completed", result=result))
+            db.add(stored)
+            db.commit()
+        engine.dispose()
+
+        async_factory = async_session_factory(build_async_engine(url))
+
+        async def override_db():
+            async with async_factory() as db:
+                yield db
+
+        app = FastAPI()
+        app.include_router(workflows_api.router)
+        app.dependency_overrides[get_db] = override_db
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=None)
+
+        started = time.perf_counter()
+        for _ in range(args.requests):
+            payload = workflows_api.AnalysisResult(workflow_id=WORKFLOW_ID, **result).model_dump_json()
+            gzip.compress(payload.encode("utf-8"), 6)
+        rebuild_ms = (time.perf_counter() - started) / args.requests * 1000
+
+        results: Dict[str, float] = dict(sizes, encode_seconds=encode_seconds, rebuild_ms=rebuild_ms)
+        for encoding in ("identity", "gzip", "br"):
+            results[f"{encoding}_ms"] = await timed(client, args.requests, headers={"Accept-Encoding": encoding})
+        fields = {"fields": "health_score,estimated_savings,recommendations"}
+        headers = {"Accept-Encoding": "br"}
+        response = await client.get(f"/api/results/{WORKFLOW_ID}", params=fields, headers=headers)
+        results["projection_ms"] = await timed(client, args.requests, params=fields, headers=headers)
+        headers["If-None-Match"] = response.headers["etag"]
+        results["not_modified_ms"] = await timed(client, args.requests, params=fields, headers=headers)
+        await client.aclose()
+    return results
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Analysis results benchmark")
+    parser.add_argument("--recommendations", type=int, default=20000, help="size of the result")
+    parser.add_argument("--requests", type=int, default=200, help="loads timed for each case")
+    return parser.parse_args(argv)
+
+
+def main() -> None:
+    args = parse_args()
+    results = asyncio.run(run_benchmark(args))
+    width = max(len(name) for name in results)
+    for name, value in results.items():
+        shown = f"{value:.3f}" if isinstance(value, float) else str(value)
+        print(f"{name:<{width}}  {shown}")
+
+
+if __name__ == "__main__":
+    main()
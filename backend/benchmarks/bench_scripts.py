@@ -0,0 +1,83 @@
+"""Script analysis benchmark.
+
+Generates distinct scripts of a few kilobytes each, built from the script
+variants of the fake instance in ``fake_servicenow.py``. Times checking
+them one after another in this process (the old critical path),
+``ScriptAnalyzer`` with an empty cache, and again once they are cached
+with a share of them changed, as in a repeat assessment.
+
+    python benchmarks/bench_scripts.py --scripts 20000 --processes 4
+"""
+import argparse
+import asyncio
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+root = Path(__file__).resolve().parents[1]
+sys.path.append(str(root))
+
+from app.models.database import Base, build_engine
+from app.services.script_analyzer import ScriptAnalyzer
+from app.services.script_checks import analyze_batch
+from benchmarks.fake_servicenow import _SCRIPTS
+from sqlalchemy.orm import sessionmaker
+
+
+def make_scripts(count: int, blocks: int) -> List[str]:
+    return [
+        "".join(f"// block {index}.{block}\n{_SCRIPTS[(index + block) % len(_SCRIPTS)]}" for block in range(blocks))
+        for index in range(count)
+    ]
+
+
+async def run_benchmark(args) -> Dict[str, float]:
+    scripts = make_scripts(args.scripts, args.blocks)
+    results: Dict[str, float] = {"scripts": len(scripts), "kilobytes": sum(map(len, scripts)) // 1024}
+    started = time.perf_counter()
+    analyze_batch(scripts)
+    results["inline_seconds"] = time.perf_counter() - started
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = build_engine(f"sqlite:///{tmp}/bench.db")
+        Base.metadata.create_all(bind=engine)
+        factory = sessionmaker(bind=engine)
+        analyzer = ScriptAnalyzer(session_factory=factory, processes=args.processes, batch_size=args.batch)
+        # Started outside the timings, as in a running app.
+        await asyncio.get_running_loop().run_in_executor(analyzer._executor(), analyze_batch, [])
+        started = time.perf_counter()
+        await analyzer.analyze(scripts)
+        results["pool_seconds"] = time.perf_counter() - started
+        changed = int(len(scripts) * args.changed)
+        scripts[:changed] = [script + "\ngs.log('changed');\n" for script in scripts[:changed]]
+        started = time.perf_counter()
+        await analyzer.analyze(scripts)
+        results["repeat_seconds"] = time.perf_counter() - started
+        results["repeat_analyzed"] = analyzer.analyzed - len(scripts)
+        analyzer.close()
+        engine.dispose()
+    return results
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Script analysis benchmark")
+    parser.add_argument("--scripts", type=int, default=20000)
+    parser.add_argument("--blocks", type=int, default=20, help="script variants concatenated into each script")
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--batch", type=int, default=200, help="scripts per pool task")
+    parser.add_argument("--changed", type=float, default=0.02, help="share of scripts changed before the repeat")
+    return parser.parse_args(argv)
+
+
+def main() -> None:
+    args = parse_args()
+    results = asyncio.run(run_benchmark(args))
+    width = max(len(name) for name in results)
+    for name, value in results.items():
+        shown = f"{value:.3f}" if isinstance(value, float) else str(value)
+        print(f"{name:<{width}}  {shown}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Recall vs latency of the semantic cache indexes.
+
+Builds an exact index and IVF indexes over synthetic clustered embeddings and
+reports, for each ``nprobe`` setting, recall@1 against the exact scan and
+per-query latency.
+
+    python benchmarks/bench_vector_index.py --rows 200000 --dim 384 --nlist 512
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+root = Path(__file__).resolve().parents[1]
+sys.path.append(str(root))
+
+from app.services.vector_index import ExactIndex, IVFIndex
+
+
+def clustered_vectors(rows: int, dim: int, clusters: int, spread: float, rng) -> np.ndarray:
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=rows)
+    data = centers[labels] + spread * rng.normal(size=(rows, dim)).astype(np.float32)
+    return data / np.linalg.norm(data, axis=1, keepdims=True)
+
+
+def timed_search(index, vectors, queries):
+    latencies = []
+    results = []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(index.search(vectors, query)[0])
+        latencies.append(time.perf_counter() - start)
+    return np.array(results), np.array(latencies) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--clusters", type=int, default=2000)
+    parser.add_argument("--spread", type=float, default=0.5)
+    parser.add_argument("--noise", type=float, default=0.2, help="query perturbation relative to a unit vector")
+    parser.add_argument("--nlist", type=int, default=256)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32, 64])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    vectors = clustered_vectors(args.rows, args.dim, args.clusters, args.spread, rng)
+    picks = rng.integers(0, args.rows, size=args.queries)
+    noise = rng.normal(size=(args.queries, args.dim)).astype(np.float32) / np.sqrt(args.dim)
+    queries = vectors[picks] + args.noise * noise
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    exact = ExactIndex()
+    for row in range(args.rows):
+        exact.add(row, vectors)
+    truth, exact_ms = timed_search(exact, vectors, queries)
+
+    start = time.perf_counter()
+    ivf = IVFIndex(nlist=args.nlist, train_size=args.rows + 1)
+    for row in range(args.rows):
+        ivf.add(row, vectors)
+    ivf.train(vectors)
+    build_s = time.perf_counter() - start
+
+    print(f"rows={args.rows} dim={args.dim} queries={args.queries} nlist={args.nlist} ivf_build={build_s:.2f}s")
+    print(f"{'index':<16}{'recall@1':>10}{'mean ms':>10}{'p95 ms':>10}")
+    print(f"{'exact':<16}{1.0:>10.3f}{exact_ms.mean():>10.3f}{np.percentile(exact_ms, 95):>10.3f}")
+    for nprobe in args.nprobe:
+        ivf.nprobe = nprobe
+        found, ms = timed_search(ivf, vectors, queries)
+        recall = float(np.mean(found == truth))
+        label = f"ivf nprobe={nprobe}"
+        print(f"{label:<16}{recall:>10.3f}{ms.mean():>10.3f}{np.percentile(ms, 95):>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""Local stand-in for the OpenAI chat-completions and embeddings endpoints.
+
+Embeddings are deterministic: each word hashes to a fixed random vector and a
+text embeds to the normalized sum of its words, so prompts that share most of
+their words land close together, like real embeddings. Latency, jitter and
+error rate are configurable per endpoint, and ``GET /stats`` reports how many
+upstream calls were made.
+
+Run standalone and point ``OPENAI_BASE_URL`` at it::
+
+    python benchmarks/fake_openai.py --port 8100 --chat-latency-ms 800
+    OPENAI_BASE_URL=http://localhost:8100/v1 uvicorn main:app
+
+or mount it in-process with ``httpx.ASGITransport`` (see bench_gateway.py).
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+import uuid
+import zlib
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import numpy as np
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+_WORD = re.compile(r"\w+")
+
+
+@dataclass
+class FakeSettings:
+    chat_latency: float = 0.5
+    chat_jitter: float = 0.1
+    embed_latency: float = 0.05
+    embed_jitter: float = 0.01
+    error_rate: float = 0.0
+    dim: int = 256
+    seed: int = 0
+
+
+@dataclass
+class FakeStats:
+    chat_calls: int = 0
+    embedding_calls: int = 0
+    embedding_inputs: int = 0
+    errors: int = 0
+    models: Dict[str, int] = field(default_factory=dict)
+
+
+def embed_text(text: str, dim: int, seed: int = 0) -> List[float]:
+    vec = np.zeros(dim, dtype=np.float64)
+    for word in _WORD.findall(text.lower()) or [""]:
+        rng = np.random.default_rng(zlib.crc32(word.encode("utf-8")) ^ seed)
+        vec += rng.normal(size=dim)
+    norm = np.linalg.norm(vec)
+    return (vec / norm if norm else vec).tolist()
+
+
+def create_app(settings: Optional[FakeSettings] = None) -> FastAPI:
+    settings = settings or FakeSettings()
+    stats = FakeStats()
+    rng = random.Random(settings.seed)
+    app = FastAPI(title="Fake OpenAI")
+    app.state.settings = settings
+    app.state.stats = stats
+
+    async def delay(base: float, jitter: float) -> None:
+        await asyncio.sleep(max(0.0, rng.gauss(base, jitter)))
+
+    def maybe_error() -> Optional[JSONResponse]:
+        if rng.random() >= settings.error_rate:
+            return None
+        stats.errors += 1
+        status = rng.choice([429, 500, 503])
+        return JSONResponse(
+            status_code=status,
+            content={"error": {"message": f"Simulated upstream error {status}", "type": "server_error", "code": status}},
+        )
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        stats.embedding_calls += 1
+        stats.embedding_inputs += len(inputs)
+        await delay(settings.embed_latency, settings.embed_jitter)
+        error = maybe_error()
+        if error:
+            return error
+        return {
+            "object": "list",
+            "model": body.get("model", "text-embedding-3-small"),
+            "data": [
+                {"object": "embedding", "index": i, "embedding": embed_text(text, settings.dim, settings.seed)}
+                for i, text in enumerate(inputs)
+            ],
+            "usage": {"prompt_tokens": sum(len(t.split()) for t in inputs), "total_tokens": 0},
+        }
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        model = body.get("model", "gpt-4-turbo")
+        stats.chat_calls += 1
+        stats.models[model] = stats.models.get(model, 0) + 1
+        prompt = body["messages"][-1]["content"]
+        content = f"// {model} config for: {prompt[-80:]}\nvar gr = new GlideRecord('incident');\n"
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+
+        if not body.get("stream"):
+            await delay(settings.chat_latency, settings.chat_jitter)
+            error = maybe_error()
+            if error:
+                return error
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [
+                    {"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}
+                ],
+                "usage": {"prompt_tokens": len(prompt.split()), "completion_tokens": len(content.split()), "total_tokens": 0},
+            }
+
+        error = maybe_error()
+        if error:
+            return error
+        pieces = re.findall(r"\S+\s*", content)
+
+        async def events():
+            for piece in pieces:
+                await delay(settings.chat_latency / len(pieces), settings.chat_jitter / len(pieces))
+                chunk = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}],
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.get("/stats")
+    async def get_stats():
+        return {
+            "chat_calls": stats.chat_calls,
+            "embedding_calls": stats.embedding_calls,
+            "embedding_inputs": stats.embedding_inputs,
+            "errors": stats.errors,
+            "models": stats.models,
+        }
+
+    return app
+
+
+def main() -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Fake OpenAI API server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--chat-latency-ms", type=float, default=500)
+    parser.add_argument("--chat-jitter-ms", type=float, default=100)
+    parser.add_argument("--embed-latency-ms", type=float, default=50)
+    parser.add_argument("--embed-jitter-ms", type=float, default=10)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    settings = FakeSettings(
+        chat_latency=args.chat_latency_ms / 1000,
+        chat_jitter=args.chat_jitter_ms / 1000,
+        embed_latency=args.embed_latency_ms / 1000,
+        embed_jitter=args.embed_jitter_ms / 1000,
+        error_rate=args.error_rate,
+        dim=args.dim,
+        seed=args.seed,
+    )
+    uvicorn.run(create_app(settings), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,328 @@
+"""Local stand-in for a ServiceNow instance's Table API.
+
+Serves ``GET /api/now/table/{table}`` over synthetic tables of any size.
+Rows are generated from their index rather than stored, so a table of
+millions of rows costs no memory. ``sys_updated_on`` rises with the
+index, a few rows share each second, and touched rows move to the end.
+The encoded queries the extractor sends are supported: ``^``
+conditions on any field, ``^NQ`` alternatives, and results ordered by
+``(sys_updated_on, sys_id)``, or the reverse with
+``ORDERBYDESCsys_updated_on``. Other ``ORDERBY`` directives are ignored.
+
+Basic auth, a page-size cap, per-request and per-row latency, a request
+rate limit (429 with ``Retry-After``) and random 503s are configurable.
+``POST /fake/touch/{table}?count=N`` updates rows as a user would, and
+``GET /stats`` reports the load served.
+
+Run standalone and point the extractor at it::
+
+    python benchmarks/fake_servicenow.py --port 8200 --rows 1000000 --rate-limit 50
+
+or mount it in-process with ``httpx.ASGITransport`` (see bench_extract.py).
+"""
+import argparse
+import asyncio
+import base64
+import heapq
+import itertools
+import random
+import re
+import time
+import zlib
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+DEFAULT_TABLES = {
+    "sys_script": 2000,
+    "sys_script_include": 1000,
+    "sys_ui_policy": 500,
+    "sys_ui_action": 500,
+    "sys_script_client": 800,
+    "sys_properties": 200,
+}
+_CONDITION = re.compile(r"^(\w+?)(>=|<=|!=|>|<|=)(.*)$")
+_SCRIPTS = [
+    "var gr = new GlideRecord('incident');\ngr.addQuery('active', true);\ngr.query();\nwhile (gr.next()) {\n"
+    "  gr.update();\n}\n",
+    "(function executeRule(current, previous) {\n  current.short_description = current.short_description.trim();\n"
+    "})(current, previous);\n",
+    "var count = new GlideAggregate('task');\ncount.addAggregate('COUNT');\ncount.query();\n",
+    "gs.log('debug: ' + current.number);\nvar user = gs.getUser();\n",
+    "var gr = new GlideRecord('incident');\ngr.query();\nwhile (gr.next()) {\n  var task = new GlideRecord('task');\n"
+    "  task.addQuery('parent', gr.getUniqueValue());\n  task.query();\n"
+    "  if (task.getRowCount() > 0) gs.log(gr.number);\n}\n",
+]
+
+
+@dataclass
+class FakeSettings:
+    tables: Dict[str, int] = field(default_factory=lambda: dict(DEFAULT_TABLES))
+    forbidden: Tuple[str, ...] = ()  # tables that answer 403, as with a missing ACL
+    username: str = "admin"
+    password: str = "admin"
+    max_page: int = 10000  # like glide.json.return_limit
+    latency: float = 0.02  # per request
+    row_latency: float = 0.00002  # per row returned
+    rate_limit: int = 0  # requests per second; 0 is unlimited
+    retry_after: float = 1.0
+    error_rate: float = 0.0
+    per_second: int = 3  # rows sharing each sys_updated_on
+    version: str = "glide-tokyo-07-08-2022__patch4-12-14-2022"  # glide.buildname in sys_properties
+    seed: int = 0
+
+
+@dataclass
+class FakeStats:
+    requests: int = 0
+    throttled: int = 0
+    errors: int = 0
+    rows: int = 0
+    page_sizes: List[int] = field(default_factory=list)
+
+
+class FakeTable:
+    def __init__(self, name: str, rows: int, per_second: int):
+        self.name = name
+        self.rows = rows
+        self.per_second = per_second
+        # Old enough that every generated row predates rows touched now.
+        self.start = datetime.utcnow().replace(microsecond=0) - timedelta(days=1, seconds=rows // per_second + 1)
+        self._prefix = f"{zlib.crc32(name.encode('utf-8')):08x}"
+        self.touched: Dict[int, str] = {}
+        self.overrides: Dict[int, dict] = {}  # fields of particular rows, e.g. a known property
+        self._touched_order: List[Tuple[str, str, int]] = []
+
+    def sys_id(self, index: int) -> str:
+        return f"{self._prefix}{index:024x}"
+
+    def created_on(self, index: int) -> str:
+        return (self.start + timedelta(seconds=index // self.per_second)).strftime(TIME_FORMAT)
+
+    def updated_on(self, index: int) -> str:
+        return self.touched.get(index) or self.created_on(index)
+
+    def record(self, index: int) -> dict:
+        record = {
+            "sys_id": self.sys_id(index),
+            "sys_created_on": self.created_on(index),
+            "sys_created_by": "system" if index % 4 else "admin",
+            "sys_updated_on": self.updated_on(index),
+            "sys_updated_by": "admin" if index in self.touched else "system",
+            "sys_mod_count": "1" if index in self.touched else "0",
+            "name": f"{self.name} {index}",
+            "active": "true" if index % 7 else "false",
+            "script": _SCRIPTS[index % len(_SCRIPTS)],
+        }
+        record.update(self.overrides.get(index, ()))
+        return record
+
+    def touch(self, count: int, rng: random.Random, when: Optional[str] = None) -> List[str]:
+        """Update ``count`` random rows at ``when`` (default now); return their sys_ids."""
+        when = when or datetime.utcnow().strftime(TIME_FORMAT)
+        indexes = rng.sample(range(self.rows), min(count, self.rows))
+        for index in indexes:
+            self.touched[index] = when
+        self._touched_order = sorted((when, self.sys_id(i), i) for i, when in self.touched.items())
+        return [self.sys_id(i) for i in indexes]
+
+    def ordered(self, after: Optional[str], inclusive: bool) -> Iterator[int]:
+        """Row indexes in (sys_updated_on, sys_id) order, from ``after`` on."""
+        first = 0
+        if after is not None:
+            seconds = (datetime.strptime(after, TIME_FORMAT) - self.start).total_seconds()
+            first = int(seconds if inclusive else seconds + 1) * self.per_second
+        for index in range(max(0, first), self.rows):
+            if index not in self.touched:
+                yield index
+        for when, _, index in self._touched_order:
+            if after is None or when > after or (inclusive and when == after):
+                yield index
+
+    def ordered_desc(self, until: Optional[str]) -> Iterator[int]:
+        """Row indexes in descending (sys_updated_on, sys_id) order, up to ``until``."""
+        for when, _, index in reversed(self._touched_order):
+            if until is None or when <= until:
+                yield index
+        last = self.rows - 1
+        if until is not None:
+            seconds = (datetime.strptime(until, TIME_FORMAT) - self.start).total_seconds()
+            last = min(last, (int(seconds) + 1) * self.per_second - 1)
+        for index in range(last, -1, -1):
+            if index not in self.touched:
+                yield index
+
+
+def _compare(op: str, value: str, wanted: str) -> bool:
+    return {
+        "=": value == wanted,
+        "!=": value != wanted,
+        ">": value > wanted,
+        ">=": value >= wanted,
+        "<": value < wanted,
+        "<=": value <= wanted,
+    }[op]
+
+
+def parse_query(encoded: str) -> List[List[Tuple[str, str, str]]]:
+    """``a>1^b=2^NQc<3`` -> ``[[("a", ">", "1"), ("b", "=", "2")], [("c", "<", "3")]]``."""
+    groups = []
+    for group in (encoded or "").split("^NQ"):
+        conditions = []
+        for term in filter(None, group.split("^")):
+            if term.startswith("ORDERBY"):
+                continue
+            match = _CONDITION.match(term)
+            if match is None:
+                raise ValueError(f"Unsupported query term {term!r}")
+            conditions.append(match.groups())
+        groups.append(conditions)
+    return groups
+
+
+def run_query(table: FakeTable, encoded: str) -> Iterator[int]:
+    descending = "ORDERBYDESCsys_updated_on" in (encoded or "")
+    streams = []
+    for conditions in parse_query(encoded):
+        after, inclusive, until = None, False, None
+        for name, op, value in conditions:
+            if name != "sys_updated_on":
+                continue
+            if op in (">", ">=", "=") and (after is None or value > after):
+                after, inclusive = value, op != ">"
+            if op in ("<=", "=") and (until is None or value < until):
+                until = value
+
+        def matches(index: int, conditions=conditions) -> bool:
+            record = table.record(index)
+            return all(_compare(op, record.get(name, ""), value) for name, op, value in conditions)
+
+        if descending:
+            rows: Iterator[int] = table.ordered_desc(until)
+            if after is not None:
+                rows = itertools.takewhile(lambda i, after=after: table.updated_on(i) >= after, rows)
+        else:
+            rows = table.ordered(after, inclusive)
+            if until is not None:
+                rows = itertools.takewhile(lambda i, until=until: table.updated_on(i) <= until, rows)
+        streams.append(filter(matches, rows))
+    seen = None
+    key = lambda i: (table.updated_on(i), table.sys_id(i))  # noqa: E731
+    for index in heapq.merge(*streams, key=key, reverse=descending):
+        if index != seen:
+            seen = index
+            yield index
+
+
+def create_app(settings: Optional[FakeSettings] = None) -> FastAPI:
+    settings = settings or FakeSettings()
+    stats = FakeStats()
+    rng = random.Random(settings.seed)
+    tables = {name: FakeTable(name, rows, settings.per_second) for name, rows in settings.tables.items()}
+    if "sys_properties" in tables:
+        tables["sys_properties"].overrides[0] = {"name": "glide.buildname", "value": settings.version, "script": ""}
+    bucket = {"tokens": float(settings.rate_limit), "at": time.monotonic()}
+    expected_auth = "Basic " + base64.b64encode(f"{settings.username}:{settings.password}".encode()).decode()
+    app = FastAPI(title="Fake ServiceNow")
+    app.state.settings = settings
+    app.state.stats = stats
+    app.state.tables = tables
+
+    def error(status: int, message: str, headers: Optional[dict] = None) -> JSONResponse:
+        body = {"error": {"message": message, "detail": None}, "status": "failure"}
+        return JSONResponse(status_code=status, content=body, headers=headers)
+
+    def throttled() -> bool:
+        # Token bucket: ``rate_limit`` requests a second, in bursts of up to that many.
+        if not settings.rate_limit:
+            return False
+        now = time.monotonic()
+        bucket["tokens"] = min(settings.rate_limit, bucket["tokens"] + (now - bucket["at"]) * settings.rate_limit)
+        bucket["at"] = now
+        if bucket["tokens"] < 1:
+            return True
+        bucket["tokens"] -= 1
+        return False
+
+    @app.get("/api/now/table/{name}")
+    async def table_api(name: str, request: Request):
+        stats.requests += 1
+        if request.headers.get("authorization") != expected_auth:
+            return error(401, "User Not Authenticated")
+        if throttled():
+            stats.throttled += 1
+            return error(429, "Rate limit exceeded", {"Retry-After": str(settings.retry_after)})
+        if rng.random() < settings.error_rate:
+            stats.errors += 1
+            return error(503, "Service Unavailable")
+        if name in settings.forbidden:
+            return error(403, "Insufficient rights to query records")
+        table = tables.get(name)
+        if table is None:
+            return error(400, f"Invalid table {name}")
+        params = request.query_params
+        limit = min(int(params.get("sysparm_limit", "10000")), settings.max_page)
+        offset = int(params.get("sysparm_offset", "0"))
+        try:
+            indexes = list(itertools.islice(run_query(table, params.get("sysparm_query", "")), offset, offset + limit))
+        except ValueError as exc:
+            return error(400, str(exc))
+        stats.rows += len(indexes)
+        stats.page_sizes.append(len(indexes))
+        await asyncio.sleep(settings.latency + settings.row_latency * len(indexes))
+        return {"result": [table.record(i) for i in indexes]}
+
+    @app.post("/fake/touch/{name}")
+    async def touch(name: str, count: int = 10):
+        return {"sys_ids": tables[name].touch(count, rng)}
+
+    @app.get("/stats")
+    async def get_stats():
+        return {
+            "requests": stats.requests,
+            "throttled": stats.throttled,
+            "errors": stats.errors,
+            "rows": stats.rows,
+            "largest_page": max(stats.page_sizes, default=0),
+        }
+
+    return app
+
+
+def main() -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Fake ServiceNow Table API server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8200)
+    parser.add_argument("--rows", type=int, default=None, help="rows in each default table")
+    parser.add_argument("--max-page", type=int, default=10000)
+    parser.add_argument("--latency-ms", type=float, default=20)
+    parser.add_argument("--row-latency-us", type=float, default=20)
+    parser.add_argument("--rate-limit", type=int, default=0)
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    tables = dict(DEFAULT_TABLES)
+    if args.rows:
+        tables = {name: args.rows for name in tables}
+    settings = FakeSettings(
+        tables=tables,
+        max_page=args.max_page,
+        latency=args.latency_ms / 1000,
+        row_latency=args.row_latency_us / 1_000_000,
+        rate_limit=args.rate_limit,
+        retry_after=args.retry_after,
+        error_rate=args.error_rate,
+        seed=args.seed,
+    )
+    uvicorn.run(create_app(settings), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
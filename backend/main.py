@@ -1,17 +1,47 @@
 from fastapi import FastAPI, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
+from contextlib import asynccontextmanager, suppress
 from datetime import datetime
+import asyncio
 import os
 
-from app.api import auth, documents, projects, ai, workflows
-from app.models.database import Base, engine
+from app.api import auth, chat, documents, projects, ai, workflows
+from app.auth import password_hasher
+from app.models.database import Base, close_db, engine
+from app.services.ai_gateway import close_ai_gateway
+from app.services.blob_store import get_blob_store
+from app.services.ingestion import close_ingestion_service, get_ingestion_service
+from app.services.retrieval import get_retrieval_engine
+from app.services.script_analyzer import close_script_analyzer
+from app.services.servicenow_extractor import close_servicenow_extractor
+from app.services.workflows import close_workflow_engine, get_workflow_engine
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    ingestion = get_ingestion_service()
+    ingestion.add_listener(get_retrieval_engine().document_ready)
+    await ingestion.start()
+    await get_workflow_engine().start()
+    blob_gc = asyncio.create_task(get_blob_store().run_gc())
+    yield
+    blob_gc.cancel()
+    with suppress(asyncio.CancelledError):
+        await blob_gc
+    await close_workflow_engine()
+    await close_servicenow_extractor()
+    close_script_analyzer()
+    await close_ingestion_service()
+    await close_ai_gateway()
+    password_hasher.shutdown()
+    await close_db()
 
 # Create FastAPI app
 app = FastAPI(
     title="AI ServiceNow Document Repository",
     version="1.0.0",
-    description="AI-powered document repository and RAG chatbot for ServiceNow consulting"
+    description="AI-powered document repository and RAG chatbot for ServiceNow consulting",
+    lifespan=lifespan,
 )
 
 # CORS middleware
@@ -31,6 +61,7 @@ app.include_router(auth.router)
 app.include_router(documents.router)
 app.include_router(projects.router)
 app.include_router(ai.router)
+app.include_router(chat.router)
 app.include_router(workflows.router)
 
 @app.get("/")
@@ -43,5 +74,5 @@ async def health_check():
     return {
         "status": "healthy",
         "timestamp": datetime.utcnow().isoformat(),
-        "version": "1.0.0"
+        "version": "1.0.0",
     }
\ No newline at end of file
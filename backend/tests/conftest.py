@@ -0,0 +1,26 @@
+import sys
+from pathlib import Path
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+root = Path(__file__).resolve().parents[1]
+sys.path.append(str(root))
+
+from app.models.database import Base
+
+
+@pytest.fixture
+def database_url(tmp_path):
+    """A SQLite database file of the test's own."""
+    return f"sqlite:///{tmp_path / 'test.db'}"
+
+
+@pytest.fixture
+def session_factory(database_url):
+    """A sessionmaker over ``database_url`` with every table created."""
+    engine = create_engine(database_url, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    yield sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    engine.dispose()
@@ -0,0 +1,273 @@
+import asyncio
+import json
+import os
+import sys
+import time
+import zlib
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from openai import OpenAIError
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+root = Path(__file__).resolve().parents[1]
+sys.path.append(str(root))
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api import ai
+from app.services.ai_gateway import AIGateway, get_ai_gateway
+from app.services.model_router import ModelRouter
+
+
+class FakeCompletions:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = 0
+        self.active = 0
+        self.peak = 0
+
+    async def create(self, model, messages, **kwargs):
+        if "fail" in messages[-1]["content"]:
+            raise OpenAIError("upstream error")
+        self.calls += 1
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.active -= 1
+        content = f"{model}: {messages[-1]['content'][-20:]}"
+        if kwargs.get("stream"):
+            return FakeStream(content)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+class FakeStream:
+    def __init__(self, content):
+        self.pieces = [content[i:i + 8] for i in range(0, len(content), 8)]
+
+    async def __aiter__(self):
+        for piece in self.pieces:
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=piece))])
+
+
+class FakeEmbeddings:
+    def __init__(self):
+        self.calls = 0
+        self.inputs = 0
+
+    async def create(self, model, input):
+        self.calls += 1
+        self.inputs += len(input)
+        vectors = [np.random.default_rng(zlib.crc32(text.encode())).normal(size=16).tolist() for text in input]
+        return SimpleNamespace(data=[SimpleNamespace(embedding=v) for v in vectors])
+
+
+class FakeClient:
+    def __init__(self, delay=0.0):
+        self.chat = SimpleNamespace(completions=FakeCompletions(delay))
+        self.embeddings = FakeEmbeddings()
+
+
+@pytest.mark.asyncio
+async def test_generate_config_caches_results():
+    client = FakeClient()
+    gateway = AIGateway(client=client)
+    first = await gateway.generate_config("create an incident table", "simple")
+    second = await gateway.generate_config("create an incident table", "simple")
+    assert first == second
+    assert client.chat.completions.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_model_calls_run_concurrently_up_to_the_model_limit(monkeypatch):
+    monkeypatch.setenv("AI_GATEWAY_MODEL_CONCURRENCY", "gpt-4o=2")
+    client = FakeClient(delay=0.05)
+    gateway = AIGateway(client=client)
+    start = time.perf_counter()
+    await asyncio.gather(*(gateway.generate_config(f"req {i}", "advanced") for i in range(6)))
+    elapsed = time.perf_counter() - start
+    assert client.chat.completions.peak == 2
+    assert elapsed < 6 * 0.05
+
+
+@pytest.mark.asyncio
+async def test_slow_model_call_times_out(monkeypatch):
+    monkeypatch.setenv("AI_GATEWAY_MODEL_TIMEOUTS", "gpt-3.5-turbo=0.01,gpt-4o=0.01")
+    gateway = AIGateway(client=FakeClient(delay=1.0))
+    with pytest.raises(RuntimeError, match="timed out"):
+        await gateway.generate_config("anything", "simple")
+
+
+@pytest.mark.asyncio
+async def test_identical_concurrent_prompts_share_one_model_call():
+    client = FakeClient(delay=0.05)
+    gateway = AIGateway(client=client)
+    results = await asyncio.gather(*(gateway.generate_config("same backlog", "medium") for _ in range(10)))
+    assert len(set(results)) == 1
+    assert client.chat.completions.calls == 1
+    assert gateway.stats()["coalescing"]["coalesced"] == 9
+
+
+@pytest.mark.asyncio
+async def test_coalesced_callers_all_receive_the_error(monkeypatch):
+    monkeypatch.setenv("AI_GATEWAY_MODEL_TIMEOUTS", "gpt-4-turbo=0.01,gpt-4o=0.01,gpt-3.5-turbo=0.01")
+    client = FakeClient(delay=1.0)
+    gateway = AIGateway(client=client)
+    results = await asyncio.gather(
+        *(gateway.generate_config("same backlog") for _ in range(3)), return_exceptions=True
+    )
+    assert all(isinstance(r, RuntimeError) for r in results)
+    # One attempt per model in the medium fallback chain, shared by all callers.
+    assert client.chat.completions.calls == 3
+
+
+def make_http(gateway):
+    app = FastAPI()
+    app.include_router(ai.router)
+    app.dependency_overrides[get_ai_gateway] = lambda: gateway
+    return TestClient(app)
+
+
+def parse_sse(body):
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def test_stream_endpoint_emits_tokens_then_replays_cache_hits():
+    client = FakeClient()
+    http = make_http(AIGateway(client=client))
+
+    body = {"requirements": "auto-assign P1 incidents", "complexity": "simple"}
+    resp = http.post("/api/generate_config/stream", json=body)
+    assert resp.headers["content-type"].startswith("text/event-stream")
+    events = parse_sse(resp.text)
+    tokens = [data["text"] for event, data in events if event == "token"]
+    assert len(tokens) > 1
+    assert events[-1] == ("done", {"config": "".join(tokens), "cached": False})
+
+    replay = parse_sse(http.post("/api/generate_config/stream", json=body).text)
+    assert replay == [("done", {"config": "".join(tokens), "cached": True})]
+    assert client.chat.completions.calls == 1
+
+
+def test_batch_endpoint_returns_per_item_results_with_batched_embeddings():
+    client = FakeClient()
+    gateway = AIGateway(client=client)
+    http = make_http(gateway)
+    # Seed the cache so lookups have something to compare against.
+    http.post("/api/generate_config", json={"requirements": "seed"})
+    client.embeddings.calls = client.embeddings.inputs = 0
+
+    items = [{"requirements": f"story {i % 10}"} for i in range(30)] + [{"requirements": "please fail"}]
+    resp = http.post("/api/generate_config/batch", json={"items": items, "concurrency": 4})
+    results = resp.json()["results"]
+    assert [r["index"] for r in results] == list(range(31))
+    assert all(r["config"] for r in results[:30])
+    assert results[-1]["config"] is None and "upstream error" in results[-1]["error"]
+    assert client.chat.completions.calls == 1 + 10
+    assert client.embeddings.calls == 1
+    assert client.embeddings.inputs == 11
+
+
+@pytest.mark.asyncio
+async def test_concurrent_lookups_share_one_embedding_call():
+    client = FakeClient()
+    gateway = AIGateway(client=client)
+    await gateway.cache.set("seed", "value")
+    client.embeddings.calls = 0
+    await asyncio.gather(*(gateway.cache.get(f"prompt {i}") for i in range(20)))
+    assert client.embeddings.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_gateway_benchmark_against_fake_openai():
+    from benchmarks.bench_gateway import parse_args, run_benchmark
+
+    args = parse_args([
+        "--requests", "60", "--concurrency", "8", "--unique", "6",
+        "--chat-latency-ms", "5", "--embed-latency-ms", "1", "--dim", "32",
+    ])
+    results = await run_benchmark(args)
+    assert results["errors"] == 0
+    assert results["upstream_chat_calls"] <= 6
+    assert results["cache_hit_ratio"] > 0.5
+    assert results["p50_ms"] <= results["p95_ms"] <= results["p99_ms"]
+
+
+class FlakyCompletions(FakeCompletions):
+    def __init__(self, failing):
+        super().__init__()
+        self.failing = failing
+        self.models = []
+
+    async def create(self, model, messages, **kwargs):
+        self.models.append(model)
+        if model in self.failing:
+            raise OpenAIError(f"{model} unavailable")
+        return await super().create(model, messages, **kwargs)
+
+
+@pytest.mark.asyncio
+async def test_failing_primary_falls_back_and_trips_its_breaker():
+    client = FakeClient()
+    client.chat.completions = FlakyCompletions({"gpt-4-turbo"})
+    gateway = AIGateway(client=client)
+    for i in range(7):
+        assert (await gateway.generate_config(f"req {i}")).startswith("gpt-4o")
+    # Five consecutive failures open the breaker; later calls skip gpt-4-turbo.
+    assert client.chat.completions.models.count("gpt-4-turbo") == 5
+    routing = gateway.stats()["routing"]
+    assert routing["models"]["gpt-4-turbo"]["state"] == "open"
+    assert routing["fallbacks"] == 7
+
+
+class StalledCompletions(FakeCompletions):
+    """Streams one piece, then stalls until the caller gives up."""
+
+    async def create(self, model, messages, **kwargs):
+        async def stream():
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=f"{model}: "))])
+            await asyncio.sleep(3600)
+
+        return stream()
+
+
+@pytest.mark.asyncio
+async def test_abandoned_half_open_trial_frees_the_model():
+    now = [0.0]
+    client = FakeClient()
+    client.chat.completions = FlakyCompletions({"gpt-4-turbo"})
+    gateway = AIGateway(client=client, router=ModelRouter(clock=lambda: now[0]))
+    model = gateway.router.primary("high")
+    for i in range(5):
+        await gateway._complete("high", f"req {i}")
+    assert gateway.stats()["routing"]["models"][model]["state"] == "open"
+
+    client.chat.completions = StalledCompletions()
+    messages = gateway._messages("trial")
+    # The client disconnects mid-stream (GeneratorExit), then a trial is cancelled while waiting.
+    for abandon in ("close", "cancel"):
+        now[0] += 60
+        assert gateway.router.candidates("high", 10)[0] == model
+        stream = gateway._stream("high", messages, 10)
+        assert (await stream.__anext__()).startswith(model)
+        assert gateway.router.candidates("high", 10)[0] != model  # trial in flight
+        if abandon == "close":
+            await stream.aclose()
+        else:
+            task = asyncio.ensure_future(stream.__anext__())
+            await asyncio.sleep(0.01)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+        assert gateway.router.candidates("high", 10)[0] == model
+        assert gateway.stats()["routing"]["models"][model]["state"] == "half_open"
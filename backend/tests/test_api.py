@@ -25,3 +25,7 @@ def test_health():
     resp = client.get("/health")
     assert resp.status_code == 200
     assert resp.json()["status"] == "healthy"
+    assert "auth_cache" not in resp.json() and "password_hasher" not in resp.json()
+
+def test_auth_stats_require_a_token():
+    assert client.get("/api/auth/stats").status_code == 403
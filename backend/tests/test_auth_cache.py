@@ -0,0 +1,131 @@
+import os
+import sys
+from pathlib import Path
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import event, update
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+root = Path(__file__).resolve().parents[1]
+sys.path.append(str(root))
+
+from app.api import auth as auth_api
+from app.auth import AuthService, principal_cache
+from app.models.database import Client, async_session_factory, build_async_engine, get_db
+from app.services.principal_cache import Principal, PrincipalCache
+
+
+def principal(client_id="c1", tier="starter"):
+    return Principal(client_id, "a@example.com", "A", "Co", tier, True, 0, None)
+
+
+def test_cache_expires_evicts_and_invalidates():
+    now = [0.0]
+    cache = PrincipalCache(max_size=2, ttl=10, clock=lambda: now[0])
+    cache.set("t1", principal("c1"))
+    cache.set("t2", principal("c2"), token_expires_in=3)
+    assert cache.get("t1").id == "c1"
+    now[0] = 5
+    assert cache.get("t2") is None  # token expired before the TTL
+    cache.set("t3", principal("c3"))
+    cache.set("t4", principal("c4"))
+    assert cache.get("t1") is None and cache.stats()["evictions"] == 1
+    cache.invalidate_client("c4")
+    assert cache.get("t4") is None and cache.get("t3").id == "c3"
+    stats = cache.stats()
+    assert stats["hits"] == 2 and stats["misses"] == 3 and stats["invalidations"] == 1
+
+
+def make_app(session_factory, database_url):
+    with session_factory() as db:
+        db.add(Client(id="c1", email="a@example.com", name="A", company="Co", hashed_password="x"))
+        db.commit()
+    async_engine = build_async_engine(database_url)
+    async_factory = async_session_factory(async_engine)
+    queries = []
+    event.listen(async_engine.sync_engine, "before_cursor_execute", lambda *args: queries.append(args[2]))
+
+    async def override_db():
+        async with async_factory() as db:
+            yield db
+
+    app = FastAPI()
+    app.include_router(auth_api.router)
+    app.dependency_overrides[get_db] = override_db
+    return TestClient(app), queries
+
+
+def test_repeat_requests_skip_the_client_lookup(session_factory, database_url):
+    principal_cache.clear()
+    client, queries = make_app(session_factory, database_url)
+    headers = {"Authorization": f"Bearer {AuthService.create_access_token({'sub': 'c1', 'ver': 0})}"}
+
+    assert client.get("/api/auth/me", headers=headers).json()["email"] == "a@example.com"
+    lookups = len(queries)
+    for _ in range(5):
+        assert client.get("/api/auth/me", headers=headers).status_code == 200
+    assert len(queries) == lookups
+    assert principal_cache.stats()["hits"] >= 5
+    stats = client.get("/api/auth/stats", headers=headers).json()
+    assert stats["principal_cache"]["hits"] >= 5 and "password_hasher" in stats
+
+
+def test_tier_change_deactivation_and_rotation_invalidate(session_factory, database_url):
+    principal_cache.clear()
+    client, _ = make_app(session_factory, database_url)
+    headers = {"Authorization": f"Bearer {AuthService.create_access_token({'sub': 'c1', 'ver': 0})}"}
+    assert client.get("/api/auth/me", headers=headers).json()["tier"] == "professional"
+
+    with session_factory() as db:
+        db.get(Client, "c1").tier = "enterprise"
+        db.commit()
+    assert client.get("/api/auth/me", headers=headers).json()["tier"] == "enterprise"
+
+    with session_factory() as db:
+        db.get(Client, "c1").token_version = 1
+        db.commit()
+    assert client.get("/api/auth/me", headers=headers).status_code == 401
+    headers = {"Authorization": f"Bearer {AuthService.create_access_token({'sub': 'c1', 'ver': 1})}"}
+    assert client.get("/api/auth/me", headers=headers).status_code == 200
+
+    with session_factory() as db:
+        db.get(Client, "c1").is_active = False
+        db.commit()
+    resp = client.get("/api/auth/me", headers=headers)
+    assert resp.status_code == 401 and resp.json()["detail"] == "Account is disabled"
+
+
+def test_invalid_token_is_rejected(session_factory, database_url):
+    client, _ = make_app(session_factory, database_url)
+    resp = client.get("/api/auth/me", headers={"Authorization": "Bearer not-a-jwt"})
+    assert resp.status_code == 401
+
+
+def test_invalidation_waits_for_the_commit(session_factory, database_url):
+    principal_cache.clear()
+    client, _ = make_app(session_factory, database_url)
+    headers = {"Authorization": f"Bearer {AuthService.create_access_token({'sub': 'c1', 'ver': 0})}"}
+    assert client.get("/api/auth/me", headers=headers).json()["tier"] == "professional"
+
+    # A request between the flush and the commit still reads, and caches, the old row.
+    with session_factory() as db:
+        db.get(Client, "c1").tier = "enterprise"
+        db.flush()
+        assert client.get("/api/auth/me", headers=headers).json()["tier"] == "professional"
+        db.commit()
+    assert client.get("/api/auth/me", headers=headers).json()["tier"] == "enterprise"
+
+    # ORM bulk updates skip the mapper events.
+    with session_factory() as db:
+        db.execute(update(Client).where(Client.id == "c1").values(is_active=False))
+        db.commit()
+    assert client.get("/api/auth/me", headers=headers).status_code == 401
+
+    # Nothing committed, nothing to invalidate.
+    with session_factory() as db:
+        db.get(Client, "c1").is_active = True
+        db.flush()
+        db.rollback()
+    assert not db.info
@@ -0,0 +1,95 @@
+import hashlib
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+root = Path(__file__).resolve().parents[1]
+sys.path.append(str(root))
+
+from app.models.database import Blob
+from app.services.blob_store import BlobStore
+
+
+def stage(store, name, data):
+    os.makedirs(store.staging_dir, exist_ok=True)
+    path = os.path.join(store.staging_dir, name)
+    Path(path).write_bytes(data)
+    return path, hashlib.sha256(data).hexdigest()
+
+
+def test_identical_content_is_stored_once_and_refcounted(tmp_path, session_factory):
+    store = BlobStore(root=str(tmp_path / "blobs"), grace=0)
+
+    first, sha = stage(store, "a", b"same export")
+    second, _ = stage(store, "b", b"same export")
+    path = store.adopt(first, sha)
+    assert store.adopt(second, sha) == path
+    assert not os.path.exists(second)
+    with session_factory() as db:
+        BlobStore.add_ref(db, sha, 11)
+        BlobStore.add_ref(db, sha, 11)
+        db.commit()
+        assert db.get(Blob, sha).ref_count == 2
+
+        BlobStore.release(db, sha)
+        db.commit()
+    assert store.collect_garbage(session_factory) == 0
+    assert os.path.exists(path)
+
+    with session_factory() as db:
+        BlobStore.release(db, sha)
+        db.commit()
+    assert store.collect_garbage(session_factory) == 1
+    assert not os.path.exists(path)
+    with session_factory() as db:
+        assert db.get(Blob, sha) is None
+
+
+def test_gc_respects_grace_period_and_sweeps_strays(tmp_path, session_factory):
+    store = BlobStore(root=str(tmp_path / "blobs"), grace=3600)
+    staged, sha = stage(store, "a", b"orphan")
+    path = store.adopt(staged, sha)
+
+    # No row was ever committed, but the file is too fresh to collect.
+    assert store.collect_garbage(session_factory) == 0
+    old = os.path.getmtime(path) - 7200
+    os.utime(path, (old, old))
+    assert store.collect_garbage(session_factory) == 1
+    assert not os.path.exists(path)
+
+
+def test_gc_and_a_concurrent_upload_of_the_same_content(tmp_path, session_factory):
+    store = BlobStore(root=str(tmp_path / "blobs"), grace=0)
+    staged, sha = stage(store, "a", b"shared export")
+    path = store.adopt(staged, sha)
+    with session_factory() as db:
+        BlobStore.add_ref(db, sha, 13)
+        BlobStore.release(db, sha)
+        db.commit()
+
+    # An upload referenced the blob and adopted its copy, but has not committed: GC waits for it.
+    with ThreadPoolExecutor(1) as pool, session_factory() as db:
+        BlobStore.add_ref(db, sha, 13)
+        staged, _ = stage(store, "b", b"shared export")
+        store.adopt(staged, sha)
+        gc = pool.submit(store.collect_garbage, session_factory)
+        time.sleep(0.2)
+        assert not gc.done()
+        db.commit()
+        assert gc.result() == 0
+    assert os.path.exists(path)
+
+    # GC got there first: the next upload puts the content back.
+    with session_factory() as db:
+        BlobStore.release(db, sha)
+        db.commit()
+    assert store.collect_garbage(session_factory) == 1 and not os.path.exists(path)
+    with session_factory() as db:
+        BlobStore.add_ref(db, sha, 13)
+        staged, _ = stage(store, "c", b"shared export")
+        assert store.adopt(staged, sha) == path
+        db.commit()
+        assert db.get(Blob, sha).ref_count == 1
+    assert Path(path).read_bytes() == b"shared export"
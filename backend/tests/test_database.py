@@ -0,0 +1,60 @@
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+import pytest
+from sqlalchemy import func, select, text
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+root = Path(__file__).resolve().parents[1]
+sys.path.append(str(root))
+
+from app.models import database
+from app.models.database import Base, Client, async_session_factory, async_url, build_async_engine, build_engine
+
+
+def test_async_url_picks_asyncio_drivers():
+    assert async_url("postgresql://u:secret@db:5432/app") == "postgresql+asyncpg://u:secret@db:5432/app"
+    assert async_url("postgresql+psycopg2://u@db/app") == "postgresql+asyncpg://u@db/app"
+    assert async_url("sqlite:///./app.db") == "sqlite+aiosqlite:///./app.db"
+    with pytest.raises(ValueError):
+        async_url("mysql://u@db/app")
+
+
+@pytest.mark.asyncio
+async def test_sqlite_engine_is_pooled_and_tuned(tmp_path):
+    engine = build_async_engine(f"sqlite:///{tmp_path / 'tuned.db'}")
+    try:
+        assert isinstance(engine.pool, AsyncAdaptedQueuePool)
+        assert engine.pool.size() == database.POOL_SIZE
+        async with engine.connect() as conn:
+            assert (await conn.execute(text("PRAGMA journal_mode"))).scalar() == "wal"
+            assert (await conn.execute(text("PRAGMA synchronous"))).scalar() == 1  # NORMAL
+            assert (await conn.execute(text("PRAGMA busy_timeout"))).scalar() == database.SQLITE_BUSY_TIMEOUT_MS
+    finally:
+        await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_concurrent_sessions_write_and_read_without_lock_errors(tmp_path):
+    url = f"sqlite:///{tmp_path / 'busy.db'}"
+    Base.metadata.create_all(bind=build_engine(url))
+    engine = build_async_engine(url)
+    factory = async_session_factory(engine)
+
+    async def register(i: int) -> int:
+        async with factory() as db:
+            db.add(Client(email=f"user{i}@example.com", name="U", company="Co", hashed_password="x"))
+            await db.commit()
+            return await db.scalar(select(func.count()).select_from(Client))
+
+    try:
+        counts = await asyncio.gather(*(register(i) for i in range(40)))
+        assert max(counts) == 40
+        async with factory() as db:
+            assert await db.scalar(select(func.count()).select_from(Client)) == 40
+    finally:
+        await engine.dispose()
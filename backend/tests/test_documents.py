@@ -0,0 +1,152 @@
+import os
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+root = Path(__file__).resolve().parents[1]
+sys.path.append(str(root))
+
+from app.api import documents
+from app.auth import get_current_user
+from app.models.database import (
+    Client,
+    DocumentChunk,
+    DocumentFile,
+    Project,
+    async_session_factory,
+    build_async_engine,
+    get_db,
+)
+
+
+@pytest.fixture
+def client(session_factory, database_url):
+    base = datetime(2026, 1, 1)
+    with session_factory() as db:
+        for client_id in ("c1", "c2"):
+            db.add(Client(id=client_id, email=f"{client_id}@example.com", name="C", company="Co", hashed_password="x"))
+        db.add(Project(id="p1", client_id="c1", name="P1"))
+        db.add(Project(id="p2", client_id="c1", name="P2"))
+        db.add(Project(id="p3", client_id="c2", name="P3"))
+        for i in range(120):
+            db.add(
+                DocumentFile(
+                    id=f"d{i:03d}",
+                    client_id="c1",
+                    project_id="p1" if i % 3 else "p2",
+                    filename=f"f{i}.pdf",
+                    stored_filename=f"f{i}",
+                    file_type="application/pdf" if i % 2 else "text/plain",
+                    file_size=i,
+                    file_path=f"f{i}",
+                    processed=i % 4 == 0,
+                    # Pairs share a timestamp so the id tie-breaker matters.
+                    created_at=base + timedelta(minutes=i // 2),
+                )
+            )
+        db.add(
+            DocumentFile(
+                id="other", client_id="c2", project_id="p3", filename="x", stored_filename="x",
+                file_type="text/plain", file_size=1, file_path="x", created_at=base,
+            )
+        )
+        db.commit()
+
+    async_factory = async_session_factory(build_async_engine(database_url))
+
+    async def override_db():
+        async with async_factory() as db:
+            yield db
+
+    app = FastAPI()
+    app.include_router(documents.router)
+    app.dependency_overrides[get_db] = override_db
+    app.dependency_overrides[get_current_user] = lambda: SimpleNamespace(id="c1", tier="enterprise")
+    return TestClient(app)
+
+
+def fetch_all(client, **params):
+    ids, cursor, pages = [], None, 0
+    while True:
+        query = dict(params, **({"cursor": cursor} if cursor else {}))
+        resp = client.get("/api/documents", params=query)
+        assert resp.status_code == 200
+        ids += [d["id"] for d in resp.json()]
+        pages += 1
+        cursor = resp.headers.get("X-Next-Cursor")
+        if not cursor:
+            return ids, pages
+
+
+def test_keyset_pages_cover_every_document_once_in_order(client):
+    ids, pages = fetch_all(client, limit=50)
+    assert pages == 3
+    assert ids == [f"d{i:03d}" for i in reversed(range(120))]
+
+
+def test_filters_apply_across_pages(client):
+    ids, _ = fetch_all(client, limit=7, project_id="p2", processed="true", file_type="text/plain")
+    assert ids == [f"d{i:03d}" for i in reversed(range(120)) if i % 3 == 0 and i % 4 == 0 and i % 2 == 0]
+
+
+def test_invalid_cursor_is_rejected(client):
+    assert client.get("/api/documents", params={"cursor": "not-a-cursor"}).status_code == 400
+
+
+@pytest.mark.parametrize(
+    "condition,index",
+    [
+        ("", "ix_document_files_client_created"),
+        ("AND project_id = 'p2' ", "ix_document_files_client_project_created"),
+        ("AND processed = 1 ", "ix_document_files_client_processed_created"),
+        ("AND file_type = 'text/plain' ", "ix_document_files_client_type_created"),
+    ],
+)
+def test_list_query_uses_composite_index(client, session_factory, condition, index):
+    with session_factory() as db:
+        plan = " ".join(
+            str(row[-1])
+            for row in db.execute(
+                text(
+                    f"EXPLAIN QUERY PLAN SELECT id FROM document_files WHERE client_id = 'c1' {condition}"
+                    "AND (created_at, id) < ('2026-01-01 00:30:00', 'd060') ORDER BY created_at DESC, id DESC LIMIT 51"
+                )
+            )
+        )
+    assert index in plan
+    assert "TEMP B-TREE" not in plan
+
+
+def test_delete_removes_chunks_in_bulk(client, session_factory):
+    with session_factory() as db:
+        for doc_id in ("d000", "d001"):
+            db.add_all(DocumentChunk(document_id=doc_id, chunk_index=i, content=f"chunk {i}") for i in range(300))
+        db.commit()
+
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(Engine, "before_cursor_execute", record)
+    try:
+        assert client.delete("/api/documents/d001").status_code == 200
+    finally:
+        event.remove(Engine, "before_cursor_execute", record)
+
+    deletes = [s for s in statements if s.startswith("DELETE FROM document_chunks")]
+    assert deletes == ["DELETE FROM document_chunks WHERE document_chunks.document_id = ?"]
+    with session_factory() as db:
+        assert db.get(DocumentFile, "d001") is None
+        assert db.query(DocumentChunk).filter(DocumentChunk.document_id == "d001").count() == 0
+        assert db.query(DocumentChunk).filter(DocumentChunk.document_id == "d000").count() == 300
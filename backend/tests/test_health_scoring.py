@@ -0,0 +1,109 @@
+import json
+import os
+import sys
+from datetime import datetime
+from pathlib import Path
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+root = Path(__file__).resolve().parents[1]
+sys.path.append(str(root))
+
+from app.services import health_scoring
+from app.services.health_scoring import (
+    Finding,
+    MetadataStore,
+    Rule,
+    evaluate,
+    health_report,
+    load_store,
+    record_features,
+    release_age_months,
+)
+
+SCRIPT = "var gr = new GlideRecord('incident');\ngr.query();\n"
+
+
+def write_extract(path, records):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as handle:
+        for record in records:
+            handle.write(json.dumps(record) + "\n")
+    return str(path)
+
+
+def rule(index, **fields):
+    record = {
+        "sys_id": f"{index:032x}",
+        "name": f"rule {index}",
+        "active": "true",
+        "script": "",
+        "sys_mod_count": "0",
+        "sys_created_by": "system",
+        "sys_updated_by": "system",
+    }
+    record.update(fields)
+    return record
+
+
+def test_record_features():
+    assert record_features(rule(1, script=SCRIPT))[4] == len(SCRIPT)
+    assert not record_features(rule(1))[3] and record_features(rule(1, sys_created_by="jdoe"))[3]
+    assert record_features(rule(1, sys_mod_count="3"))[3]
+
+
+def test_deltas_override_and_columns_are_reused(tmp_path, monkeypatch):
+    table = tmp_path / "acme" / "sys_script"
+    full = write_extract(table / "20260101T000000-full.ndjson", [rule(i, script=SCRIPT) for i in range(10)])
+    delta = write_extract(
+        table / "20260102T000000-delta.ndjson", [rule(3, script="", active="false", sys_updated_by="jdoe")]
+    )
+    properties = write_extract(
+        tmp_path / "acme" / "sys_properties" / "20260101T000000-full.ndjson",
+        [{"sys_id": "p", "name": "glide.buildname", "value": "glide-xanadu-07-02-2024__patch1"}],
+    )
+    files = {"sys_script": [full, delta], "sys_properties": [properties]}
+
+    store = load_store(files)
+    rules = store.table("sys_script")
+    assert len(rules) == 10 and store.version.startswith("glide-xanadu")
+    changed = rules.sys_id == f"{3:032x}".encode()
+    assert not rules.active[changed].any() and rules.customized[changed].all()
+    assert int((rules.script_length > 0).sum()) == 9
+    assert (table / "columns.npz").exists()
+
+    # Loading again reads the saved columns, not the extracts.
+    monkeypatch.setattr(health_scoring, "record_features", None)
+    again = load_store(files)
+    assert again.version == store.version
+    assert (again.table("sys_script").script_length == rules.script_length).all()
+
+    # A new delta invalidates them.
+    monkeypatch.undo()
+    files["sys_script"].append(write_extract(table / "20260103T000000-delta.ndjson", [rule(11)]))
+    assert len(load_store(files).table("sys_script")) == 11
+
+
+def test_rules_and_report():
+    records = [rule(i, active="false" if i < 5 else "true", script=SCRIPT) for i in range(50)]
+    rules = health_scoring.TableColumns.from_rows([record_features(record) for record in records])
+    store = MetadataStore({"sys_script": rules}, "glide-vancouver-06-21-2023__patch2", as_of=datetime(2024, 3, 1))
+    findings = {finding.rule: finding for finding in evaluate(store)}
+    # 5 of 50 inactive with scripts is half of the worst case.
+    assert findings["inactive_scripted_rules"].severity == 0.5 and findings["inactive_scripted_rules"].affected == 5
+    assert len(findings["inactive_scripted_rules"].examples) == 5
+    assert findings["customization_ratio"].severity == 0 and findings["version_age"].severity == 0
+    assert release_age_months("glide-vancouver-06-21-2023__patch2", datetime(2024, 3, 1)) == 6
+    assert release_age_months("glide-unknown", datetime(2024, 3, 1)) is None
+
+    report = health_report(findings.values())
+    assert report["health_score"] == round(100 - 7.5)
+    assert [(r["rule"], r["priority"]) for r in report["recommendations"]] == [("inactive_scripted_rules", "medium")]
+
+    # New rules re-score the same columns.
+    strict = Rule("strict", "No scripts", "configuration", 100, lambda s: (1, len(s.table("sys_script")), "", []))
+    assert health_report(evaluate(store, [strict]))["health_score"] == 0
+    assert health_report([Finding("ok", "Fine", "architecture", 50, 0, 0, "")]) == {
+        "health_score": 100,
+        "recommendations": [],
+    }
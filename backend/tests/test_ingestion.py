@@ -0,0 +1,250 @@
+import asyncio
+import os
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+root = Path(__file__).resolve().parents[1]
+sys.path.append(str(root))
+
+from app.models.database import Client, DocumentChunk, DocumentFile, IngestionJob, Project
+from app.services.document_parsing import chunk_text
+from app.services.ingestion import IngestionService
+
+
+class FakeEmbeddings:
+    def __init__(self):
+        self.calls = 0
+        self.max_batch = 0
+
+    async def create(self, model, input):
+        self.calls += 1
+        self.max_batch = max(self.max_batch, len(input))
+        data = [SimpleNamespace(index=i, embedding=[float(len(text)), 1.0, 0.0]) for i, text in enumerate(input)]
+        return SimpleNamespace(data=list(reversed(data)))
+
+
+@pytest.fixture
+def factory(session_factory):
+    with session_factory() as db:
+        db.add(Client(id="c1", email="c@example.com", name="C", company="Co", hashed_password="x"))
+        db.add(Project(id="p1", client_id="c1", name="P"))
+        db.commit()
+    return session_factory
+
+
+def add_document(factory, doc_id, path, filename, content_type, sha256=None):
+    with factory() as db:
+        doc = DocumentFile(
+            id=doc_id,
+            client_id="c1",
+            project_id="p1",
+            filename=filename,
+            stored_filename=filename,
+            file_type=content_type,
+            file_size=Path(path).stat().st_size if Path(path).exists() else 0,
+            file_path=str(path),
+            content_sha256=sha256,
+        )
+        db.add(doc)
+        IngestionService.enqueue(db, doc)
+        db.commit()
+
+
+def test_chunk_text_overlaps_and_streams():
+    words = [f"word{i}" for i in range(400)]
+    chunks = list(chunk_text(iter(words), size=200, overlap=50))
+    assert all(len(chunk) <= 200 for chunk in chunks)
+    assert len(chunks) > 1
+    # The tail of each chunk reappears at the start of the next one.
+    for current, following in zip(chunks, chunks[1:]):
+        assert following.split()[0] in current
+    assert chunks[-1].split()[-1] == "word399"
+
+
+@pytest.mark.asyncio
+async def test_ingests_text_and_docx_documents(tmp_path, factory):
+    import docx
+
+    text_path = tmp_path / "sow.txt"
+    text_path.write_text("\n".join(f"Requirement {i}: route incidents to group {i}." for i in range(300)))
+    docx_path = tmp_path / "design.docx"
+    document = docx.Document()
+    for i in range(50):
+        document.add_paragraph(f"Design note {i} for the change workflow.")
+    document.save(docx_path)
+    add_document(factory, "d1", text_path, "sow.txt", "text/plain")
+    add_document(factory, "d2", docx_path, "design.docx", "application/octet-stream")
+
+    embeddings = FakeEmbeddings()
+    service = IngestionService(
+        session_factory=factory,
+        embed_client=SimpleNamespace(embeddings=embeddings),
+        processes=1,
+        embed_batch=4,
+        embed_concurrency=2,
+        spool_dir=str(tmp_path / "spool"),
+        chunk_size=300,
+        chunk_overlap=50,
+    )
+    try:
+        assert await service.run_once()
+        assert await service.run_once()
+        assert not await service.run_once()
+    finally:
+        await service.stop()
+
+    with factory() as db:
+        for doc_id in ("d1", "d2"):
+            doc = db.get(DocumentFile, doc_id)
+            chunks = (
+                db.query(DocumentChunk)
+                .filter(DocumentChunk.document_id == doc_id)
+                .order_by(DocumentChunk.chunk_index)
+                .all()
+            )
+            assert doc.processed and doc.processing_status == "completed" and doc.processing_progress == 100
+            assert doc.chunk_count == len(chunks) > 0
+            assert [c.chunk_index for c in chunks] == list(range(len(chunks)))
+            vector = np.frombuffer(chunks[0].embedding, dtype=np.float32)
+            assert vector.shape == (3,) and abs(np.linalg.norm(vector) - 1) < 1e-5
+        assert "Design note 49" in chunks[-1].content
+        assert {job.status for job in db.query(IngestionJob)} == {"completed"}
+    assert embeddings.max_batch == 4
+    assert not list((tmp_path / "spool").iterdir())
+
+
+@pytest.mark.asyncio
+async def test_failed_job_is_retried_then_marked_failed(tmp_path, factory):
+    add_document(factory, "d1", tmp_path / "missing.txt", "missing.txt", "text/plain")
+    service = IngestionService(
+        session_factory=factory, processes=1, max_attempts=2, retry_backoff=0.2, spool_dir=str(tmp_path / "spool")
+    )
+    try:
+        assert await service.run_once()
+        with factory() as db:
+            assert db.get(DocumentFile, "d1").processing_status == "queued"
+        # The retry waits out its backoff.
+        assert not await service.run_once()
+        await asyncio.sleep(0.25)
+        assert await service.run_once()
+        assert not await service.run_once()
+    finally:
+        await service.stop()
+
+    with factory() as db:
+        doc = db.get(DocumentFile, "d1")
+        job = db.query(IngestionJob).one()
+        assert doc.processing_status == "failed" and not doc.processed
+        assert "missing.txt" in doc.processing_error
+        assert job.status == "failed" and job.attempts == 2
+
+
+@pytest.mark.asyncio
+async def test_crashed_parser_process_is_replaced(tmp_path, factory):
+    path = tmp_path / "notes.txt"
+    path.write_text("\n".join(f"Note {i} about the CMDB." for i in range(50)))
+    add_document(factory, "d1", path, "notes.txt", "text/plain")
+    service = IngestionService(
+        session_factory=factory, processes=1, retry_backoff=0.01, spool_dir=str(tmp_path / "spool")
+    )
+    try:
+        pool = service._executor()
+        await asyncio.get_running_loop().run_in_executor(pool, os.getpid)
+        for process in list(pool._processes.values()):
+            process.kill()
+            process.join()
+        assert await service.run_once()
+        with factory() as db:
+            assert db.get(DocumentFile, "d1").processing_status == "queued"
+        assert service._pool is None
+        await asyncio.sleep(0.02)
+        assert await service.run_once()
+    finally:
+        await service.stop()
+
+    with factory() as db:
+        assert db.get(DocumentFile, "d1").processing_status == "completed"
+        assert db.query(IngestionJob).one().attempts == 2
+
+
+@pytest.mark.asyncio
+async def test_duplicate_content_reuses_chunks_and_embeddings(tmp_path, factory):
+    path = tmp_path / "export.txt"
+    path.write_text("\n".join(f"Catalog item {i} requires approval." for i in range(100)))
+    add_document(factory, "d1", path, "export.txt", "text/plain", sha256="abc")
+
+    embeddings = FakeEmbeddings()
+    service = IngestionService(
+        session_factory=factory,
+        embed_client=SimpleNamespace(embeddings=embeddings),
+        processes=1,
+        spool_dir=str(tmp_path / "spool"),
+        chunk_size=300,
+        chunk_overlap=50,
+    )
+    try:
+        assert await service.run_once()
+        calls = embeddings.calls
+        add_document(factory, "d2", path, "export.txt", "text/plain", sha256="abc")
+        assert await service.run_once()
+    finally:
+        await service.stop()
+
+    assert embeddings.calls == calls and service.reused == 1
+    with factory() as db:
+        original, copy = db.get(DocumentFile, "d1"), db.get(DocumentFile, "d2")
+        assert copy.processed and copy.chunk_count == original.chunk_count > 0
+        copied = db.query(DocumentChunk).filter(DocumentChunk.document_id == "d2").count()
+        assert copied == original.chunk_count
+
+
+class SlowEmbeddings(FakeEmbeddings):
+    async def create(self, model, input):
+        await asyncio.sleep(0.1)
+        return await super().create(model, input)
+
+
+@pytest.mark.asyncio
+async def test_lease_is_renewed_and_a_taken_over_job_is_left_alone(tmp_path, factory):
+    path = tmp_path / "notes.txt"
+    path.write_text("\n".join(f"Note {i} about the CMDB." for i in range(500)))
+    add_document(factory, "d1", path, "notes.txt", "text/plain")
+    options = dict(
+        embed_client=SimpleNamespace(embeddings=SlowEmbeddings()),
+        processes=1,
+        embed_batch=2,
+        embed_concurrency=1,
+        lease=0.3,
+        spool_dir=str(tmp_path / "spool"),
+        chunk_size=300,
+        chunk_overlap=0,
+    )
+    service = IngestionService(session_factory=factory, **options)
+    other = IngestionService(session_factory=factory, **options)
+    try:
+        run = asyncio.create_task(service.run_once())
+        await asyncio.sleep(1.0)
+        # Well past the lease, but the heartbeat keeps it: nothing for another worker to claim.
+        assert not run.done()
+        assert not await asyncio.to_thread(other._claim)
+        with factory() as db:
+            # Another worker takes the job over (as if this one had stalled past its lease).
+            db.query(IngestionJob).update({IngestionJob.attempts: 5})
+            db.commit()
+            stored = db.query(DocumentChunk).count()
+        assert stored > 0
+        assert await asyncio.wait_for(run, 2)
+    finally:
+        await service.stop()
+        await other.stop()
+
+    with factory() as db:
+        job = db.query(IngestionJob).one()
+        # The first worker stopped writing and did not touch the job or the document.
+        assert job.status == "running" and job.attempts == 5
+        assert db.get(DocumentFile, "d1").processing_status == "processing"
+        assert db.query(DocumentChunk).count() == stored
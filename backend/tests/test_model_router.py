@@ -0,0 +1,59 @@
+import sys
+from pathlib import Path
+
+root = Path(__file__).resolve().parents[1]
+sys.path.append(str(root))
+
+from app.services.model_router import CircuitBreaker, ModelLimits, ModelRouter, TokenBucket
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_router(clock, **limits):
+    defaults = {model: ModelLimits(60, 60_000, 5.0) for model in ("a", "b")}
+    defaults.update(limits)
+    return ModelRouter(chains={"medium": ["a", "b"]}, limits=defaults, clock=clock)
+
+
+def test_token_bucket_refills_over_time():
+    clock = Clock()
+    bucket = TokenBucket(60, clock)
+    bucket.take(60)
+    assert not bucket.available(1)
+    clock.now += 1
+    assert bucket.available(1)
+
+
+def test_rate_limited_primary_is_skipped():
+    clock = Clock()
+    router = make_router(clock, a=ModelLimits(1, 60_000, 5.0))
+    assert router.acquire("a", 10)
+    assert router.candidates("medium", 10) == ["b"]
+
+
+def test_models_over_latency_slo_are_tried_last():
+    clock = Clock()
+    router = make_router(clock)
+    for _ in range(20):
+        router.record_success("a", 9.0, 10, None)
+    assert router.candidates("medium", 10) == ["b", "a"]
+
+
+def test_breaker_half_opens_after_timeout_and_closes_on_success():
+    clock = Clock()
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10, clock=clock)
+    breaker.on_failure(1.0, 1)
+    breaker.on_failure(1.0, 2)
+    assert not breaker.allow()
+    clock.now += 10
+    assert breaker.allow()
+    breaker.on_attempt()
+    assert not breaker.allow()  # only one trial request while half-open
+    breaker.on_success()
+    assert breaker.state == CircuitBreaker.CLOSED
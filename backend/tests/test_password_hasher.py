@@ -0,0 +1,83 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+from passlib.context import CryptContext
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+root = Path(__file__).resolve().parents[1]
+sys.path.append(str(root))
+
+from app.services.password_hasher import HasherBusy, PasswordHasher
+
+
+def context(rounds=4):
+    return CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=rounds)
+
+
+@pytest.mark.asyncio
+async def test_hashing_keeps_the_loop_responsive():
+    release = threading.Event()
+
+    class SlowContext:
+        def hash(self, password):
+            release.wait(5)
+            return "hashed"
+
+    hasher = PasswordHasher(SlowContext(), workers=1, max_queue=4)
+    task = asyncio.create_task(hasher.hash("pw"))
+    start = time.perf_counter()
+    await asyncio.sleep(0.05)
+    assert time.perf_counter() - start < 0.5
+    assert not task.done()
+    release.set()
+    assert await task == "hashed"
+    hasher.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_sheds_load_when_queue_is_full():
+    release = threading.Event()
+
+    class SlowContext:
+        def hash(self, password):
+            release.wait(5)
+            return "hashed"
+
+    hasher = PasswordHasher(SlowContext(), workers=1, max_queue=1, queue_timeout=5)
+    first = asyncio.create_task(hasher.hash("a"))
+    await asyncio.sleep(0.01)
+    second = asyncio.create_task(hasher.hash("b"))
+    await asyncio.sleep(0.01)
+    with pytest.raises(HasherBusy):
+        await hasher.hash("c")
+    release.set()
+    assert await asyncio.gather(first, second) == ["hashed", "hashed"]
+    assert hasher.stats()["shed"] == 1 and hasher.stats()["completed"] == 2
+    hasher.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_verify_upgrades_outdated_hashes():
+    stored = context(4).hash("secret")
+    hasher = PasswordHasher(context(5), workers=1, max_queue=4)
+    valid, new_hash = await hasher.verify("secret", stored)
+    assert valid and new_hash and "$05$" in new_hash
+    assert await hasher.verify("secret", new_hash) == (True, None)
+    assert (await hasher.verify("wrong", new_hash))[0] is False
+    assert hasher.stats()["rehashed"] == 1
+    hasher.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_login_benchmark_smoke():
+    from benchmarks import bench_login
+
+    args = bench_login.parse_args(["--requests", "8", "--concurrency", "4", "--users", "2", "--rounds", "4"])
+    results = await bench_login.run_benchmark(args)
+    assert results["ok"] == 8 and results["shed_503"] == 0
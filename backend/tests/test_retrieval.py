@@ -0,0 +1,203 @@
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+root = Path(__file__).resolve().parents[1]
+sys.path.append(str(root))
+
+from app.api import chat
+from app.auth import get_current_user
+from app.models.database import (
+    ChatMessage,
+    Client,
+    DocumentChunk,
+    DocumentFile,
+    Project,
+    async_session_factory,
+    build_async_engine,
+    get_db,
+)
+from app.services.ai_gateway import get_ai_gateway
+from app.services.retrieval import BM25Index, ProjectShard, RetrievalEngine, get_retrieval_engine, tokenize
+from app.services.vector_index import ExactIndex
+
+
+def unit(*values):
+    vec = np.asarray(values, dtype=np.float32)
+    return vec / np.linalg.norm(vec)
+
+
+class FakeEmbeddings:
+    def __init__(self, vectors):
+        self.vectors = vectors
+
+    async def create(self, model, input):
+        return SimpleNamespace(data=[SimpleNamespace(index=0, embedding=self.vectors[input].tolist())])
+
+
+@pytest.fixture
+def factory(session_factory):
+    with session_factory() as db:
+        db.add(Client(id="c1", email="c@example.com", name="C", company="Co", hashed_password="x"))
+        db.add(Project(id="p1", client_id="c1", name="P"))
+        db.add(Project(id="p2", client_id="c1", name="Other"))
+        db.commit()
+    return session_factory
+
+
+def add_document(factory, doc_id, project_id, chunks):
+    with factory() as db:
+        db.add(
+            DocumentFile(
+                id=doc_id,
+                client_id="c1",
+                project_id=project_id,
+                filename=f"{doc_id}.txt",
+                stored_filename=doc_id,
+                file_type="text/plain",
+                file_size=1,
+                file_path=doc_id,
+                processed=True,
+                chunk_count=len(chunks),
+                processing_status="completed",
+            )
+        )
+        for i, (content, vector) in enumerate(chunks):
+            db.add(DocumentChunk(document_id=doc_id, chunk_index=i, content=content, embedding=vector.tobytes()))
+        db.commit()
+
+
+def test_bm25_prefers_rare_exact_terms():
+    index = BM25Index()
+    docs = [
+        "incident assignment rules for the network group",
+        "incident priority matrix and incident escalation",
+        "sys_user_group u_network_ops owns incident routing",
+    ]
+    for row, text in enumerate(docs):
+        index.add(row, tokenize(text))
+    rows, _ = index.search_k(tokenize("u_network_ops incident"), 3)
+    assert rows[0] == 2
+    index.remove(2)
+    rows, _ = index.search_k(tokenize("u_network_ops"), 3)
+    assert rows.shape[0] == 0
+
+
+def test_shard_fuses_lexical_and_vector_rankings():
+    shard = ProjectShard(ExactIndex)
+    shard.add_document(
+        "d1",
+        [
+            ("lexical", "approval rules for catalog item laptop request", unit(0, 1, 0).tobytes()),
+            ("semantic", "hardware purchases need manager sign-off", unit(1, 0, 0).tobytes()),
+            ("noise", "knowledge base article templates", unit(0, 0, 1).tobytes()),
+        ],
+    )
+    hits = shard.search(tokenize("laptop approval"), unit(1, 0.1, 0), k=2)
+    assert {chunk_id for chunk_id, _ in hits} == {"lexical", "semantic"}
+
+    shard.remove_document("d1")
+    assert shard.search(tokenize("laptop approval"), unit(1, 0.1, 0), k=2) == []
+    assert shard.dead_ratio == 1.0
+
+
+@pytest.mark.asyncio
+async def test_engine_is_project_scoped_and_picks_up_new_documents(factory):
+    add_document(factory, "d1", "p1", [("change freeze during quarter end", unit(1, 0, 0))])
+    add_document(factory, "d9", "p2", [("change freeze in another project", unit(1, 0, 0))])
+    embeddings = FakeEmbeddings({"change freeze": unit(1, 0, 0), "cmdb reconciliation": unit(0, 1, 0)})
+    engine = RetrievalEngine(
+        session_factory=factory,
+        embed_client=SimpleNamespace(embeddings=embeddings),
+        refresh_interval=3600,
+        index_factory=ExactIndex,
+    )
+
+    results = await engine.search("p1", "change freeze")
+    assert [r.document_id for r in results] == ["d1"]
+    assert results[0].filename == "d1.txt" and "quarter end" in results[0].content
+
+    add_document(factory, "d2", "p1", [("cmdb reconciliation runs nightly", unit(0, 1, 0))])
+    stale = await engine.search("p1", "cmdb reconciliation")
+    assert "d2" not in {r.document_id for r in stale}  # not refreshed yet
+    engine.document_ready("p1", "d2")
+    results = await engine.search("p1", "cmdb reconciliation")
+    assert results[0].document_id == "d2"
+
+
+def test_bm25_search_is_fast_on_a_large_shard():
+    # Small vocabulary so each query term hits thousands of postings.
+    rng = np.random.default_rng(0)
+    vocabulary = [f"term{i}" for i in range(500)]
+    index = BM25Index()
+    for row in range(20_000):
+        index.add(row, [vocabulary[i] for i in rng.integers(0, len(vocabulary), 40)])
+    index.search_k(["term1", "term2", "term3"], 10)
+    start = time.perf_counter()
+    for _ in range(20):
+        index.search_k(["term1", "term2", "term3"], 10)
+    assert (time.perf_counter() - start) / 20 < 0.05
+
+
+class FakeGateway:
+    def __init__(self):
+        self.messages = None
+
+    async def stream_chat(self, messages, complexity="medium"):
+        self.messages = messages
+        for piece in ["Freeze ", "starts ", "[1]."]:
+            yield piece
+
+
+def parse_sse(body):
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def test_chat_streams_answer_and_records_sources(factory, database_url, monkeypatch):
+    add_document(factory, "d1", "p1", [("change freeze during quarter end", unit(1, 0, 0))])
+    engine = RetrievalEngine(session_factory=factory, embed_client=None, index_factory=ExactIndex)
+    gateway = FakeGateway()
+    async_factory = async_session_factory(build_async_engine(database_url))
+    monkeypatch.setattr(chat, "AsyncSessionLocal", async_factory)
+
+    async def override_db():
+        async with async_factory() as db:
+            yield db
+
+    app = FastAPI()
+    app.include_router(chat.router)
+    app.dependency_overrides[get_db] = override_db
+    app.dependency_overrides[get_current_user] = lambda: SimpleNamespace(id="c1")
+    app.dependency_overrides[get_ai_gateway] = lambda: gateway
+    app.dependency_overrides[get_retrieval_engine] = lambda: engine
+    client = TestClient(app)
+
+    session = client.post("/api/chat/sessions", json={"project_id": "p1"}).json()
+    resp = client.post(f"/api/chat/sessions/{session['id']}/messages", json={"message": "When is the change freeze?"})
+    events = parse_sse(resp.text)
+
+    assert events[0][0] == "sources"
+    assert events[0][1]["sources"][0]["document_id"] == "d1"
+    assert "".join(data["text"] for name, data in events if name == "token") == "Freeze starts [1]."
+    assert events[-1][0] == "done"
+    assert "quarter end" in gateway.messages[-1]["content"]
+
+    messages = client.get(f"/api/chat/sessions/{session['id']}/messages").json()
+    assert [m["message_type"] for m in messages] == ["user", "assistant"]
+    assert messages[1]["source_documents"][0]["filename"] == "d1.txt"
+    with factory() as db:
+        assert db.query(ChatMessage).count() == 2
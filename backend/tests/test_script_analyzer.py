@@ -0,0 +1,120 @@
+import json
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+root = Path(__file__).resolve().parents[1]
+sys.path.append(str(root))
+
+from app.models.database import ScriptAnalysis
+from app.services.script_analyzer import ScriptAnalyzer
+from app.services.script_checks import analyze_script
+
+NESTED = """var gr = new GlideRecord('incident');
+gr.query(); // a query before the loop is fine
+while (gr.next()) {
+  var task = new GlideRecord('task');
+  task.addQuery('parent', gr.getUniqueValue());
+  task.query();
+  if (task.getRowCount() > 0) {
+    current.update();
+  }
+}
+"""
+CLIENT = """function onChange(control, oldValue, newValue) {
+  var caller = g_form.getReference('caller_id');
+  g_form.getReference('caller_id', showVip);
+  var ga = new GlideAjax('UserUtils');
+  ga.getXMLWait();
+}
+"""
+
+
+def checks(script):
+    return [(issue["check"], issue["line"]) for issue in analyze_script(script)]
+
+
+def test_checks_find_anti_patterns():
+    assert checks(NESTED) == [
+        ("query_in_loop", 4),
+        ("query_in_loop", 6),
+        ("get_row_count", 7),
+        ("current_update", 8),
+    ]
+    assert checks(CLIENT) == [("sync_ajax", 2), ("sync_ajax", 5)]
+    assert checks("ids.forEach(function (id) {\n  gr.get(id);\n});") == [("query_in_loop", 2)]
+    assert checks("for (var i = 0; i < 3; i++) gr.query();\ngr.query();") == [("query_in_loop", 1)]
+    # Comments and strings are not code.
+    assert checks("/* while (x) { gr.query(); } */\nvar s = 'for (;;) current.update()';") == []
+    assert checks("") == [] and checks(None) == []
+
+
+@pytest.mark.asyncio
+async def test_issues_are_cached_by_content(session_factory):
+    scripts = [NESTED, CLIENT, "gs.log('ok');"] * 3 + [f"gs.log({i});" for i in range(7)]
+    seen = []
+
+    async def progress(fraction):
+        seen.append(fraction)
+
+    analyzer = ScriptAnalyzer(session_factory=session_factory, processes=2, batch_size=3)
+    try:
+        issues = await analyzer.analyze(scripts, progress)
+    finally:
+        analyzer.close()
+    assert issues == [analyze_script(script) for script in scripts]
+    assert analyzer.analyzed == 10 and analyzer.reused == 0
+    assert seen[-1] == 1.0 and len(seen) == 4
+    with session_factory() as db:
+        assert db.query(ScriptAnalysis).count() == 10
+
+    # A later assessment only checks what changed; no pool is started when nothing did.
+    again = ScriptAnalyzer(session_factory=session_factory, processes=2)
+    assert await again.analyze(scripts) == issues
+    assert again.analyzed == 0 and again.reused == 10 and again._pool is None
+    try:
+        await again.analyze(scripts + ["current.update();"])
+    finally:
+        again.close()
+    assert again.analyzed == 1
+
+
+@pytest.mark.asyncio
+async def test_instance_summary(tmp_path, session_factory):
+    class Extractor:
+        def table_files(self, instance_url, table):
+            path = tmp_path / table / "20260101T000000-full.ndjson"
+            return [str(path)] if path.exists() else []
+
+    records = [
+        {"sys_id": f"{i:032x}", "name": f"rule {i}", "active": "true" if i % 2 else "false", "script": NESTED}
+        for i in range(20)
+    ] + [{"sys_id": f"{i:032x}", "name": f"rule {i}", "active": "true", "script": "gs.log(1);"} for i in range(20, 40)]
+    # A UI action saving the record it runs on is normal, not a business rule re-triggering itself.
+    actions = [
+        {"sys_id": f"{i:032x}", "name": f"action {i}", "active": "true", "script": "current.update();"}
+        for i in range(40, 50)
+    ]
+    for table, rows in (("sys_script", records), ("sys_ui_action", actions)):
+        (tmp_path / table).mkdir()
+        with open(tmp_path / table / "20260101T000000-full.ndjson", "w") as handle:
+            handle.writelines(json.dumps(record) + "\n" for record in rows)
+
+    analyzer = ScriptAnalyzer(session_factory=session_factory, processes=1)
+    try:
+        summary = await analyzer.analyze_instance("https://acme.service-now.com", extractor=Extractor())
+    finally:
+        analyzer.close()
+    # Only the 40 active scripts count: 10 of them have every server-side issue.
+    assert summary["scripts"] == 50 and summary["active"] == 40
+    assert summary["issues"] == {"query_in_loop": 10, "get_row_count": 10, "sync_ajax": 0, "current_update": 10}
+    findings = {finding["rule"]: finding for finding in summary["findings"]}
+    assert findings["query_in_loop"]["severity"] == 1 and findings["sync_ajax"]["severity"] == 0
+    # current.update() is counted in business rules only: 10 of their 30 active scripts.
+    assert findings["current_update"]["detail"].startswith("10 of 30 active scripts")
+    assert all(example.startswith("sys_script:") for example in findings["current_update"]["examples"])
+    assert findings["query_in_loop"]["examples"][0] == "sys_script: rule 1 (line 4)"
@@ -0,0 +1,189 @@
+import os
+import sys
+import threading
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+root = Path(__file__).resolve().parents[1]
+sys.path.append(str(root))
+
+from app.services.ai_gateway import PersistentSemanticCache, SemanticCache
+from app.services.vector_index import IVFIndex
+
+
+class FakeEmbeddingCache(SemanticCache):
+    """SemanticCache with deterministic embeddings instead of API calls."""
+
+    def __init__(self, vectors, **kwargs):
+        super().__init__(**kwargs)
+        self.vectors = vectors
+        self.embed_calls = 0
+
+    async def _embed(self, text):
+        self.embed_calls += 1
+        return np.asarray(self.vectors[text], dtype=np.float32)
+
+
+@pytest.mark.asyncio
+async def test_hit_on_similar_embedding_and_miss_otherwise():
+    cache = FakeEmbeddingCache(
+        {"a": [1, 0, 0], "a2": [0.99, 0.05, 0], "b": [0, 1, 0]},
+        threshold=0.9,
+    )
+    await cache.set("a", "config-a")
+    assert await cache.get("a2") == "config-a"
+    assert await cache.get("b") is None
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 1
+
+
+@pytest.mark.asyncio
+async def test_lru_eviction_keeps_recently_used_entries():
+    vectors = {name: np.eye(4)[i] for i, name in enumerate("abcd")}
+    cache = FakeEmbeddingCache(vectors, capacity=2, initial_rows=1)
+    await cache.set("a", "A")
+    await cache.set("b", "B")
+    assert await cache.get("a") == "A"
+    await cache.set("c", "C")
+    assert len(cache) == 2
+    assert await cache.get("b") is None
+    assert await cache.get("a") == "A"
+    assert await cache.get("c") == "C"
+    assert cache.stats()["evictions"] == 1
+
+
+@pytest.mark.asyncio
+async def test_ttl_expires_entries(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("app.services.ai_gateway.time.time", lambda: now[0])
+    cache = FakeEmbeddingCache({"a": [1, 0]}, ttl=60)
+    await cache.set("a", "A")
+    assert await cache.get("a") == "A"
+    now[0] += 61
+    assert await cache.get("a") is None
+    assert len(cache) == 0
+
+
+@pytest.mark.asyncio
+async def test_exact_tier_and_memo_avoid_repeat_embeddings():
+    cache = FakeEmbeddingCache({"a": [1, 0], "b": [0, 1]})
+    assert await cache.get("a") is None  # empty cache: nothing to embed against
+    await cache.set("a", "A")
+    assert cache.embed_calls == 1
+    assert await cache.get("  a ") == "A"  # whitespace-normalized exact hit
+    assert cache.embed_calls == 1
+
+    assert await cache.get("b") is None
+    await cache.set("b", "B")  # reuses the embedding computed by get
+    assert cache.embed_calls == 2
+    assert cache.stats()["exact_hits"] == 1
+
+
+def persistent_cache(path, vectors, **kwargs):
+    cache = PersistentSemanticCache(str(path), fsync=False, **kwargs)
+
+    async def embed(text):
+        return np.asarray(vectors[text], dtype=np.float32)
+
+    cache._embed = embed
+    return cache
+
+
+@pytest.mark.asyncio
+async def test_persistent_cache_is_shared_and_survives_restart(tmp_path):
+    vectors = {"a": [1, 0, 0], "a2": [0.98, 0.1, 0], "b": [0, 1, 0]}
+    writer = persistent_cache(tmp_path, vectors)
+    reader = persistent_cache(tmp_path, vectors)
+    await writer.set("a", "config-a")
+    assert await reader.get("a2") == "config-a"
+
+    restarted = persistent_cache(tmp_path, vectors)
+    assert len(restarted) == 1
+    assert await restarted.get("a") == "config-a"
+
+
+@pytest.mark.asyncio
+async def test_persistent_cache_ignores_torn_writes_and_compacts(tmp_path):
+    vectors = {name: np.eye(3)[i] for i, name in enumerate("abc")}
+    cache = persistent_cache(tmp_path, vectors, capacity=1)
+    cache._store.compact_min = 1
+    await cache.set("a", "A")
+    # Simulate a crash halfway through appending an index line.
+    with open(cache._store._file("entries.jsonl"), "ab") as fh:
+        fh.write(b'{"op": "add", "ro')
+    await cache.set("b", "B")  # evicts "a", then compacts the tombstone away
+    await cache.set("c", "C")
+
+    reopened = persistent_cache(tmp_path, vectors)
+    assert reopened._store.generation >= 1
+    assert len(reopened) == 1
+    assert await reopened.get("c") == "C"
+    assert await reopened.get("a") is None
+
+
+@pytest.mark.asyncio
+async def test_persistent_evictions_are_written_off_the_event_loop(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("app.services.ai_gateway.time.time", lambda: now[0])
+    vectors = {name: np.eye(3)[i] for i, name in enumerate("abc")}
+    cache = persistent_cache(tmp_path, vectors, ttl=60)
+    reader = persistent_cache(tmp_path, vectors)
+    for name in "ab":
+        await cache.set(name, name.upper())
+    assert await reader.get("a") == "A" and len(reader) == 2
+
+    store = cache._store
+    writes = []
+    delete = store.delete
+
+    def recording_delete(rows, generation):
+        writes.append((threading.get_ident(), sorted(rows)))
+        delete(rows, generation)
+
+    monkeypatch.setattr(store, "delete", recording_delete)
+    now[0] += 61
+    assert await cache.get("c") is None  # both entries expire, in one tombstone write
+    assert writes == [(writes[0][0], [0, 1])] and writes[0][0] != threading.get_ident()
+
+    # An unchanged store is not read again.
+    reads = []
+    read_index = reader._store._read_index
+    monkeypatch.setattr(reader._store, "_read_index", lambda: reads.append(1) or read_index())
+    reader._sync()
+    assert len(reader) == 0 and len(reads) == 1
+    for _ in range(3):
+        reader._sync()
+    assert len(reads) == 1
+
+
+@pytest.mark.asyncio
+async def test_ivf_index_is_trained_off_the_event_loop():
+    rng = np.random.default_rng(0)
+    vectors = {f"p{i}": rng.normal(size=8) for i in range(120)}
+    index = IVFIndex(nlist=4, nprobe=4, train_size=50)
+    cache = FakeEmbeddingCache(vectors, index=index)
+    threads = []
+    fit = index.fit
+
+    def recording_fit(matrix, training):
+        threads.append(threading.get_ident())
+        fit(matrix, training)
+
+    index.fit = recording_fit
+    for i in range(50):
+        await cache.set(f"p{i}", f"v{i}")
+    training = cache._training
+    assert training is not None and index.centroids is None
+    # Entries added while it trains are found now and kept once the centroids are in.
+    for i in range(50, 60):
+        await cache.set(f"p{i}", f"v{i}")
+    assert await cache.get("p55") == "v55"
+    await training
+    assert index.centroids is not None and len(index) == 60
+    assert threads and threads[0] != threading.get_ident()
+    assert await cache.get("p3") == "v3" and await cache.get("p57") == "v57"
+    await cache.aclose()
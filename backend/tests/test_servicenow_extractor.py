@@ -0,0 +1,154 @@
+import json
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import httpx
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+root = Path(__file__).resolve().parents[1]
+sys.path.append(str(root))
+
+from app.models.database import Base, ServiceNowWatermark
+from app.services.servicenow_extractor import (
+    TIME_FORMAT,
+    PageSizer,
+    ServiceNowAuthError,
+    ServiceNowExtractor,
+    time_slices,
+)
+
+INSTANCE = "https://acme.service-now.com"
+
+
+def make_extractor(tmp_path, settings, **kwargs):
+    from benchmarks.fake_servicenow import create_app
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'extract.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    fake = create_app(settings)
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=fake))
+    options = dict(root=str(tmp_path / "extracts"), session_factory=factory, page_size=20, lag=0, backoff=0.01)
+    options.update(kwargs)
+    return ServiceNowExtractor(client=client, **options), fake, factory
+
+
+def read_rows(path):
+    with open(path) as handle:
+        return [json.loads(line) for line in handle]
+
+
+@pytest.mark.asyncio
+async def test_full_then_incremental_sync(tmp_path):
+    from benchmarks.fake_servicenow import FakeSettings
+
+    settings = FakeSettings(
+        tables={"sys_script": 700, "sys_script_include": 300, "sys_ui_policy": 40},
+        forbidden=("sys_ui_policy",),
+        max_page=60,
+        latency=0,
+        row_latency=0,
+    )
+    extractor, fake, factory = make_extractor(tmp_path, settings, lag=10)
+    seen = []
+
+    async def progress(fraction):
+        seen.append(fraction)
+
+    tables = ["sys_script", "sys_script_include", "sys_ui_policy", "missing"]
+    summary = await extractor.sync(INSTANCE, "admin", "admin", tables=tables, progress=progress)
+    assert summary["sys_ui_policy"]["error"].endswith("(403)") and "missing" in summary["missing"]["error"]
+    for table, count in (("sys_script", 700), ("sys_script_include", 300)):
+        assert summary[table]["mode"] == "full" and summary[table]["rows"] == count
+        expected = sorted(fake.state.tables[table].sys_id(i) for i in range(count))
+        assert sorted(row["sys_id"] for row in read_rows(summary[table]["path"])) == expected
+    assert sorted(seen) == [0.25, 0.5, 0.75, 1.0]
+    # Pages grew past the first size and were capped by the instance.
+    assert fake.state.stats.page_sizes and max(fake.state.stats.page_sizes) == 60
+    assert not list(Path(tmp_path, "extracts").rglob("*.part"))
+
+    when = (datetime.utcnow() - timedelta(seconds=5)).strftime(TIME_FORMAT)
+    touched = fake.state.tables["sys_script"].touch(5, random.Random(1), when=when)
+    extractor.lag = 0
+    summary = await extractor.sync(INSTANCE, "admin", "admin", tables=["sys_script", "sys_script_include"])
+    assert summary["sys_script"]["mode"] == "delta"
+    assert sorted(row["sys_id"] for row in read_rows(summary["sys_script"]["path"])) == sorted(touched)
+    assert summary["sys_script_include"] == dict(summary["sys_script_include"], rows=0, path=None)
+    with factory() as db:
+        marks = {m.table_name: m for m in db.query(ServiceNowWatermark).filter_by(instance="acme.service-now.com")}
+    assert marks["sys_script"].watermark == summary["sys_script"]["watermark"] and marks["sys_script"].rows == 5
+    await extractor.client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_node_without_a_full_extract_ignores_the_shared_watermark(tmp_path):
+    from benchmarks.fake_servicenow import FakeSettings
+
+    settings = FakeSettings(tables={"sys_script": 150}, latency=0, row_latency=0)
+    extractor, fake, factory = make_extractor(tmp_path, settings)
+    summary = await extractor.sync(INSTANCE, "admin", "admin", tables=["sys_script"])
+    assert summary["sys_script"]["mode"] == "full"
+
+    # Another node shares the database, and so the watermark, but not the extracts.
+    other = ServiceNowExtractor(
+        client=extractor.client, root=str(tmp_path / "other"), session_factory=factory, page_size=20, lag=0
+    )
+    summary = await other.sync(INSTANCE, "admin", "admin", tables=["sys_script"])
+    assert summary["sys_script"]["mode"] == "full" and summary["sys_script"]["rows"] == 150
+    files = other.table_files(INSTANCE, "sys_script")
+    assert len(files) == 1 and files[0].endswith("-full.ndjson")
+    await extractor.client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_rate_limits_and_errors_are_retried_without_losing_rows(tmp_path):
+    from benchmarks.fake_servicenow import FakeSettings
+
+    settings = FakeSettings(
+        tables={"sys_script": 600}, latency=0.005, row_latency=0, rate_limit=20, retry_after=0.02, error_rate=0.15
+    )
+    extractor, fake, _ = make_extractor(tmp_path, settings, max_retries=30, partitions=8)
+    summary = await extractor.sync(INSTANCE, "admin", "admin", tables=["sys_script"])
+    rows = read_rows(summary["sys_script"]["path"])
+    assert len(rows) == 600 and len({row["sys_id"] for row in rows}) == 600
+    assert fake.state.stats.throttled and fake.state.stats.errors
+    await extractor.client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_bad_credentials_fail_without_advancing(tmp_path):
+    from benchmarks.fake_servicenow import FakeSettings
+
+    extractor, _, factory = make_extractor(tmp_path, FakeSettings(tables={"sys_script": 10}, latency=0))
+    with pytest.raises(ServiceNowAuthError):
+        await extractor.sync(INSTANCE, "admin", "wrong", tables=["sys_script"])
+    with factory() as db:
+        assert db.query(ServiceNowWatermark).count() == 0
+    await extractor.client.aclose()
+
+
+def test_page_sizing_and_time_slices():
+    sizer = PageSizer(size=1000, minimum=100, maximum=4000, target=2.0)
+    sizer.observe(0.5, 1000, 1000)
+    assert sizer.size == 2000
+    sizer.observe(0.5, 2000, 300)  # a short page says nothing about speed
+    assert sizer.size == 2000
+    sizer.observe(8.0, 2000, 2000)
+    assert sizer.size == 500
+    sizer.shrink(), sizer.shrink(), sizer.shrink()
+    assert sizer.size == 100
+
+    slices = time_slices("2024-01-01 00:00:00", "2024-01-01 00:00:10", 4)
+    assert slices[0][0] == "2024-01-01 00:00:00" and slices[-1][1] == "2024-01-01 00:00:10"
+    assert all(a[1] == b[0] for a, b in zip(slices, slices[1:])) and len(slices) == 4
+    assert time_slices("2024-01-01 00:00:00", "2024-01-01 00:00:02", 4) == [
+        ("2024-01-01 00:00:00", "2024-01-01 00:00:01"),
+        ("2024-01-01 00:00:01", "2024-01-01 00:00:02"),
+    ]
@@ -0,0 +1,44 @@
+import hashlib
+import io
+import os
+import sys
+from pathlib import Path
+
+import pytest
+from fastapi import UploadFile
+
+root = Path(__file__).resolve().parents[1]
+sys.path.append(str(root))
+
+from app.services.uploads import MB, UploadTooLarge, max_upload_bytes, save_upload
+
+
+@pytest.mark.asyncio
+async def test_streams_upload_with_hash_and_size(tmp_path):
+    data = os.urandom(300_000)
+    upload = UploadFile(file=io.BytesIO(data), filename="big.bin")
+
+    stored = await save_upload(upload, str(tmp_path), "doc_big.bin", max_bytes=1 * MB, chunk_size=64 * 1024)
+
+    assert stored.size == len(data)
+    assert stored.sha256 == hashlib.sha256(data).hexdigest()
+    assert Path(stored.path).read_bytes() == data
+    assert os.listdir(tmp_path) == ["doc_big.bin"]
+
+
+@pytest.mark.asyncio
+async def test_oversized_upload_is_rejected_and_leaves_nothing(tmp_path):
+    upload = UploadFile(file=io.BytesIO(b"x" * 200_000), filename="big.bin")
+
+    with pytest.raises(UploadTooLarge):
+        await save_upload(upload, str(tmp_path), "doc_big.bin", max_bytes=100_000, chunk_size=32 * 1024)
+
+    assert os.listdir(tmp_path) == []
+
+
+def test_tier_limits_from_env(monkeypatch):
+    monkeypatch.setenv("UPLOAD_TIER_LIMITS_MB", "starter=5, enterprise=2000")
+    assert max_upload_bytes("starter") == 5 * MB
+    assert max_upload_bytes("enterprise") == 2000 * MB
+    assert max_upload_bytes("professional") == 100 * MB
+    assert max_upload_bytes("unknown") == 5 * MB
@@ -0,0 +1,81 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+
+root = Path(__file__).resolve().parents[1]
+sys.path.append(str(root))
+
+from app.services.vector_index import ExactIndex, IVFIndex
+
+
+def unit_rows(n, dim, seed=0):
+    rows = np.random.default_rng(seed).normal(size=(n, dim)).astype(np.float32)
+    return rows / np.linalg.norm(rows, axis=1, keepdims=True)
+
+
+def test_ivf_with_full_probe_matches_exact_scan():
+    vectors = unit_rows(600, 16)
+    exact, ivf = ExactIndex(), IVFIndex(nlist=8, nprobe=8, train_size=200)
+    for row in range(vectors.shape[0]):
+        exact.add(row, vectors)
+        ivf.add(row, vectors)
+    assert ivf.centroids is None and ivf.training_due()  # adding never trains
+    ivf.train(vectors)
+    assert ivf.centroids is not None and not ivf.training_due()
+    for query in unit_rows(50, 16, seed=1):
+        assert ivf.search(vectors, query)[0] == exact.search(vectors, query)[0]
+
+
+def test_ivf_remove_drops_rows_from_results():
+    vectors = unit_rows(300, 8)
+    ivf = IVFIndex(nlist=4, nprobe=4, train_size=100)
+    for row in range(vectors.shape[0]):
+        ivf.add(row, vectors)
+    ivf.train(vectors)
+    row, score = ivf.search(vectors, vectors[42])
+    assert row == 42 and score > 0.99
+    ivf.remove(42)
+    assert ivf.search(vectors, vectors[42])[0] != 42
+    assert len(ivf) == 299
+
+
+def test_ivf_install_replays_changes_made_while_fitting():
+    vectors = unit_rows(400, 8)
+    ivf = IVFIndex(nlist=4, nprobe=4, train_size=100)
+    for row in range(300):
+        ivf.add(row, vectors)
+    training = ivf.begin_training()
+    assert not ivf.training_due()  # one training at a time
+    # The fit runs elsewhere; meanwhile the index keeps changing and answering.
+    for row in range(300, 400):
+        ivf.add(row, vectors)
+    ivf.remove(7)
+    assert ivf.search(vectors, vectors[350])[0] == 350
+    ivf.fit(vectors, training)
+    assert ivf.centroids is None
+    ivf.install(training, vectors)
+    assert ivf.centroids is not None and len(ivf) == 399
+    assert ivf.search(vectors, vectors[350])[0] == 350
+    assert ivf.search(vectors, vectors[7])[0] != 7
+
+    # A clear while fitting discards the result.
+    training = ivf.begin_training()
+    ivf.fit(vectors, training)
+    ivf.clear()
+    ivf.install(training, vectors)
+    assert ivf.centroids is None and len(ivf) == 0
+
+
+def test_ivf_is_due_for_retraining_after_churn():
+    vectors = unit_rows(400, 8)
+    ivf = IVFIndex(nlist=4, nprobe=4, train_size=100)
+    for row in range(200):
+        ivf.add(row, vectors)
+    ivf.train(vectors)
+    # A full cache replacing its entries never grows, but its contents drift from the centroids.
+    for row in range(200, 400):
+        ivf.remove(row - 200)
+        ivf.add(row, vectors)
+        assert ivf.training_due() == (row == 399)
+    assert len(ivf) == 200
@@ -0,0 +1,215 @@
+import asyncio
+import json
+import os
+import sys
+from pathlib import Path
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+root = Path(__file__).resolve().parents[1]
+sys.path.append(str(root))
+
+from app.api import workflows as workflows_api
+from app.models.database import Workflow, async_session_factory, build_async_engine, get_db
+from app.services.workflow_events import InProcessBroker, RedisBroker, WorkflowEventHub
+from app.services.workflow_queue import InProcessQueue
+from app.services.workflows import WorkflowEngine, WorkflowStep, get_workflow_engine
+
+
+def make_app(session_factory, database_url, steps, monkeypatch):
+    async_factory = async_session_factory(build_async_engine(database_url))
+    monkeypatch.setattr(workflows_api, "AsyncSessionLocal", async_factory)
+    engine = WorkflowEngine(
+        steps,
+        session_factory=session_factory,
+        queue=InProcessQueue(),
+        events=InProcessBroker(),
+        workers=1,
+        poll_interval=0.05,
+    )
+
+    async def override_db():
+        async with async_factory() as db:
+            yield db
+
+    app = FastAPI()
+    app.include_router(workflows_api.router)
+    app.dependency_overrides[get_db] = override_db
+    app.dependency_overrides[get_workflow_engine] = lambda: engine
+    return app, engine
+
+
+def parse_sse(body):
+    events = []
+    for block in body.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines() if not line.startswith((":", "retry")))
+        if fields:
+            events.append((fields.get("id"), fields["event"], json.loads(fields["data"])))
+    return events
+
+
+@pytest.mark.asyncio
+async def test_sse_pushes_progress_steps_and_result(session_factory, database_url, monkeypatch):
+    release = asyncio.Event()
+
+    async def collect(ctx):
+        await release.wait()
+        await ctx.progress(0.5)
+        return {"records": 3}
+
+    async def report(ctx):
+        return {"health_score": 90, "records": ctx.outputs["collect"]["records"]}
+
+    steps = [WorkflowStep("collect", collect), WorkflowStep("report", report, depends_on=("collect",))]
+    app, engine = make_app(session_factory, database_url, steps, monkeypatch)
+    await engine.start()
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as http:
+            workflow_id = (await http.post("/api/analyze", json={"credentials": {"instance_url": "x"}})).json()[
+                "workflow_id"
+            ]
+            stream = asyncio.create_task(http.get(f"/api/workflows/{workflow_id}/events"))
+            await asyncio.sleep(0.1)
+            release.set()
+            resp = await asyncio.wait_for(stream, 5)
+    finally:
+        await engine.stop()
+
+    events = parse_sse(resp.text)
+    assert resp.headers["content-type"].startswith("text/event-stream")
+    assert events[0][1] == "state"
+    names = [name for _, name, _ in events[1:]]
+    assert names[-1] == "completed" and events[-1][2]["result"] == {"health_score": 90, "records": 3}
+    assert "step_completed" in names and "progress" in names
+    assert [data["progress"] for _, name, data in events if name == "progress"] == sorted(
+        data["progress"] for _, name, data in events if name == "progress"
+    )
+    ids = [int(event_id) for event_id, _, _ in events[1:]]
+    assert ids == sorted(ids) and len(set(ids)) == len(ids)
+
+
+@pytest.mark.asyncio
+async def test_hub_fans_out_with_one_reader_and_drops_slow_subscribers():
+    broker = InProcessBroker()
+    hub = WorkflowEventHub(broker, buffer=3, poll_interval=0.05)
+    fast = [await hub.subscribe("wf") for _ in range(3)]
+    slow = await hub.subscribe("wf")
+    assert len(hub._readers) == 1
+
+    received = {i: [] for i in range(3)}
+
+    async def consume(i, subscription):
+        while True:
+            event = await subscription.next(1)
+            received[i].append(event.id)
+            if event.terminal:
+                return
+
+    consumers = [asyncio.create_task(consume(i, s)) for i, s in enumerate(fast)]
+    for i in range(9):
+        await broker.publish("wf", "progress", {"progress": i * 10})
+        await asyncio.sleep(0.01)
+    await broker.publish("wf", "completed", {"result": {}})
+    await asyncio.wait_for(asyncio.gather(*consumers), 5)
+
+    assert all(ids == [str(n) for n in range(1, 11)] for ids in received.values())
+    # The slow subscriber gets what fit in its buffer, then is closed instead of holding others up.
+    drained = [await slow.next(0.1) for _ in range(4)]
+    assert [e.id for e in drained if e] == ["1", "2", "3"] and slow.closed
+
+    for subscription in [*fast, slow]:
+        subscription.close()
+    await asyncio.sleep(0)
+    assert not hub._readers
+    await hub.close()
+
+
+@pytest.mark.asyncio
+async def test_resume_replays_after_last_event_id():
+    broker = InProcessBroker()
+    for i in range(5):
+        await broker.publish("wf", "progress", {"progress": i})
+    hub = WorkflowEventHub(broker, poll_interval=0.05)
+    subscription = await hub.subscribe("wf", last_event_id="2")
+    await broker.publish("wf", "completed", {"result": None})
+    ids = []
+    while not subscription.closed:
+        event = await subscription.next(1)
+        ids.append(event.id)
+    assert ids == ["3", "4", "5", "6"]
+    subscription.close()
+    await hub.close()
+
+
+def test_websocket_resumes_and_finished_workflows_end_immediately(session_factory, database_url, monkeypatch):
+    app, engine = make_app(session_factory, database_url, [], monkeypatch)
+    with session_factory() as db:
+        db.add(Workflow(id="running", status="running", progress=40, params={}))
+        db.add(Workflow(id="done", status="completed", progress=100, result={"health_score": 70}, params={}))
+        db.commit()
+
+    async def publish():
+        for i in range(3):
+            await engine.events.publish("running", "progress", {"progress": 40 + i})
+        await engine.events.publish("running", "completed", {"result": {"health_score": 80}})
+
+    asyncio.run(publish())
+    client = TestClient(app)
+
+    with client.websocket_connect("/api/workflows/running/ws?last_event_id=2") as ws:
+        messages = [ws.receive_json() for _ in range(3)]
+    assert messages[0]["event"] == "state" and messages[0]["data"]["progress"] == 40
+    assert [(m["id"], m["event"]) for m in messages[1:]] == [("3", "progress"), ("4", "completed")]
+
+    events = parse_sse(client.get("/api/workflows/done/events").text)
+    assert [name for _, name, _ in events] == ["state", "completed"]
+    assert events[1][2]["result"] == {"health_score": 70}
+    assert client.get("/api/workflows/missing/events").status_code == 404
+
+
+class FakeRedisStreams:
+    def __init__(self):
+        self.streams = {}
+
+    async def xadd(self, key, fields, maxlen=None, approximate=True):
+        entries = self.streams.setdefault(key, [])
+        event_id = f"1700000000000-{len(entries)}".encode()
+        entries.append((event_id, {k.encode(): v.encode() for k, v in fields.items()}))
+        del entries[: max(0, len(entries) - maxlen)]
+        return event_id
+
+    async def expire(self, key, ttl):
+        pass
+
+    async def xread(self, streams, block=None):
+        (key, after), = streams.items()
+        position = tuple(int(p) for p in after.split("-"))
+        fresh = [
+            (i, f) for i, f in self.streams.get(key, []) if tuple(int(p) for p in i.decode().split("-")) > position
+        ]
+        return [[key.encode(), fresh]] if fresh else []
+
+    async def xrevrange(self, key, count=None):
+        return list(reversed(self.streams.get(key, [])))[:count]
+
+    async def aclose(self):
+        pass
+
+
+@pytest.mark.asyncio
+async def test_redis_broker_round_trip():
+    broker = RedisBroker(client=FakeRedisStreams(), history=10, ttl=60)
+    first = await broker.publish("wf", "progress", {"progress": 10})
+    second = await broker.publish("wf", "completed", {"result": {"a": 1}})
+    events = await broker.read("wf", None, timeout=0)
+    assert [(e.id, e.event, e.data) for e in events] == [
+        (first, "progress", {"progress": 10}),
+        (second, "completed", {"result": {"a": 1}}),
+    ]
+    assert [e.id for e in await broker.read("wf", first, timeout=0)] == [second]
+    assert await broker.last_id("wf") == second
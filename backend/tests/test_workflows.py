@@ -0,0 +1,540 @@
+import asyncio
+import os
+import sys
+from datetime import datetime
+from pathlib import Path
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+root = Path(__file__).resolve().parents[1]
+sys.path.append(str(root))
+
+from app.api import workflows as workflows_api
+from app.models.database import (
+    Base,
+    Workflow,
+    WorkflowResult,
+    WorkflowStepOutput,
+    async_session_factory,
+    build_async_engine,
+    get_db,
+)
+from app.services import script_analyzer, servicenow_extractor
+from app.services.analysis import ANALYSIS_STEPS
+from app.services.workflow_queue import InProcessQueue, RedisQueue, create_workflow_queue
+from app.services.workflows import WorkflowEngine, WorkflowStep, get_workflow_engine
+
+CREDENTIALS = {"instance_url": "https://dev.service-now.com", "username": "admin", "password": "secret"}
+
+
+def make_factories(tmp_path):
+    url = f"sqlite:///{tmp_path / 'workflows.db'}"
+    engine = create_engine(url, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    return factory, async_session_factory(build_async_engine(url))
+
+
+def make_engine(factory, steps, **kwargs):
+    options = dict(queue=InProcessQueue(), workers=2, lease=30, poll_interval=0.05, retry_backoff=0.01)
+    options.update(kwargs)
+    return WorkflowEngine(steps, session_factory=factory, **options)
+
+
+async def submit(async_factory, engine, key=None, credentials=CREDENTIALS):
+    async with async_factory() as db:
+        wf, created = await engine.submit(db, "full", {"credentials": credentials}, key)
+        return wf.id, created
+
+
+async def wait_for(factory, workflow_id, statuses=("completed", "failed", "cancelled"), timeout=5):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while asyncio.get_running_loop().time() < deadline:
+        with factory() as db:
+            wf = db.get(Workflow, workflow_id)
+            if wf.status in statuses:
+                return wf
+        await asyncio.sleep(0.02)
+    raise AssertionError(f"workflow {workflow_id} never reached {statuses}")
+
+
+@pytest.mark.asyncio
+async def test_runs_steps_with_progress_and_redacts_credentials(tmp_path):
+    factory, async_factory = make_factories(tmp_path)
+    seen = []
+
+    async def first(ctx):
+        for i in range(4):
+            await ctx.progress((i + 1) / 4)
+            with factory() as db:
+                seen.append(db.get(Workflow, ctx.workflow_id).progress)
+        return {"count": 4}
+
+    async def second(ctx):
+        return {"total": ctx.outputs["first"]["count"] * 10}
+
+    engine = make_engine(factory, [WorkflowStep("first", first, weight=1), WorkflowStep("second", second, weight=1, depends_on=("first",))])
+    await engine.start()
+    try:
+        workflow_id, created = await submit(async_factory, engine)
+        wf = await wait_for(factory, workflow_id)
+    finally:
+        await engine.stop()
+
+    assert created
+    assert wf.status == "completed" and wf.progress == 100 and wf.result == {"total": 40}
+    assert seen == [12, 25, 37, 50]
+    assert wf.params["credentials"] == {"instance_url": CREDENTIALS["instance_url"], "username": "admin"}
+
+
+@pytest.mark.asyncio
+async def test_retries_then_fails_permanently(tmp_path):
+    factory, async_factory = make_factories(tmp_path)
+    calls = {"flaky": 0}
+
+    async def flaky(ctx):
+        calls["flaky"] += 1
+        if calls["flaky"] < 2:
+            raise RuntimeError("instance timed out")
+        return {"ok": True}
+
+    engine = make_engine(factory, [WorkflowStep("flaky", flaky)], max_attempts=3)
+    await engine.start()
+    try:
+        workflow_id, _ = await submit(async_factory, engine)
+        wf = await wait_for(factory, workflow_id)
+        assert wf.status == "completed" and wf.attempts == 2
+
+        engine.steps = ANALYSIS_STEPS
+        bad_id, _ = await submit(async_factory, engine, credentials={"username": "admin"})
+        wf = await wait_for(factory, bad_id)
+    finally:
+        await engine.stop()
+    # PermanentFailure is not retried.
+    assert wf.status == "failed" and wf.attempts == 1
+    assert "instance_url" in wf.error
+
+
+@pytest.mark.asyncio
+async def test_cancels_running_and_queued_workflows(tmp_path):
+    factory, async_factory = make_factories(tmp_path)
+    started = asyncio.Event()
+
+    async def slow(ctx):
+        started.set()
+        await asyncio.sleep(30)
+
+    engine = make_engine(factory, [WorkflowStep("slow", slow)], workers=1)
+    await engine.start()
+    try:
+        running_id, _ = await submit(async_factory, engine, key="a")
+        await asyncio.wait_for(started.wait(), 5)
+        queued_id, _ = await submit(async_factory, engine, key="b")
+        async with async_factory() as db:
+            assert (await engine.cancel(db, await db.get(Workflow, queued_id))).status == "cancelled"
+            await engine.cancel(db, await db.get(Workflow, running_id))
+        wf = await wait_for(factory, running_id)
+    finally:
+        await engine.stop()
+    assert wf.status == "cancelled" and wf.params["credentials"].get("password") is None
+
+
+@pytest.mark.asyncio
+async def test_cancellation_reaches_a_worker_in_another_process(tmp_path):
+    factory, async_factory = make_factories(tmp_path)
+    started = asyncio.Event()
+
+    async def slow(ctx):
+        started.set()
+        await asyncio.sleep(30)
+
+    worker = make_engine(factory, [WorkflowStep("slow", slow)], lease=0.3)
+    api = make_engine(factory, [], queue=worker.queue)
+    await worker.start()
+    try:
+        workflow_id, _ = await submit(async_factory, api)
+        await asyncio.wait_for(started.wait(), 5)
+        async with async_factory() as db:
+            await api.cancel(db, await db.get(Workflow, workflow_id))
+        wf = await wait_for(factory, workflow_id)
+    finally:
+        await worker.stop()
+    assert wf.status == "cancelled"
+
+
+@pytest.mark.asyncio
+async def test_engines_sharing_a_database_run_each_workflow_once(tmp_path):
+    factory, async_factory = make_factories(tmp_path)
+    runs = []
+
+    async def record(ctx):
+        runs.append(ctx.workflow_id)
+        await asyncio.sleep(0.01)
+        return {}
+
+    # Separate queues: each engine only hears about its own submissions and finds the rest by sweeping.
+    engines = [make_engine(factory, [WorkflowStep("record", record, cache=False)]) for _ in range(3)]
+    for engine in engines:
+        await engine.start()
+    try:
+        ids = [(await submit(async_factory, engines[i % 3]))[0] for i in range(12)]
+        for workflow_id in ids:
+            await wait_for(factory, workflow_id)
+    finally:
+        for engine in engines:
+            await engine.stop()
+    assert sorted(runs) == sorted(ids)
+
+
+@pytest.mark.asyncio
+async def test_stale_lease_is_requeued(tmp_path):
+    factory, async_factory = make_factories(tmp_path)
+
+    async def done(ctx):
+        return {"ok": True}
+
+    engine = make_engine(factory, [WorkflowStep("done", done)], lease=0.1)
+    workflow_id, _ = await submit(async_factory, engine)
+    with factory() as db:
+        # As if a worker claimed it and then died.
+        db.query(Workflow).update(
+            {Workflow.status: "running", Workflow.attempts: 1, Workflow.locked_at: datetime.utcnow()}
+        )
+        db.commit()
+    await asyncio.sleep(0.15)
+    assert await engine.run_once()
+    with factory() as db:
+        wf = db.get(Workflow, workflow_id)
+        assert wf.status == "completed" and wf.attempts == 2
+
+
+@pytest.mark.asyncio
+async def test_stale_worker_leaves_a_reclaimed_workflow_alone(tmp_path):
+    factory, async_factory = make_factories(tmp_path)
+    release = asyncio.Event()
+
+    async def slow(ctx):
+        await release.wait()
+        return {"stale": True}
+
+    engine = make_engine(factory, [WorkflowStep("slow", slow)])
+    workflow_id, _ = await submit(async_factory, engine)
+    run = asyncio.create_task(engine.run_once(workflow_id))
+    await wait_for(factory, workflow_id, ("running",))
+    with factory() as db:
+        # This worker stalled past its lease and another one claimed the workflow.
+        db.query(Workflow).update({Workflow.attempts: Workflow.attempts + 1, Workflow.locked_at: datetime.utcnow()})
+        db.commit()
+    release.set()
+    assert await run
+
+    with factory() as db:
+        wf = db.get(Workflow, workflow_id)
+        assert wf.status == "running" and wf.attempts == 2
+        assert wf.result is None and wf.finished_at is None
+        assert wf.params["credentials"]["password"] == "secret"
+        assert db.get(WorkflowResult, workflow_id) is None
+
+
+@pytest.mark.asyncio
+async def test_heartbeat_stops_a_workflow_whose_lease_was_taken(tmp_path):
+    factory, async_factory = make_factories(tmp_path)
+    cancelled = asyncio.Event()
+
+    async def forever(ctx):
+        try:
+            await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    engine = make_engine(factory, [WorkflowStep("forever", forever)], lease=0.15)
+    workflow_id, _ = await submit(async_factory, engine)
+    run = asyncio.create_task(engine.run_once(workflow_id))
+    await wait_for(factory, workflow_id, ("running",))
+    with factory() as db:
+        db.query(Workflow).update({Workflow.attempts: Workflow.attempts + 1})
+        db.commit()
+    assert await asyncio.wait_for(run, 5)
+
+    assert cancelled.is_set()
+    with factory() as db:
+        wf = db.get(Workflow, workflow_id)
+        assert wf.status == "running" and wf.attempts == 2 and wf.error is None
+
+
+def test_analyze_endpoint_is_idempotent_and_reports_status(tmp_path, monkeypatch):
+    from benchmarks.fake_servicenow import FakeSettings, create_app
+
+    factory, async_factory = make_factories(tmp_path)
+    engine = make_engine(factory, ANALYSIS_STEPS)
+    fake = create_app(
+        FakeSettings(
+            tables={"sys_script": 50, "sys_script_include": 20, "sys_properties": 5}, password="secret", latency=0
+        )
+    )
+    extractor = servicenow_extractor.ServiceNowExtractor(
+        client=httpx.AsyncClient(transport=httpx.ASGITransport(app=fake)),
+        root=str(tmp_path / "extracts"),
+        session_factory=factory,
+        lag=0,
+    )
+    monkeypatch.setattr(servicenow_extractor, "_extractor", extractor)
+    analyzer = script_analyzer.ScriptAnalyzer(session_factory=factory, processes=2)
+    monkeypatch.setattr(script_analyzer, "_analyzer", analyzer)
+
+    async def override_db():
+        async with async_factory() as db:
+            yield db
+
+    app = FastAPI()
+    app.include_router(workflows_api.router)
+    app.dependency_overrides[get_db] = override_db
+    app.dependency_overrides[get_workflow_engine] = lambda: engine
+    client = TestClient(app)
+
+    body = {"credentials": CREDENTIALS, "analysis_type": "full"}
+    first = client.post("/api/analyze", json=body, headers={"Idempotency-Key": "k1"}).json()
+    again = client.post("/api/analyze", json=body, headers={"Idempotency-Key": "k1"}).json()
+    assert first["created"] and not again["created"]
+    assert again["workflow_id"] == first["workflow_id"]
+    other = dict(body, analysis_type="quick")
+    assert client.post("/api/analyze", json=other, headers={"Idempotency-Key": "k1"}).status_code == 409
+
+    workflow_id = first["workflow_id"]
+    status = client.get(f"/api/status/{workflow_id}").json()
+    assert status["status"] == "queued" and status["progress"] == 0
+    # Polling no longer advances anything.
+    assert client.get(f"/api/status/{workflow_id}").json() == status
+    assert client.get(f"/api/results/{workflow_id}").status_code == 400
+
+    asyncio.run(engine.run_once(workflow_id))
+    assert client.get(f"/api/status/{workflow_id}").json()["status"] == "completed"
+    results = client.get(f"/api/results/{workflow_id}").json()
+    # Scored from the extracts: a Tokyo instance whose scripts query in loops.
+    assert results["health_score"] == 38
+    assert [r["rule"] for r in results["recommendations"]][:2] == ["version_age", "query_in_loop"]
+    assert results["recommendations"][0]["priority"] == "high" and results["recommendations"][0]["examples"]
+    with factory() as db:
+        assert db.get(Workflow, workflow_id).params["credentials"].get("password") is None
+        tables = db.query(WorkflowStepOutput).filter_by(step="discovery").one().output["tables"]
+    # Discovery pulled the readable tables; the rest are reported, not fatal.
+    assert tables["sys_script"]["rows"] == 50 and tables["sys_script_include"]["rows"] == 20
+    assert "error" in tables["sys_ui_policy"]
+    # 70 scripts, five distinct: each is checked once.
+    assert analyzer.analyzed == 5
+    analyzer.close()
+    assert client.get("/api/status/missing").status_code == 404
+
+
+def test_results_are_stored_once_and_served_with_etags(tmp_path, monkeypatch):
+    factory, async_factory = make_factories(tmp_path)
+    result = {
+        "health_score": 70,
+        "recommendations": [{"title": f"Fix rule {i}", "priority": "medium"} for i in range(200)],
+        "estimated_savings": "$45,000/year",
+    }
+
+    async def report(ctx):
+        return result
+
+    engine = make_engine(factory, [WorkflowStep("report", report)])
+    workflow_id, _ = asyncio.run(submit(async_factory, engine))
+    asyncio.run(engine.run_once(workflow_id))
+    with factory() as db:
+        stored = db.get(WorkflowResult, workflow_id)
+        assert len(stored.br) < len(stored.gzip) < len(stored.body) // 5
+
+    async def override_db():
+        async with async_factory() as db:
+            yield db
+
+    app = FastAPI()
+    app.include_router(workflows_api.router)
+    app.dependency_overrides[get_db] = override_db
+    client = TestClient(app)
+    url = f"/api/results/{workflow_id}"
+    expected = {"workflow_id": workflow_id, **result}
+
+    tags = set()
+    for encoding in ("br", "gzip", "identity"):
+        response = client.get(url, headers={"Accept-Encoding": encoding})
+        assert response.status_code == 200 and response.json() == expected
+        assert response.headers.get("content-encoding", "identity") == encoding
+        assert response.headers["vary"] == "Accept-Encoding"
+        tag = response.headers["etag"]
+        tags.add(tag)
+        again = client.get(url, headers={"Accept-Encoding": encoding, "If-None-Match": f'"other", {tag}'})
+        assert again.status_code == 304 and again.headers["etag"] == tag and not again.content
+    assert len(tags) == 3
+    assert client.get(url, headers={"Accept-Encoding": "identity"}).content == stored.body
+
+    projected = client.get(url, params={"fields": "health_score,estimated_savings"}, headers={"Accept-Encoding": "br"})
+    assert projected.json() == {"workflow_id": workflow_id, "health_score": 70, "estimated_savings": "$45,000/year"}
+    assert projected.headers["etag"] not in tags
+    headers = {"Accept-Encoding": "br", "If-None-Match": projected.headers["etag"]}
+    # Same fields in another order: the same representation, served without rebuilding it.
+    monkeypatch.setattr(workflows_api, "project", None)
+    assert client.get(url, params={"fields": "estimated_savings,health_score"}, headers=headers).status_code == 304
+    del headers["If-None-Match"]
+    assert client.get(url, params={"fields": "estimated_savings,health_score"}, headers=headers).json() == (
+        projected.json()
+    )
+    monkeypatch.undo()
+    assert client.get(url, params={"fields": "health_score,nope"}).status_code == 400
+
+    # Workflows that completed before results were stored get theirs on first request.
+    with factory() as db:
+        db.query(WorkflowResult).delete()
+        db.commit()
+    response = client.get(url, headers={"Accept-Encoding": "identity"})
+    assert response.json() == expected and response.headers["etag"] in tags
+    with factory() as db:
+        assert db.get(WorkflowResult, workflow_id) is not None
+
+
+class FakeRedis:
+    def __init__(self):
+        self.items = {}
+
+    async def lpush(self, key, value):
+        self.items.setdefault(key, []).insert(0, value.encode())
+
+    async def brpop(self, keys, timeout):
+        values = self.items.get(keys[0])
+        return (keys[0].encode(), values.pop()) if values else None
+
+    async def aclose(self):
+        pass
+
+
+@pytest.mark.asyncio
+async def test_queues():
+    redis_queue = RedisQueue(client=FakeRedis())
+    await redis_queue.put("a")
+    await redis_queue.put("b")
+    assert [await redis_queue.get(1), await redis_queue.get(1), await redis_queue.get(1)] == ["a", "b", None]
+
+    memory = create_workflow_queue("memory")
+    assert isinstance(memory, InProcessQueue)
+    await memory.put("x")
+    assert await memory.get(0.01) == "x" and await memory.get(0.01) is None
+    with pytest.raises(ValueError):
+        create_workflow_queue("kafka://broker")
+
+
+@pytest.mark.asyncio
+async def test_independent_steps_run_concurrently_under_caps_and_timeouts(tmp_path):
+    factory, async_factory = make_factories(tmp_path)
+    active = {"now": 0, "peak": 0}
+
+    async def root(ctx):
+        return {"n": 1}
+
+    async def fan(ctx):
+        active["now"] += 1
+        active["peak"] = max(active["peak"], active["now"])
+        await asyncio.sleep(0.05)
+        active["now"] -= 1
+        return ctx.outputs["root"]["n"] if ctx.outputs else 1
+
+    async def join(ctx):
+        return sum(ctx.outputs.values())
+
+    async def stuck(ctx):
+        await asyncio.sleep(30)
+
+    fans = [f"fan{i}" for i in range(4)]
+    steps = [
+        WorkflowStep("root", root),
+        *(WorkflowStep(name, fan, depends_on=("root",)) for name in fans),
+        WorkflowStep("join", join, depends_on=tuple(fans)),
+    ]
+    engine = make_engine(factory, steps)
+    workflow_id, _ = await submit(async_factory, engine)
+    assert await engine.run_once(workflow_id)
+    with factory() as db:
+        wf = db.get(Workflow, workflow_id)
+    assert wf.status == "completed" and wf.result == 4 and active["peak"] == 4
+
+    # A cap holds across workflows running in the same process.
+    capped = make_engine(factory, [WorkflowStep("fan", fan, max_concurrency=1, cache=False)])
+    active["peak"] = 0
+    ids = [(await submit(async_factory, capped))[0] for _ in range(3)]
+    await asyncio.gather(*(capped.run_once(i) for i in ids))
+    assert active["peak"] == 1
+
+    slow = make_engine(factory, [WorkflowStep("stuck", stuck, timeout=0.05)], max_attempts=1)
+    workflow_id, _ = await submit(async_factory, slow)
+    assert await slow.run_once(workflow_id)
+    with factory() as db:
+        wf = db.get(Workflow, workflow_id)
+    assert wf.status == "failed" and wf.error == "Step stuck timed out after 0.05s"
+
+
+@pytest.mark.asyncio
+async def test_retry_reuses_outputs_of_completed_steps(tmp_path):
+    factory, async_factory = make_factories(tmp_path)
+    calls = {"extract": 0, "flaky": 0, "side": 0}
+
+    async def extract(ctx):
+        calls["extract"] += 1
+        return {"rows": 10}
+
+    async def side(ctx):
+        calls["side"] += 1
+        await asyncio.sleep(0.05)
+        return {"ok": True}
+
+    async def flaky(ctx):
+        calls["flaky"] += 1
+        if calls["flaky"] == 1:
+            raise RuntimeError("instance timed out")
+        return {"rows": ctx.outputs["extract"]["rows"]}
+
+    async def done(ctx):
+        return ctx.outputs["flaky"]
+
+    steps = [
+        WorkflowStep("extract", extract),
+        WorkflowStep("side", side, depends_on=("extract",)),
+        WorkflowStep("flaky", flaky, depends_on=("extract",)),
+        WorkflowStep("done", done, depends_on=("flaky", "side")),
+    ]
+    engine = make_engine(factory, steps, workers=1, retry_backoff=0)
+    workflow_id, _ = await submit(async_factory, engine)
+    assert await engine.run_once(workflow_id)
+    assert await engine.run_once(workflow_id)
+    with factory() as db:
+        wf = db.get(Workflow, workflow_id)
+    assert wf.status == "completed" and wf.attempts == 2 and wf.result == {"rows": 10}
+    # The failure let the sibling finish; the retry only re-ran the step that failed.
+    assert calls == {"extract": 1, "flaky": 2, "side": 1}
+
+    # Same inputs in a new workflow: everything comes from the cache. A new instance does not.
+    await engine.run_once((await submit(async_factory, engine))[0])
+    other = dict(CREDENTIALS, instance_url="https://other.service-now.com")
+    await engine.run_once((await submit(async_factory, engine, credentials=other))[0])
+    assert calls == {"extract": 2, "flaky": 3, "side": 2}
+
+
+def test_step_graph_is_validated():
+    async def noop(ctx):
+        return None
+
+    with pytest.raises(ValueError, match="unknown"):
+        WorkflowEngine([WorkflowStep("a", noop, depends_on=("b",))], queue=InProcessQueue())
+    with pytest.raises(ValueError, match="cycle"):
+        WorkflowEngine(
+            [WorkflowStep("a", noop, depends_on=("b",)), WorkflowStep("b", noop, depends_on=("a",))],
+            queue=InProcessQueue(),
+        )
+    with pytest.raises(ValueError, match="unique"):
+        WorkflowEngine([WorkflowStep("a", noop), WorkflowStep("a", noop)], queue=InProcessQueue())
@@ -22,33 +22,48 @@ export default function Dashboard() {
       });
       
       setAnalysisId(response.data.workflow_id);
-      checkStatus(response.data.workflow_id);
+      followStatus(response.data.workflow_id);
     } catch (error) {
       console.error('Failed to start analysis:', error);
       setLoading(false);
     }
   };
 
-  const checkStatus = async (workflowId) => {
-    try {
-      const response = await axios.get(`${API_URL}/api/status/${workflowId}`);
-      setStatus(response.data);
-      
-      if (response.data.status === 'completed') {
-        getResults(workflowId);
-        setLoading(false);
-      } else {
-        setTimeout(() => checkStatus(workflowId), 2000);
-      }
-    } catch (error) {
-      console.error('Failed to check status:', error);
+  const followStatus = (workflowId) => {
+    // The browser reconnects on its own and resumes from the last event id.
+    const source = new EventSource(`${API_URL}/api/workflows/${workflowId}/events`);
+    const update = (event) => {
+      const data = JSON.parse(event.data);
+      setStatus((current) => ({ ...current, ...data }));
+    };
+
+    source.addEventListener('state', update);
+    source.addEventListener('started', () => setStatus((current) => ({ ...current, status: 'running' })));
+    source.addEventListener('progress', (event) => {
+      const data = JSON.parse(event.data);
+      setStatus((current) => ({ ...current, progress: data.progress, current_step: data.step }));
+    });
+    source.addEventListener('completed', () => {
+      source.close();
+      setStatus((current) => ({ ...current, status: 'completed', progress: 100 }));
+      getResults(workflowId);
       setLoading(false);
-    }
+    });
+    ['failed', 'cancelled'].forEach((name) => {
+      source.addEventListener(name, (event) => {
+        source.close();
+        setStatus((current) => ({ ...current, status: name, ...JSON.parse(event.data) }));
+        setLoading(false);
+      });
+    });
   };
 
   const getResults = async (workflowId) => {
     try {
-      const response = await axios.get(`${API_URL}/api/results/${workflowId}`);
+      // Only what the dashboard shows; the browser revalidates it with the ETag.
+      const response = await axios.get(`${API_URL}/api/results/${workflowId}`, {
+        params: { fields: 'health_score,recommendations,estimated_savings' },
+      });
       setResults(response.data);
     } catch (error) {
       console.error('Failed to get results:', error);